@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Exam, Question, QuestionOption, Submission, StudentAnswer
+
+from helpers.admin import BoundedInlineFormSet, PerformanceModeAdmin
+from .models import ArchivedSubmission, Exam, GradingRun, Question, QuestionOption, Submission, StudentAnswer, TokenUsage
 
 
 class QuestionOptionInline(admin.TabularInline):
@@ -15,10 +17,14 @@ class QuestionInline(admin.TabularInline):
 
 class StudentAnswerInline(admin.TabularInline):
     model = StudentAnswer
+    formset = BoundedInlineFormSet
     extra = 0
-    readonly_fields = ('question', 'selected_option', 'short_answer_text', 'score')
+    readonly_fields = ('question', 'selected_option', 'short_answer_text', 'score', 'graded_by')
     can_delete = False
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('question', 'selected_option')
+
 
 @admin.register(Exam)
 class ExamAdmin(admin.ModelAdmin):
@@ -32,15 +38,20 @@ class ExamAdmin(admin.ModelAdmin):
 class QuestionAdmin(admin.ModelAdmin):
     list_display = ('text', 'exam', 'question_type')
     list_filter = ('exam', 'question_type', 'is_deleted')
+    list_select_related = ('exam',)
     search_fields = ('text',)
+    autocomplete_fields = ('exam',)
     inlines = [QuestionOptionInline]
 
 
 @admin.register(Submission)
-class SubmissionAdmin(admin.ModelAdmin):
+class SubmissionAdmin(PerformanceModeAdmin):
     list_display = ('student', 'exam', 'grade', 'is_completed', 'completed_at')
     list_filter = ('exam', 'completed_at', 'is_completed')
+    list_select_related = ('student', 'exam')
     search_fields = ('student__username', 'exam__title')
+    performance_search_fields = ('^student__username',)
+    autocomplete_fields = ('student', 'exam')
     readonly_fields = ('completed_at',)
     inlines = [StudentAnswerInline]
 
@@ -49,9 +60,52 @@ class SubmissionAdmin(admin.ModelAdmin):
 class QuestionOptionAdmin(admin.ModelAdmin):
     list_display = ('text', 'question', 'is_correct')
     list_filter = ('is_correct', 'question__exam')
+    autocomplete_fields = ('question',)
 
 
 @admin.register(StudentAnswer)
-class StudentAnswerAdmin(admin.ModelAdmin):
+class StudentAnswerAdmin(PerformanceModeAdmin):
     list_display = ('submission', 'question', 'score')
-    readonly_fields = ('submission', 'question', 'selected_option', 'short_answer_text', 'score')
\ No newline at end of file
+    list_select_related = ('submission__student', 'submission__exam', 'question')
+    readonly_fields = ('submission', 'question', 'selected_option', 'short_answer_text', 'score', 'graded_by')
+    raw_id_fields = ('submission', 'question', 'selected_option')
+
+    def get_queryset(self, request):
+        # The change form renders the read-only related fields through their __str__
+        return super().get_queryset(request).select_related(
+            'submission__student', 'submission__exam', 'question', 'selected_option'
+        )
+
+
+@admin.register(GradingRun)
+class GradingRunAdmin(PerformanceModeAdmin):
+    list_display = ('submission_id', 'exam', 'engine', 'attempt', 'succeeded', 'completed_at')
+    list_filter = ('engine', 'succeeded')
+    list_select_related = ('exam',)
+    raw_id_fields = ('submission', 'exam')
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedSubmission)
+class ArchivedSubmissionAdmin(PerformanceModeAdmin):
+    list_display = ('id', 'student', 'exam', 'grade', 'is_deleted', 'completed_at', 'archived_at')
+    list_filter = ('is_deleted',)
+    list_select_related = ('student', 'exam')
+    raw_id_fields = ('student', 'exam')
+    search_fields = ('student__username',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TokenUsage)
+class TokenUsageAdmin(admin.ModelAdmin):
+    list_display = ('exam', 'question', 'provider', 'answers', 'prompt_tokens', 'cached_tokens', 'completion_tokens')
+    list_filter = ('provider',)
+    list_select_related = ('exam', 'question')
+    raw_id_fields = ('exam', 'question')
+
+    def has_change_permission(self, request, obj=None):
+        return False
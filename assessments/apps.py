@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class AssessmentsConfig(AppConfig):
     name = 'assessments'
+
+    def ready(self):
+        # Connects the signals that evict cached API tokens and exam answer keys
+        import assessments.ingest  # noqa: F401
+        import helpers.authentication  # noqa: F401
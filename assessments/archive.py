@@ -0,0 +1,108 @@
+"""
+Hot/cold archival of submissions. Completed submissions older than SUBMISSION_ARCHIVE_AFTER_DAYS
+and soft-deleted submissions move, with all their answers, into one ArchivedSubmission row each
+and are deleted from the live tables. Their GradingRun rows stay, with submission set to NULL.
+
+Soft-deleted answers are only archived with their submission (flagged is_deleted in the JSON);
+until the submission itself qualifies they stay in the live answers table, outside its partial
+indexes. Open submissions qualify once the expiry sweep completes them.
+
+Candidates are read through the partial indexes on completed and on soft-deleted submissions, and
+each batch is copied and deleted in one transaction, so an interrupted run loses nothing and the
+next run continues where it stopped.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from assessments.models import ArchivedSubmission, Question, QuestionOption, StudentAnswer, Submission
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SubmissionArchiver:
+    def __init__(self, retention: timedelta = None, batch_size: int = None):
+        self.retention = retention if retention is not None else timedelta(
+            days=getattr(settings, 'SUBMISSION_ARCHIVE_AFTER_DAYS', 180)
+        )
+        self.batch_size = batch_size or getattr(settings, 'SUBMISSION_ARCHIVE_BATCH_SIZE', 500)
+
+    def candidates(self, now):
+        """The two indexed candidate queries: old completed submissions, then soft-deleted ones."""
+        yield 'completed', Submission.objects.filter(
+            is_completed=True, completed_at__lt=now - self.retention
+        ).order_by('completed_at')
+        yield 'deleted', Submission.deleted_objects.order_by('deleted_at')
+
+    def run(self, now=None) -> dict:
+        """Archive every candidate, returning the number archived per reason."""
+        now = now or timezone.now()
+        report = {}
+        for reason, queryset in self.candidates(now):
+            report[reason] = 0
+            while True:
+                batch = list(queryset.values_list('pk', flat=True)[:self.batch_size])
+                if batch:
+                    report[reason] += self.archive(batch)
+                if len(batch) < self.batch_size:
+                    break
+            metrics.SUBMISSIONS_ARCHIVED_TOTAL.inc(report[reason], reason=reason)
+
+        if any(report.values()):
+            logger.info(f"Archived submissions: {report}")
+        return report
+
+    def archive(self, submission_ids: list) -> int:
+        with transaction.atomic():
+            submissions = list(Submission.all_objects.select_for_update().filter(pk__in=submission_ids))
+            answers = defaultdict(list)
+            for answer in StudentAnswer.all_objects.filter(submission_id__in=submission_ids).order_by('id'):
+                answers[answer.submission_id].append({
+                    'question': answer.question_id,
+                    'selected_option': answer.selected_option_id,
+                    'short_answer_text': answer.short_answer_text,
+                    'score': answer.score,
+                    'graded_by': answer.graded_by,
+                    'is_deleted': answer.is_deleted,
+                })
+
+            ArchivedSubmission.objects.bulk_create([
+                ArchivedSubmission(
+                    id=submission.id,
+                    student_id=submission.student_id,
+                    exam_id=submission.exam_id,
+                    grade=submission.grade,
+                    total_score=submission.total_score,
+                    is_completed=submission.is_completed,
+                    started_at=submission.started_at,
+                    completed_at=submission.completed_at,
+                    submitted_at=submission.created_at,
+                    updated_at=submission.updated_at,
+                    is_deleted=submission.is_deleted,
+                    deleted_at=submission.deleted_at,
+                    answers=answers[submission.id],
+                )
+                for submission in submissions
+            ])
+            # Answers go with their submission through the cascade; grading runs are kept
+            Submission.all_objects.filter(pk__in=[submission.id for submission in submissions]).delete()
+        return len(submissions)
+
+
+def answer_texts(archived: list) -> dict:
+    """Serializer context for ArchivedSubmissionSerializer: question and option texts of the archived answers."""
+    question_ids, option_ids = set(), set()
+    for submission in archived:
+        for answer in submission.answers:
+            question_ids.add(answer['question'])
+            if answer['selected_option'] is not None:
+                option_ids.add(answer['selected_option'])
+    return {
+        'question_texts': dict(Question.all_objects.filter(pk__in=question_ids).values_list('id', 'text')),
+        'option_texts': dict(QuestionOption.all_objects.filter(pk__in=option_ids).values_list('id', 'text')),
+    }
@@ -0,0 +1,284 @@
+"""
+Autoscaling signal for grading workers.
+
+The signal combines the broker queue depth, the age of the oldest queued task, the EWMA of the LLM
+and other seconds of recent grading runs, and the headroom left under LLM_RATE_LIMIT_RPM into a
+recommended number of worker processes:
+
+    backlog = ceil(depth * task seconds / max(AUTOSCALE_TARGET_WAIT_SECONDS - oldest age, task seconds))
+    workers = min(busy + backlog, current * LLM_RATE_LIMIT_RPM / LLM calls in the last minute)
+
+so the queue drains before its oldest task has waited the target, faster the longer it has already
+waited, without asking the provider for more calls than the rate limit allows.
+
+GradingAutoscaler applies it inside the worker (`celery -A main worker --autoscale=64,2`), and
+`manage.py autoscale_signal` prints it for external autoscalers. Queues are read through a probe:
+RedisQueueProbe for the Redis broker, SimulatedQueue in tests and simulations.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from celery.worker import state
+from celery.worker.autoscale import Autoscaler
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, close_old_connections
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+_LLM_CALLS_KEY = 'autoscale:llm-calls:{}'
+
+
+class QueueProbeError(Exception):
+    """The broker could not be read."""
+
+
+class QueueProbe(ABC):
+    @abstractmethod
+    def depth(self) -> int:
+        """Tasks waiting in the broker, not yet reserved by a worker."""
+
+    @abstractmethod
+    def oldest_age(self, now: float) -> float:
+        """Seconds the oldest waiting task has been queued, 0 when the queue is empty."""
+
+
+class SimulatedQueue(QueueProbe):
+    """In-process stand-in for the broker queue: tasks are enqueue timestamps, oldest first."""
+
+    def __init__(self):
+        self._enqueued = []
+        self._lock = threading.Lock()
+
+    def push(self, count: int = 1, at: float = None):
+        at = time.time() if at is None else at
+        with self._lock:
+            self._enqueued.extend([at] * count)
+            self._enqueued.sort()
+
+    def pop(self, count: int = 1) -> int:
+        with self._lock:
+            popped = self._enqueued[:count]
+            del self._enqueued[:count]
+        return len(popped)
+
+    def depth(self) -> int:
+        return len(self._enqueued)
+
+    def oldest_age(self, now: float) -> float:
+        with self._lock:
+            return max(now - self._enqueued[0], 0.0) if self._enqueued else 0.0
+
+
+class RedisQueueProbe(QueueProbe):
+    """
+    Reads the Celery queues of a Redis broker. Kombu pushes on the left and workers pop on the right,
+    so the oldest message is the last one; its age comes from the `enqueued_at` header that
+    main.celery stamps on every published task.
+    """
+
+    def __init__(self, url: str, queues: list):
+        self.url = url
+        self.queues = queues
+        self._client = None
+
+    @property
+    def client(self):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url, socket_connect_timeout=1)
+        return self._client
+
+    def _execute(self, command: str, *args) -> list:
+        import redis
+
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for queue in self.queues:
+                getattr(pipeline, command)(queue, *args)
+            return pipeline.execute()
+        except redis.RedisError as e:
+            raise QueueProbeError(f"Could not read the broker queues {self.queues}: {e}") from e
+
+    def depth(self) -> int:
+        return sum(self._execute('llen'))
+
+    def oldest_age(self, now: float) -> float:
+        ages = []
+        for message in self._execute('lindex', -1):
+            if message is None:
+                continue
+            try:
+                enqueued_at = json.loads(message)['headers']['enqueued_at']
+            except (ValueError, LookupError, TypeError):
+                continue
+            ages.append(max(now - float(enqueued_at), 0.0))
+        return max(ages, default=0.0)
+
+
+def get_queue_probe() -> QueueProbe:
+    url = settings.CELERY_BROKER_URL
+    if not url.startswith(('redis://', 'rediss://', 'unix://')):
+        raise ImproperlyConfigured(f"The autoscaling signal reads Redis brokers only, not {url.split(':')[0]!r}.")
+    return RedisQueueProbe(url, getattr(settings, 'AUTOSCALE_QUEUES', ['celery']))
+
+
+def record_llm_calls(count: int):
+    """
+    Count LLM calls towards the per-minute rate that LLM_RATE_LIMIT_RPM limits. Graders count their
+    own calls, and each task adds them here once, so the cache is not hit per call.
+    """
+    if not count or not getattr(settings, 'LLM_RATE_LIMIT_RPM', 0):
+        return
+    key = _LLM_CALLS_KEY.format(int(time.time() // 60))
+    if cache.add(key, count, timeout=180):
+        return
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        # Expired between add and incr
+        cache.add(key, count, timeout=180)
+
+
+def llm_calls_per_minute(now: float) -> float:
+    """Calls over the last 60 seconds, from the current and the previous minute's counters."""
+    minute, elapsed = divmod(now, 60)
+    counts = cache.get_many([_LLM_CALLS_KEY.format(int(minute)), _LLM_CALLS_KEY.format(int(minute) - 1)])
+    current = counts.get(_LLM_CALLS_KEY.format(int(minute)), 0)
+    previous = counts.get(_LLM_CALLS_KEY.format(int(minute) - 1), 0)
+    return current + previous * (1 - elapsed / 60)
+
+
+def recommend_workers(
+    depth: int, oldest_age: float, task_seconds: float, busy: int = 0, current: int = 0,
+    llm_calls: float = 0.0, rate_limit_rpm: int = 0, target_wait: float = None,
+) -> int:
+    """Worker processes for busy in-flight tasks plus the queued backlog, capped by the rate limit headroom."""
+    target_wait = target_wait or getattr(settings, 'AUTOSCALE_TARGET_WAIT_SECONDS', 30.0)
+    backlog = 0
+    if depth:
+        window = max(target_wait - oldest_age, task_seconds)
+        backlog = math.ceil(depth * task_seconds / window)
+
+    workers = busy + backlog
+    if rate_limit_rpm and llm_calls and current:
+        workers = min(workers, max(math.floor(current * rate_limit_rpm / llm_calls), 1))
+    return workers
+
+
+class GradingScalingSignal:
+    """
+    Reads the queue through probe and folds every GradingRun finished since the last read into the
+    EWMAs of LLM seconds and other seconds per task.
+    """
+
+    def __init__(self, probe: QueueProbe = None, clock=time.time):
+        self.probe = probe or get_queue_probe()
+        self.clock = clock
+        self.alpha = getattr(settings, 'AUTOSCALE_EWMA_ALPHA', 0.2)
+        self.llm_seconds = None
+        self.other_seconds = None
+        self._cursor = None
+
+    def observe_runs(self):
+        # Imported here: the worker loads its autoscaler before Django's apps are ready
+        from assessments.models import GradingRun
+
+        runs = GradingRun.objects.filter(succeeded=True)
+        if self._cursor is not None:
+            runs = runs.filter(completed_at__gt=self._cursor)
+        runs = list(
+            runs.order_by('-completed_at').values_list('completed_at', 'started_at', 'llm_seconds')[:500]
+        )
+        for completed_at, started_at, llm_seconds in reversed(runs):
+            other = max((completed_at - started_at).total_seconds() - llm_seconds, 0.0)
+            self.llm_seconds = self._ewma(self.llm_seconds, llm_seconds)
+            self.other_seconds = self._ewma(self.other_seconds, other)
+        if runs:
+            self._cursor = runs[0][0]
+
+    def _ewma(self, average, sample: float) -> float:
+        return sample if average is None else self.alpha * sample + (1 - self.alpha) * average
+
+    @property
+    def task_seconds(self) -> float:
+        if self.llm_seconds is None:
+            return getattr(settings, 'AUTOSCALE_DEFAULT_TASK_SECONDS', 5.0)
+        return max(self.llm_seconds + self.other_seconds, 0.01)
+
+    def read(self, busy: int = 0, current: int = 0) -> dict:
+        """The signal for busy in-flight tasks on current worker processes."""
+        now = self.clock()
+        self.observe_runs()
+        depth = self.probe.depth()
+        oldest_age = self.probe.oldest_age(now)
+        rate_limit_rpm = getattr(settings, 'LLM_RATE_LIMIT_RPM', 0)
+        llm_calls = llm_calls_per_minute(now) if rate_limit_rpm else 0.0
+
+        signal = {
+            'queue_depth': depth,
+            'oldest_task_age_seconds': round(oldest_age, 3),
+            'llm_latency_ewma_seconds': round(self.llm_seconds, 3) if self.llm_seconds is not None else None,
+            'task_seconds': round(self.task_seconds, 3),
+            'llm_calls_per_minute': round(llm_calls, 1),
+            'rate_limit_headroom': round(max(1 - llm_calls / rate_limit_rpm, 0.0), 3) if rate_limit_rpm else None,
+            'busy': busy,
+            'current': current,
+            'workers': recommend_workers(
+                depth, oldest_age, self.task_seconds, busy=busy, current=current,
+                llm_calls=llm_calls, rate_limit_rpm=rate_limit_rpm,
+            ),
+        }
+        metrics.GRADING_QUEUE_DEPTH.set(depth)
+        metrics.GRADING_QUEUE_OLDEST_AGE_SECONDS.set(oldest_age)
+        metrics.GRADING_RECOMMENDED_WORKERS.set(signal['workers'])
+        return signal
+
+
+class GradingAutoscaler(Autoscaler):
+    """
+    Celery autoscaler (CELERY_WORKER_AUTOSCALER) that sizes the pool from GradingScalingSignal
+    instead of the tasks already reserved. With AUTOSCALE_WORKER_NODES workers sharing the queue,
+    each takes its share of the backlog. The signal is re-read every AUTOSCALE_INTERVAL_SECONDS, and
+    a failed read falls back to the reserved tasks like the default autoscaler.
+    """
+
+    def __init__(self, *args, signal: GradingScalingSignal = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._signal = signal
+        self._target = None
+        self._read_at = None
+
+    @property
+    def signal(self) -> GradingScalingSignal:
+        if self._signal is None:
+            self._signal = GradingScalingSignal()
+        return self._signal
+
+    @property
+    def qty(self):
+        reserved = len(state.reserved_requests)
+        now = time.monotonic()
+        if self._read_at is None or now - self._read_at >= getattr(settings, 'AUTOSCALE_INTERVAL_SECONDS', 5.0):
+            self._read_at = now
+            nodes = max(getattr(settings, 'AUTOSCALE_WORKER_NODES', 1), 1)
+            # The autoscaler thread is outside any task, so nothing else recycles its connection
+            close_old_connections()
+            try:
+                signal = self.signal.read(busy=reserved * nodes, current=self.processes * nodes)
+            except (QueueProbeError, DatabaseError) as e:
+                logger.warning(f"Could not read the autoscaling signal: {e}")
+                self._target = None
+            else:
+                self._target = math.ceil(signal['workers'] / nodes)
+            finally:
+                close_old_connections()
+        return reserved if self._target is None else max(self._target, reserved)
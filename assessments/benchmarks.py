@@ -0,0 +1,335 @@
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from assessments.models import Exam, Question, QuestionOption, Submission, StudentAnswer
+from assessments.serializers import (
+    ExamDetailSerializer, ExamSerializer, SubmissionDetailSerializer, SubmissionSerializer
+)
+from assessments.services import GradingService, MockGrader
+from helpers import compression, renderers
+from main.celery import app as celery_app
+
+WORDS = (
+    "python list tuple mutable immutable memory object reference function value "
+    "variable loop index key dictionary set order hash string integer float class"
+).split()
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_text(rng: random.Random, length: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def bench_user(prefix: str) -> User:
+    """A student with a name no existing user has, since benchmarks may run against a real database."""
+    return User.objects.create_user(username=f"{prefix}_{uuid.uuid4().hex[:12]}")
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def build_exam(size: int, rng: random.Random, mcq_ratio: float = 0.5) -> Exam:
+    exam = Exam.objects.create(
+        title=f"Benchmark Exam ({size} questions)", duration=timedelta(hours=1), course="BENCH"
+    )
+    mcq_count = int(size * mcq_ratio)
+    for index in range(size):
+        if index < mcq_count:
+            question = Question.objects.create(
+                exam=exam, question_type='MCQ', text=f"MCQ {index}", expected_answer="A"
+            )
+            QuestionOption.objects.bulk_create([
+                QuestionOption(question=question, text=text, is_correct=(text == "A"))
+                for text in ("A", "B", "C", "D")
+            ])
+        else:
+            Question.objects.create(
+                exam=exam, question_type='SHORT', text=f"SHORT {index}",
+                expected_answer=make_text(rng, 20)
+            )
+    return exam
+
+
+def build_answers(exam: Exam, rng: random.Random) -> list:
+    answers = []
+    for question in exam.questions.prefetch_related('options'):
+        if question.question_type == 'MCQ':
+            option = rng.choice(list(question.options.all()))
+            answers.append({"question": question.id, "selected_option": option.id})
+        else:
+            answers.append({"question": question.id, "short_answer_text": make_text(rng, 20)})
+    return answers
+
+
+def run_in_rollback(func, *args, **kwargs):
+    """Run a benchmark against the database and discard every row it created."""
+    result = None
+    try:
+        with transaction.atomic():
+            result = func(*args, **kwargs)
+            raise Rollback
+    except Rollback:
+        pass
+    return result
+
+
+def bench_grader(answer_lengths, batch_sizes, repeat: int = 3, seed: int = 0) -> list:
+    """MockGrader throughput by answer length (words) and batch size (answers per run)."""
+    rng = random.Random(seed)
+    grader = MockGrader()
+    results = []
+    for length in answer_lengths:
+        for batch_size in batch_sizes:
+            pairs = [(make_text(rng, length), make_text(rng, length)) for _ in range(batch_size)]
+            runs = []
+            for _ in range(repeat):
+                seconds, _ = timed(lambda pairs=pairs: [grader.grade(expected, actual) for expected, actual in pairs])
+                runs.append(seconds)
+            best = min(runs)
+            results.append({
+                "answer_length": length,
+                "batch_size": batch_size,
+                "seconds": best,
+                "answers_per_second": batch_size / best if best else None,
+            })
+    return results
+
+
+def _bench_pipeline(exam_sizes, seed: int) -> list:
+    rng = random.Random(seed)
+    student = bench_user("bench_pipeline")
+    results = []
+    for size in exam_sizes:
+        exam = build_exam(size, rng)
+        submission = Submission.objects.create(student=student, exam=exam, started_at=timezone.now())
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(
+                submission=submission,
+                question_id=answer["question"],
+                selected_option_id=answer.get("selected_option"),
+                short_answer_text=answer.get("short_answer_text"),
+            )
+            for answer in build_answers(exam, rng)
+        ])
+        submission = Submission.objects.get(id=submission.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            seconds, _ = timed(GradingService.grade_submission, submission)
+
+        results.append({
+            "exam_size": size,
+            "seconds": seconds,
+            "queries": len(queries),
+            "queries_per_question": len(queries) / size if size else None,
+        })
+    return results
+
+
+def bench_pipeline(exam_sizes, seed: int = 0) -> list:
+    """GradingService.grade_submission latency and query count by exam size."""
+    with override_settings(GRADING_ENGINE='MOCK'):
+        return run_in_rollback(_bench_pipeline, exam_sizes, seed)
+
+
+def _bench_api(exam_sizes, repeat: int, seed: int) -> list:
+    rng = random.Random(seed)
+    results = []
+    for size in exam_sizes:
+        exam = build_exam(size, rng)
+        retrieve_runs = []
+        create_runs = []
+        for run in range(repeat):
+            client = APIClient()
+            client.force_authenticate(bench_user(f"bench_api_{size}_{run}"))
+
+            seconds, response = timed(client.get, f'/api/exams/{exam.id}/')
+            assert response.status_code == 200, response.content
+            retrieve_runs.append(seconds)
+
+            payload = {"exam": exam.id, "answers": build_answers(exam, rng), "started_at": timezone.now()}
+            seconds, response = timed(client.post, '/api/submissions/', payload, format='json')
+            assert response.status_code == 201, response.content
+            create_runs.append(seconds)
+
+        results.append({
+            "exam_size": size,
+            "exam_retrieve_seconds": _summarize(retrieve_runs),
+            "submission_create_seconds": _summarize(create_runs),
+        })
+    return results
+
+
+def bench_api(exam_sizes, llm_latency: float = 0.0, repeat: int = 3, seed: int = 0) -> list:
+    """
+    ExamViewSet.retrieve and SubmissionViewSet.create request latency.
+    Grading runs eagerly against the STUB LLM backend, so llm_latency is paid once per short answer.
+    """
+    # Celery caches its configuration on first use, so set eager mode on the app directly
+    always_eager = celery_app.conf.task_always_eager
+    celery_app.conf.task_always_eager = True
+    try:
+        with override_settings(GRADING_ENGINE='LLM', LLM_PROVIDER='STUB', LLM_STUB_LATENCY=llm_latency):
+            return run_in_rollback(_bench_api, exam_sizes, repeat, seed)
+    finally:
+        celery_app.conf.task_always_eager = always_eager
+
+
+def render(renderer, serializer_class, instance) -> bytes:
+    return renderer.render(serializer_class(instance).data)
+
+
+def _bench_serialization(exam_sizes, repeat: int, seed: int) -> list:
+    rng = random.Random(seed)
+    student = bench_user("bench_serialization")
+    baseline_renderer, fast_renderer = JSONRenderer(), renderers.FastJSONRenderer()
+    results = []
+    for size in exam_sizes:
+        exam = build_exam(size, rng)
+        submission = Submission.objects.create(student=student, exam=exam, started_at=timezone.now())
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(
+                submission=submission,
+                question_id=answer["question"],
+                selected_option_id=answer.get("selected_option"),
+                short_answer_text=answer.get("short_answer_text"),
+            )
+            for answer in build_answers(exam, rng)
+        ])
+        shapes = {
+            'exam': (
+                Exam.objects.prefetch_related('questions__options').get(id=exam.id),
+                ExamSerializer, ExamDetailSerializer,
+            ),
+            'submission': (
+                Submission.objects.select_related('exam', 'student').prefetch_related(
+                    'answers', 'answers__question', 'answers__selected_option'
+                ).get(id=submission.id),
+                SubmissionSerializer, SubmissionDetailSerializer,
+            ),
+        }
+
+        for shape, (instance, baseline, fast) in shapes.items():
+            baseline_runs, fast_runs = [], []
+            for _ in range(repeat):
+                seconds, _ = timed(render, baseline_renderer, baseline, instance)
+                baseline_runs.append(seconds)
+                seconds, body = timed(render, fast_renderer, fast, instance)
+                fast_runs.append(seconds)
+
+            baseline_seconds, fast_seconds = _summarize(baseline_runs), _summarize(fast_runs)
+            results.append({
+                "shape": shape,
+                "exam_size": size,
+                "baseline_seconds": baseline_seconds,
+                "fast_seconds": fast_seconds,
+                "speedup": baseline_seconds["median"] / fast_seconds["median"] if fast_seconds["median"] else None,
+                "bytes": len(body),
+                "gzip_bytes": len(compression.compress(body, 'gzip')),
+                "brotli_bytes": len(compression.compress(body, 'br')) if compression.brotli else None,
+            })
+    return results
+
+
+def bench_serialization(exam_sizes, repeat: int = 3, seed: int = 0) -> list:
+    """
+    Serialize and render the exam and submission detail shapes with the DRF serializers and JSON
+    renderer (baseline) against the hand-written serializers and FastJSONRenderer, plus compressed sizes.
+    """
+    return run_in_rollback(_bench_serialization, exam_sizes, repeat, seed)
+
+
+HEAVY_MODULES = ('sklearn', 'openai', 'google.genai')
+
+STARTUP_SCENARIOS = {
+    # A management command: settings, apps and the command registry
+    'manage_py_check': ['manage.py', 'check'],
+    # Celery worker boot: Django setup plus autodiscovery of every tasks module
+    'worker_boot': [
+        '-c',
+        'import django; django.setup(); '
+        'from main.celery import app; app.loader.import_default_modules()',
+    ],
+    # What every process used to pay up front before engines and backends were loaded lazily
+    'provider_sdks': [
+        '-c',
+        'import sklearn.feature_extraction.text, sklearn.metrics.pairwise, openai; from google import genai',
+    ],
+}
+
+
+def _import_times(stderr: str) -> dict:
+    """Cumulative seconds per module from `python -X importtime` output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1_000_000
+    return times
+
+
+def bench_startup(repeat: int = 3) -> list:
+    """Cold-start wall time of fresh interpreters and which heavy grading dependencies they import."""
+    results = []
+    for name, args in STARTUP_SCENARIOS.items():
+        runs = []
+        heavy = {}
+        for _ in range(repeat):
+            seconds, process = timed(
+                subprocess.run,
+                [sys.executable, '-X', 'importtime', *args],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            )
+            runs.append(seconds)
+            imported = _import_times(process.stderr)
+            heavy = {module: imported[module] for module in HEAVY_MODULES if module in imported}
+
+        results.append({
+            "scenario": name,
+            "seconds": _summarize(runs),
+            "heavy_modules": heavy,
+        })
+    return results
+
+
+def _summarize(runs: list) -> dict:
+    ordered = sorted(runs)
+    return {
+        "min": ordered[0],
+        "median": ordered[len(ordered) // 2],
+        "max": ordered[-1],
+        "runs": len(ordered),
+    }
+
+
+def environment() -> dict:
+    return {
+        "timestamp": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "machine": platform.machine(),
+        "orjson": renderers.orjson is not None,
+        "brotli": compression.brotli is not None,
+    }
@@ -0,0 +1,181 @@
+"""
+Write-behind submissions for deadline spikes (SUBMISSION_BUFFER_ENABLED).
+
+POST /api/submissions/ validates the submission against the exam's cached answer key, appends it
+to the 'submissions' stream and answers 202 with a receipt, without writing to the database.
+Consumers (`manage.py consume_submission_buffer`) read batches, write them with
+BulkSubmissionWriter, enqueue grading per batch and record the outcome on the receipt, which
+students read from GET /api/submissions/receipts/<receipt>/.
+"""
+import logging
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from assessments.events import forget_graded
+from assessments.ingest import AnswerKey, BulkSubmissionWriter, IngestRow, enqueue_grading, parse_pk
+from assessments.models import ArchivedSubmission, Exam, Submission
+from helpers import metrics
+from helpers.streams import get_stream
+
+logger = logging.getLogger(__name__)
+
+STREAM_NAME = 'submissions'
+QUEUED, SAVED, REJECTED = 'queued', 'saved', 'rejected'
+
+_STARTED_AT = serializers.DateTimeField()
+
+
+def receipt_ttl() -> int:
+    return getattr(settings, 'SUBMISSION_BUFFER_RECEIPT_TTL', 86400)
+
+
+class SubmissionBuffer:
+    def __init__(self, stream=None):
+        self.stream = stream or get_stream(STREAM_NAME)
+
+    def clean(self, user, data) -> dict:
+        """
+        The stream entry for one POSTed submission, checked like SubmissionSerializer but with the
+        cached answer key. Raises ValidationError with the serializer's messages.
+        """
+        exam_id = data.get('exam') if hasattr(data, 'get') else None
+        exam = None
+        if parse_pk(exam_id) is not None:
+            exam_id = parse_pk(exam_id)
+            exam = Exam.objects.only('id', 'duration', 'updated_at').filter(pk=exam_id).first()
+        if exam is None:
+            raise ValidationError({'exam': [f'Invalid pk "{exam_id}" - object does not exist.']})
+
+        existing = Submission.objects.filter(student=user, exam=exam).values_list(
+            'started_at', 'is_completed', 'pk'
+        ).first()
+        # Archived submissions were completed
+        archived = existing is None and ArchivedSubmission.objects.filter(
+            student=user, exam=exam, is_deleted=False
+        ).exists()
+        if archived or existing is not None and existing[1]:
+            raise ValidationError({
+                "non_field_errors": "You have already completed this exam and cannot submit again."
+            })
+
+        if existing is not None:
+            started_at = existing[0]
+        else:
+            try:
+                started_at = _STARTED_AT.run_validation(data.get('started_at'))
+            except ValidationError as e:
+                raise ValidationError({'started_at': e.detail})
+
+        if started_at + exam.duration < timezone.now():
+            raise ValidationError({"non_field_errors": "The time for this exam has expired."})
+
+        answers = data.get('answers') or []
+        if not isinstance(answers, list):
+            raise ValidationError({'answers': ['Expected a list of items.']})
+        answer_key = AnswerKey.for_exam(exam)
+        cleaned, errors = [], []
+        for index, answer in enumerate(answers):
+            try:
+                cleaned.append(answer_key.clean_answer(answer))
+            except ValueError as e:
+                errors.append(f"answers[{index}]: {e}")
+        if errors:
+            raise ValidationError({'answers': errors})
+
+        return {
+            'exam': exam.pk,
+            'student': user.pk,
+            'username': user.get_username(),
+            'started_at': started_at.isoformat(),
+            'submission': existing[2] if existing is not None else None,
+            'answers': cleaned,
+        }
+
+    def submit(self, user, data) -> dict:
+        """Validate and buffer one submission, returning its receipt. Raises StreamError if the stream is down."""
+        entry = self.clean(user, data)
+        receipt = {
+            'receipt': uuid.uuid4().hex, 'status': QUEUED, 'exam': entry['exam'], 'student': entry['student'],
+            'submission': None, 'errors': [],
+        }
+        # The receipt exists before the entry, so a fast consumer always has one to update
+        self.stream.set_receipts({receipt['receipt']: receipt}, receipt_ttl())
+        # received_at becomes the grading jobs' enqueue time, so their latency includes the buffering
+        self.stream.append({**entry, 'receipt': receipt['receipt'], 'received_at': time.time()})
+        if entry['submission'] is not None:
+            # Waiters on the submission must not be handed its grade from before these answers
+            forget_graded([entry['submission']])
+        metrics.SUBMISSION_BUFFER_ENTRIES_TOTAL.inc(status=QUEUED)
+        return receipt
+
+    def receipt(self, receipt: str):
+        return self.stream.get_receipt(receipt)
+
+    def flush(self, consumer: str, count: int = None, block: float = 0) -> dict:
+        """
+        Write one batch of buffered submissions and enqueue their grading. Entries of an exam
+        whose write fails stay unacknowledged and are retried by a later read.
+        """
+        count = count or getattr(settings, 'SUBMISSION_BUFFER_BATCH_SIZE', 500)
+        entries = self.stream.read(consumer, count, block)
+        report = {'read': len(entries), SAVED: 0, REJECTED: 0, 'grading_jobs': 0}
+        if not entries:
+            return report
+
+        # Resubmissions by one student in a batch become one row, later answers winning
+        pending = defaultdict(dict)
+        for entry_id, entry in entries:
+            student = pending[entry['exam']].setdefault(entry['username'], {
+                'id': entry['student'], 'started_at': parse_datetime(entry['started_at']), 'answers': {}, 'entries': [],
+                # The first entry of the student was received first; entries appended before
+                # received_at existed are timed from now
+                'received_at': entry.get('received_at'),
+            })
+            student['answers'].update((answer['question_id'], answer) for answer in entry['answers'])
+            student['entries'].append((entry_id, entry['receipt']))
+
+        exams = Exam.objects.in_bulk(list(pending))
+        done, submission_ids, received_at, receipts = [], [], {}, {}
+        for exam_id, students in pending.items():
+            rows = [
+                IngestRow(line, username, student['started_at'], list(student['answers'].values()))
+                for line, (username, student) in enumerate(students.items())
+            ]
+            if exam_id not in exams:
+                written, errors = [], {row.line: [f"exam: {exam_id} no longer exists."] for row in rows}
+            else:
+                try:
+                    written, errors = BulkSubmissionWriter(exams[exam_id]).write(rows)
+                except DatabaseError:
+                    logger.exception(f"Could not write buffered submissions of exam {exam_id}")
+                    continue
+            written = dict(zip([row.line for row in rows if row.line not in errors], written))
+
+            for row, student in zip(rows, students.values()):
+                # Like SubmissionSerializer, a submission without answers is saved but not graded
+                if row.line in written and row.answers:
+                    submission_ids.append(written[row.line])
+                    if student['received_at'] is not None:
+                        received_at[written[row.line]] = student['received_at']
+                status = SAVED if row.line in written else REJECTED
+                report[status] += len(student['entries'])
+                metrics.SUBMISSION_BUFFER_ENTRIES_TOTAL.inc(len(student['entries']), status=status)
+                for entry_id, receipt in student['entries']:
+                    receipts[receipt] = {
+                        'receipt': receipt, 'status': status, 'exam': exam_id, 'student': student['id'],
+                        'submission': written.get(row.line), 'errors': errors.get(row.line, []),
+                    }
+                    done.append(entry_id)
+
+        report['grading_jobs'] = enqueue_grading(submission_ids, received_at)
+        self.stream.set_receipts(receipts, receipt_ttl())
+        self.stream.ack(done)
+        return report
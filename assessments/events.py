@@ -0,0 +1,35 @@
+"""Grade-ready events, published by grade_submission_task and awaited by SubmissionEventsView."""
+from helpers.events import get_event_bus
+
+
+def graded_channel(submission_id: int) -> str:
+    return f'submission:{submission_id}:graded'
+
+
+def graded_event(submission, paused: bool = False, failed: bool = False) -> dict:
+    event = {
+        'id': submission.id,
+        'is_completed': submission.is_completed,
+        'grade': str(submission.grade) if submission.grade is not None else None,
+        'total_score': submission.total_score,
+        'completed_at': submission.completed_at.isoformat() if submission.completed_at else None,
+    }
+    if paused:
+        event['paused'] = True
+    if failed:
+        event['failed'] = True
+    return event
+
+
+def publish_graded(submission, paused: bool = False, failed: bool = False):
+    """
+    paused: grading stopped because the exam's token budget is spent. failed: grading gave up on
+    some answers. Either event stays retained until `regrade_exam` enqueues the submission again.
+    """
+    get_event_bus().publish(graded_channel(submission.id), graded_event(submission, paused, failed))
+
+
+def forget_graded(submission_ids: list):
+    """Called when new answers are enqueued: the retained grade no longer matches the submission."""
+    if submission_ids:
+        get_event_bus().forget([graded_channel(submission_id) for submission_id in submission_ids])
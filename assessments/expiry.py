@@ -0,0 +1,113 @@
+"""
+Finalization of submissions whose time ran out: started_at + exam.duration (plus a grace period)
+has passed and the student never completed them.
+
+The deadline is computed in SQL from the joined exam, soft-deleted exams included, behind a plain
+`started_at < now - grace` range on the partial index of open submissions. Finalized rows leave
+that index, so a sweep costs the same whatever the size of the table.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Count, DateTimeField, DecimalField, DurationField, ExpressionWrapper, F, FloatField, IntegerField, OuterRef,
+    Subquery, Sum, Value,
+)
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from assessments.events import publish_graded
+from assessments.ingest import enqueue_grading
+from assessments.models import Exam, Question, StudentAnswer, Submission
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _total_score():
+    scores = (
+        StudentAnswer.objects.filter(submission=OuterRef('pk'))
+        .order_by().values('submission').annotate(total=Sum('score')).values('total')
+    )
+    return Coalesce(Subquery(scores, output_field=FloatField()), Value(0.0))
+
+
+def _grade():
+    # Same formula as GradingService.grade_submission, with unanswered questions scoring 0
+    question_counts = (
+        Question.objects.filter(exam=OuterRef('exam_id'))
+        .order_by().values('exam').annotate(count=Count('pk')).values('count')
+    )
+    percentage = _total_score() * Value(100.0) / NullIf(Subquery(question_counts, output_field=IntegerField()), 0)
+    return Cast(Coalesce(percentage, Value(0.0)), DecimalField(max_digits=10, decimal_places=2))
+
+
+def _deadline():
+    # A subquery rather than F('exam__duration'): UPDATE cannot join. all_objects, so soft-deleted
+    # exams still close their submissions
+    duration = Subquery(Exam.all_objects.filter(pk=OuterRef('exam_id')).values('duration'), output_field=DurationField())
+    return ExpressionWrapper(F('started_at') + duration, output_field=DateTimeField())
+
+
+class ExpiredSubmissionSweeper:
+    def __init__(self, batch_size: int = None, grace: timedelta = None, chunk_size: int = None):
+        self.batch_size = batch_size or getattr(settings, 'SUBMISSION_EXPIRY_BATCH_SIZE', 1000)
+        self.grace = grace if grace is not None else timedelta(
+            seconds=getattr(settings, 'SUBMISSION_EXPIRY_GRACE_SECONDS', 60)
+        )
+        self.chunk_size = chunk_size or getattr(settings, 'SUBMISSION_EXPIRY_GRADING_CHUNK_SIZE', 50)
+
+    def sweep(self, now=None) -> dict:
+        """Finalize every expired open submission, returning {'finalized': n, 'grading_jobs': n}."""
+        now = now or timezone.now()
+        report = {'finalized': 0, 'grading_jobs': 0}
+
+        cutoff = now - self.grace
+        expired = Submission.objects.filter(is_completed=False, started_at__lt=cutoff).alias(
+            deadline=_deadline()
+        ).filter(deadline__lt=cutoff)
+        while True:
+            batch = list(expired.order_by('started_at').values_list('pk', flat=True)[:self.batch_size])
+            if not batch:
+                break
+            finalized, jobs = self.finalize(batch, now)
+            report['finalized'] += finalized
+            report['grading_jobs'] += jobs
+            if len(batch) < self.batch_size:
+                break
+
+        if report['finalized']:
+            logger.info(f"Finalized {report['finalized']} expired submissions, {report['grading_jobs']} grading jobs")
+        return report
+
+    def finalize(self, submission_ids: list, now) -> tuple:
+        """
+        Close one batch with a single UPDATE: completed at the deadline, graded from the scores
+        already stored. Submissions with unscored answers are then sent to the grading tasks in
+        chunks of chunk_size, which recompute the grade and publish it once those answers are
+        scored; the others have their final grade published now.
+        """
+        with transaction.atomic():
+            # is_completed=False again: a student may have completed it since the batch was read
+            finalized = Submission.objects.filter(pk__in=submission_ids, is_completed=False).update(
+                is_completed=True,
+                completed_at=_deadline(),
+                total_score=_total_score(),
+                grade=_grade(),
+                updated_at=now,
+            )
+            ungraded = list(
+                StudentAnswer.objects.filter(submission_id__in=submission_ids, score__isnull=True)
+                .order_by().values_list('submission_id', flat=True).distinct()
+            )
+        metrics.SUBMISSIONS_EXPIRED_TOTAL.inc(finalized)
+
+        if finalized:
+            graded = Submission.objects.filter(pk__in=submission_ids, is_completed=True, updated_at=now).exclude(
+                pk__in=ungraded
+            ).only('id', 'is_completed', 'grade', 'total_score', 'completed_at')
+            for submission in graded:
+                publish_graded(submission)
+        return finalized, enqueue_grading(ungraded, chunk_size=self.chunk_size)
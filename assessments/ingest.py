@@ -0,0 +1,282 @@
+"""
+Bulk ingest of many students' submissions for one exam, e.g. a cohort of paper exams.
+
+Rows are validated against a cached answer key of the exam instead of per-answer queries,
+written with bulk inserts in one transaction per batch, and graded by one Celery job per submission.
+Saving or deleting the exam, one of its questions or one of their options evicts the answer key.
+"""
+import itertools
+import json
+import math
+import time
+
+from celery import group
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from assessments.archive import SubmissionArchiver
+from assessments.events import forget_graded
+from assessments.models import ArchivedSubmission, Exam, Question, QuestionOption, StudentAnswer, Submission
+from assessments.tasks import grade_submission_task
+
+
+def parse_pk(value):
+    """value as a primary key the way PrimaryKeyRelatedField reads one (an int or a string of digits), else None."""
+    # bool is an int subclass, and True would match the option or question with pk 1
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+class AnswerKey:
+    """Question types and option ownership of one exam, enough to validate answers without queries."""
+
+    def __init__(self, exam_id: int, questions: dict, options: dict):
+        self.exam_id = exam_id
+        self.questions = questions
+        self.options = options
+
+    @staticmethod
+    def cache_key(exam_id: int) -> str:
+        return f'exam-answer-key:{exam_id}'
+
+    @classmethod
+    def for_exam(cls, exam: Exam) -> 'AnswerKey':
+        key = cls.cache_key(exam.pk)
+        cached = cache.get(key)
+        if cached is not None:
+            return cls(exam.pk, *cached)
+
+        questions = dict(exam.questions.values_list('id', 'question_type'))
+        options = dict(QuestionOption.objects.filter(question__exam=exam).values_list('id', 'question_id'))
+        cache.set(key, (questions, options), getattr(settings, 'INGEST_ANSWER_KEY_TTL', 300))
+        return cls(exam.pk, questions, options)
+
+    def clean_answer(self, answer) -> dict:
+        """Return the StudentAnswer fields of one answer, or raise ValueError."""
+        if not isinstance(answer, dict):
+            raise ValueError("Each answer must be an object.")
+
+        question_id = parse_pk(answer.get('question'))
+        question_type = self.questions.get(question_id)
+        if question_type is None:
+            raise ValueError(f"Question {question_id} does not belong to exam {self.exam_id}.")
+
+        if question_type == 'MCQ':
+            option_id = parse_pk(answer.get('selected_option'))
+            if answer.get('selected_option') is None:
+                raise ValueError(f"Question {question_id}: MCQ questions require a selected option.")
+            if self.options.get(option_id) != question_id:
+                raise ValueError(f"Question {question_id}: selected option does not belong to the question.")
+            return {'question_id': question_id, 'selected_option_id': option_id, 'short_answer_text': None}
+
+        text = answer.get('short_answer_text')
+        if not text or not isinstance(text, str):
+            raise ValueError(f"Question {question_id}: short answer questions require text.")
+        return {'question_id': question_id, 'selected_option_id': None, 'short_answer_text': text}
+
+
+class IngestRow:
+    __slots__ = ('line', 'student', 'started_at', 'answers')
+
+    def __init__(self, line: int, student: str, started_at, answers: list):
+        self.line = line
+        self.student = student
+        self.started_at = started_at
+        self.answers = answers
+
+
+def parse_row(line_number: int, raw, answer_key: AnswerKey) -> IngestRow:
+    """Decode and validate one NDJSON line, raising ValueError with every problem found."""
+    try:
+        record = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(record, dict):
+        raise ValueError("Each line must be a JSON object.")
+
+    errors = []
+    student = record.get('student')
+    if not student or not isinstance(student, str):
+        errors.append("student: a username is required.")
+
+    started_at = record.get('started_at')
+    if started_at is not None:
+        started_at = parse_datetime(started_at) if isinstance(started_at, str) else None
+        if started_at is None:
+            errors.append("started_at: must be an ISO 8601 datetime.")
+        elif timezone.is_naive(started_at):
+            started_at = timezone.make_aware(started_at)
+
+    answers = record.get('answers')
+    cleaned = {}
+    if not isinstance(answers, list) or not answers:
+        errors.append("answers: a non-empty list is required.")
+    else:
+        for index, answer in enumerate(answers):
+            try:
+                data = answer_key.clean_answer(answer)
+            except ValueError as e:
+                errors.append(f"answers[{index}]: {e}")
+            else:
+                cleaned[data['question_id']] = data
+
+    if errors:
+        raise ValueError(errors)
+    return IngestRow(line_number, student, started_at or timezone.now(), list(cleaned.values()))
+
+
+class BulkSubmissionWriter:
+    """Writes validated rows of one exam, one transaction per batch."""
+
+    def __init__(self, exam: Exam):
+        self.exam = exam
+        self.User = get_user_model()
+
+    def write(self, rows: list) -> tuple:
+        """Return (submission ids to grade, {line: errors}) for rows that could not be written."""
+        errors = {}
+        users = self.User.objects.in_bulk({row.student for row in rows}, field_name='username')
+        existing, deleted = {}, []
+        for submission in Submission.all_objects.filter(exam=self.exam, student__in=list(users.values())):
+            if submission.is_deleted:
+                deleted.append(submission.pk)
+            else:
+                existing[submission.student_id] = submission
+        if deleted:
+            # A soft-deleted submission still holds the (student, exam) pair the new one needs
+            SubmissionArchiver().archive(deleted)
+        archived = set(ArchivedSubmission.objects.filter(
+            exam=self.exam, student__in=list(users.values()), is_deleted=False
+        ).values_list('student_id', flat=True))
+
+        accepted = []
+        for row in rows:
+            user = users.get(row.student)
+            if user is None:
+                errors[row.line] = [f"student: unknown username {row.student!r}."]
+            elif user.pk in archived or existing.get(user.pk) is not None and existing[user.pk].is_completed:
+                errors[row.line] = ["student: this exam is already completed and cannot be submitted again."]
+            else:
+                accepted.append((row, user))
+
+        with transaction.atomic():
+            new_submissions = [
+                Submission(student=user, exam=self.exam, started_at=row.started_at)
+                for row, user in accepted if user.pk not in existing
+            ]
+            Submission.objects.bulk_create(new_submissions)
+            submissions = {**existing, **{submission.student_id: submission for submission in new_submissions}}
+
+            # Re-uploaded students keep their submission and have their answers upserted
+            existing_answers = {
+                (answer.submission_id, answer.question_id): answer
+                for answer in StudentAnswer.objects.filter(submission__in=[s.pk for s in existing.values()])
+            }
+            now = timezone.now()
+            to_create, to_update = [], []
+            for row, user in accepted:
+                submission = submissions[user.pk]
+                for data in row.answers:
+                    answer = existing_answers.get((submission.pk, data['question_id']))
+                    if answer is None:
+                        to_create.append(StudentAnswer(submission=submission, **data))
+                    else:
+                        answer.selected_option_id = data['selected_option_id']
+                        answer.short_answer_text = data['short_answer_text']
+                        answer.updated_at = now
+                        to_update.append(answer)
+
+            StudentAnswer.objects.bulk_create(to_create)
+            StudentAnswer.objects.bulk_update(to_update, ['selected_option', 'short_answer_text', 'updated_at'])
+
+        return [submissions[user.pk].pk for _, user in accepted], errors
+
+
+def enqueue_grading(submission_ids: list, enqueued_at: dict = None, chunk_size: int = None) -> int:
+    """
+    Grade submissions with a group of one job per submission, so a failing submission neither stops
+    the others nor shares their GradingRun task id. With chunk_size, Celery `chunks` of chunk_size
+    submissions per job instead, for bulk backlogs where one message per submission would flood the
+    broker. enqueued_at maps submission ids to the time their answers were received, when that was
+    before now. Returns the number of jobs.
+    """
+    if not submission_ids:
+        return 0
+    forget_graded(submission_ids)
+    now, enqueued_at = time.time(), enqueued_at or {}
+    if chunk_size:
+        grade_submission_task.chunks([(pk, enqueued_at.get(pk, now)) for pk in submission_ids], chunk_size).apply_async()
+        return math.ceil(len(submission_ids) / chunk_size)
+    group(grade_submission_task.s(pk, enqueued_at.get(pk, now)) for pk in submission_ids).apply_async()
+    return len(submission_ids)
+
+
+class SubmissionIngestService:
+    @staticmethod
+    def ingest(exam: Exam, lines, batch_size: int = None) -> dict:
+        """
+        Validate, write and enqueue grading for an iterable of (line number, raw NDJSON line).
+        Invalid rows are reported and skipped; valid rows are written even when others fail.
+        """
+        batch_size = batch_size or getattr(settings, 'INGEST_BATCH_SIZE', 500)
+        answer_key = AnswerKey.for_exam(exam)
+        writer = BulkSubmissionWriter(exam)
+        report = {'exam': exam.pk, 'received': 0, 'accepted': 0, 'rejected': 0, 'grading_jobs': 0, 'errors': []}
+        seen_students = set()
+
+        lines = (item for item in lines if item[1].strip())
+        while True:
+            chunk = list(itertools.islice(lines, batch_size))
+            if not chunk:
+                break
+            report['received'] += len(chunk)
+
+            rows, errors = [], {}
+            for line_number, raw in chunk:
+                try:
+                    row = parse_row(line_number, raw, answer_key)
+                except ValueError as e:
+                    errors[line_number] = e.args[0] if isinstance(e.args[0], list) else [str(e)]
+                    continue
+                if row.student in seen_students:
+                    errors[line_number] = [f"student: {row.student!r} appears more than once in this upload."]
+                    continue
+                seen_students.add(row.student)
+                rows.append(row)
+
+            submission_ids, write_errors = writer.write(rows) if rows else ([], {})
+            errors.update(write_errors)
+            report['grading_jobs'] += enqueue_grading(submission_ids)
+            report['accepted'] += len(submission_ids)
+            report['rejected'] += len(errors)
+            report['errors'].extend(
+                {'line': line_number, 'errors': messages} for line_number, messages in sorted(errors.items())
+            )
+
+        return report
+
+
+@receiver((post_save, post_delete), sender=Exam, dispatch_uid='invalidate_answer_key_exam')
+def _exam_changed(sender, instance, **kwargs):
+    cache.delete(AnswerKey.cache_key(instance.pk))
+
+
+@receiver((post_save, post_delete), sender=Question, dispatch_uid='invalidate_answer_key_question')
+def _question_changed(sender, instance, **kwargs):
+    cache.delete(AnswerKey.cache_key(instance.exam_id))
+
+
+@receiver((post_save, post_delete), sender=QuestionOption, dispatch_uid='invalidate_answer_key_option')
+def _option_changed(sender, instance, **kwargs):
+    exam_id = Question.all_objects.filter(pk=instance.question_id).values_list('exam_id', flat=True).first()
+    if exam_id is not None:
+        cache.delete(AnswerKey.cache_key(exam_id))
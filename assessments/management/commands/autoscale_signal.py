@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assessments.autoscale import GradingScalingSignal, QueueProbeError
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints the grading autoscaling signal: queue depth, oldest task age, LLM latency EWMA, '
+        'rate limit headroom and the recommended number of worker processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--busy', type=int, default=0, help='Tasks the workers are running now')
+        parser.add_argument('--current', type=int, default=0, help='Worker processes running now, for the rate limit cap')
+        parser.add_argument('--json', action='store_true', help='Print the signal as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            signal = GradingScalingSignal().read(busy=options['busy'], current=options['current'])
+        except QueueProbeError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(signal, indent=2))
+            return
+
+        for name, value in signal.items():
+            self.stdout.write(f"{name.replace('_', ' '):<28} {'-' if value is None else value}")
@@ -0,0 +1,46 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assessments.buffer import SubmissionBuffer
+from helpers.streams import StreamError
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes submissions buffered by POST /api/submissions/ (SUBMISSION_BUFFER_ENABLED) to the '
+        'database in batches and enqueues their grading. Run one or more alongside the web processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--consumer', default=f'{socket.gethostname()}-{os.getpid()}',
+            help='Consumer name, unique per running consumer'
+        )
+        parser.add_argument('--batch-size', type=int, help='Entries per batch. Defaults to SUBMISSION_BUFFER_BATCH_SIZE.')
+        parser.add_argument('--block', type=float, default=1.0, help='Seconds to wait for new entries')
+        parser.add_argument('--once', action='store_true', help='Flush until the buffer is empty, then exit')
+
+    def handle(self, *args, **options):
+        buffer = SubmissionBuffer()
+        block = 0 if options['once'] else options['block']
+        while True:
+            try:
+                report = buffer.flush(options['consumer'], options['batch_size'], block=block)
+            except StreamError as e:
+                if options['once']:
+                    raise CommandError(str(e))
+                # Keep running through broker restarts; unacknowledged entries are read again
+                self.stderr.write(f"{e}; retrying.")
+                time.sleep(options['block'])
+                continue
+
+            if report['read']:
+                self.stdout.write(
+                    f"{report['read']} read: {report['saved']} saved, {report['rejected']} rejected, "
+                    f"{report['grading_jobs']} grading jobs"
+                )
+            elif options['once']:
+                return
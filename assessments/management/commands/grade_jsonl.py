@@ -0,0 +1,64 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assessments.offline import OfflineGrader, last_graded_line
+from assessments.services import grader_registry
+
+
+class Command(BaseCommand):
+    help = (
+        'Grades a JSONL file of {"expected", "actual"} records with any registered grading engine, '
+        'without the database or Celery, and writes the scores as JSONL.'
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='JSONL file to grade, or - for stdin')
+        parser.add_argument('output', help='JSONL file to write scores to')
+        parser.add_argument('--engine', help='Grading engine. Defaults to the GRADING_ENGINE setting.')
+        parser.add_argument('--template', help='Rubric used for records without their own "template"')
+        parser.add_argument('--batch-size', type=int, default=100, help='Lines held in memory at a time')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent grading threads')
+        parser.add_argument('--offset', type=int, default=0, help='Number of input lines to skip')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Append to the output and continue after the last input line it contains'
+        )
+
+    def handle(self, *args, **options):
+        if options['engine']:
+            # Fail on unknown engines instead of silently falling back
+            grader_registry.get(options['engine'])
+
+        offset = options['offset']
+        mode = 'w'
+        if options['resume']:
+            try:
+                offset = max(offset, last_graded_line(options['output']))
+            except ValueError as e:
+                raise CommandError(str(e))
+            mode = 'a'
+            self.stderr.write(f"Resuming after input line {offset}.")
+
+        grader = OfflineGrader(engine=options['engine'], workers=options['workers'], template=options['template'])
+
+        def progress(stats):
+            self.stderr.write(
+                f"line {stats['last_line']}: {stats['graded']} graded, {stats['failed']} failed, "
+                f"{stats['per_second']:.1f} answers/s"
+            )
+
+        try:
+            input_file = sys.stdin if options['input'] == '-' else open(options['input'])
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['input']}: {e}")
+
+        with input_file, open(options['output'], mode) as output_file:
+            stats = grader.run(input_file, output_file, batch_size=options['batch_size'], offset=offset, progress=progress)
+
+        total = stats['graded'] + stats['failed']
+        rate = total / stats['seconds'] if stats['seconds'] else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Graded {stats['graded']} of {total} records in {stats['seconds']:.1f}s ({rate:.1f} answers/s)."
+        ))
@@ -0,0 +1,45 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from assessments.services import GradingLatencyService
+
+
+class Command(BaseCommand):
+    help = 'Reports p50/p95/p99 grading latency (enqueue to completion) per exam and engine.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='Size of the time window, ending now')
+        parser.add_argument('--exam', type=int, help='Only report this exam ID')
+        parser.add_argument('--engine', help='Only report this engine, e.g. MOCK or LLM:OPENAI')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        report = GradingLatencyService.report(
+            since=timezone.now() - timedelta(hours=options['hours']),
+            exam_id=options['exam'],
+            engine=options['engine'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        if not report:
+            self.stdout.write("No grading runs in this window.")
+            return
+
+        separator = "=" * 90
+        self.stdout.write(separator)
+        self.stdout.write(
+            f"{'Exam':<30} | {'Engine':<12} | {'Runs':>6} | {'p50 (s)':>8} | {'p95 (s)':>8} | {'p99 (s)':>8}"
+        )
+        self.stdout.write("-" * 90)
+        for row in report:
+            self.stdout.write(
+                f"{row['exam_title'][:30]:<30} | {row['engine']:<12} | {row['runs']:>6} | "
+                f"{row['p50']:>8.2f} | {row['p95']:>8.2f} | {row['p99']:>8.2f}"
+            )
+        self.stdout.write(separator)
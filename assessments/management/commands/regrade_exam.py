@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from assessments.ingest import enqueue_grading
+from assessments.models import Exam
+from assessments.services import get_grader, warm_prompt_cache
+
+
+class Command(BaseCommand):
+    help = 'Re-enqueues grading for every submission of an exam, warming the LLM prompt cache first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam_id', type=int)
+        parser.add_argument(
+            '--no-warm-cache',
+            action='store_true',
+            help='Skip sending each question prompt prefix to the LLM provider before enqueuing'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            exam = Exam.objects.get(id=options['exam_id'])
+        except Exam.DoesNotExist:
+            raise CommandError(f"Exam {options['exam_id']} does not exist.")
+
+        if not options['no_warm_cache']:
+            warmed = warm_prompt_cache(exam, get_grader())
+            self.stdout.write(f"Warmed the prompt cache for {warmed} short answer questions.")
+
+        # Also forgets the retained events of submissions a spent token budget paused
+        count = enqueue_grading(list(
+            exam.submissions.filter(answers__isnull=False).distinct().values_list('id', flat=True)
+        ))
+
+        self.stdout.write(self.style.SUCCESS(f"Enqueued grading for {count} submissions of '{exam.title}'."))
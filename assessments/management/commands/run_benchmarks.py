@@ -0,0 +1,83 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from assessments import benchmarks
+
+SUITES = ('grader', 'pipeline', 'api', 'serialization', 'startup')
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+class Command(BaseCommand):
+    help = 'Runs the offline grading benchmarks and writes the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suite',
+            action='append',
+            choices=SUITES,
+            help='Benchmark suite to run (repeatable). Runs every suite by default.'
+        )
+        parser.add_argument('--output', help='File to write the JSON results to. Defaults to stdout.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for generated answers')
+        parser.add_argument(
+            '--answer-lengths', type=int_list, default=[5, 50, 200],
+            help='Comma separated answer lengths (words) for the grader suite'
+        )
+        parser.add_argument(
+            '--batch-sizes', type=int_list, default=[1, 10, 100],
+            help='Comma separated batch sizes for the grader suite'
+        )
+        parser.add_argument(
+            '--exam-sizes', type=int_list, default=[5, 20, 100],
+            help='Comma separated question counts for the pipeline, api and serialization suites'
+        )
+        parser.add_argument(
+            '--llm-latency', type=float, default=0.0,
+            help='Seconds the stub LLM backend waits per short answer in the api suite'
+        )
+
+    def handle(self, *args, **options):
+        suites = options['suite'] or SUITES
+        results = {}
+
+        if 'grader' in suites:
+            self.stderr.write("Running grader suite...")
+            results['grader'] = benchmarks.bench_grader(
+                options['answer_lengths'], options['batch_sizes'],
+                repeat=options['repeat'], seed=options['seed']
+            )
+
+        if 'pipeline' in suites:
+            self.stderr.write("Running pipeline suite...")
+            results['pipeline'] = benchmarks.bench_pipeline(options['exam_sizes'], seed=options['seed'])
+
+        if 'api' in suites:
+            self.stderr.write("Running api suite...")
+            results['api'] = benchmarks.bench_api(
+                options['exam_sizes'], llm_latency=options['llm_latency'],
+                repeat=options['repeat'], seed=options['seed']
+            )
+
+        if 'serialization' in suites:
+            self.stderr.write("Running serialization suite...")
+            results['serialization'] = benchmarks.bench_serialization(
+                options['exam_sizes'], repeat=options['repeat'], seed=options['seed']
+            )
+
+        if 'startup' in suites:
+            self.stderr.write("Running startup suite...")
+            results['startup'] = benchmarks.bench_startup(repeat=options['repeat'])
+
+        report = json.dumps({'environment': benchmarks.environment(), 'results': results}, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+            self.stderr.write(self.style.SUCCESS(f"Benchmark results written to {options['output']}"))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from helpers.llm_stub import LATENCY_DISTRIBUTIONS, StubBehaviour, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local stub of the OpenAI chat-completions and Gemini generate-content APIs for offline '
+        'load tests. Point OPENAI_BASE_URL at http://<host>:<port>/v1 or GEMINI_BASE_URL at http://<host>:<port>.'
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--latency-ms', type=float, default=500.0, help='Base (median) response latency')
+        parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='lognormal')
+        parser.add_argument(
+            '--jitter-ms', type=float, default=250.0,
+            help='Half-width of the uniform distribution, or log spread relative to --latency-ms for lognormal'
+        )
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failing with 500')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of requests answered with 429')
+        parser.add_argument('--seed', type=int, help='Seed for latency and failure injection')
+
+    def handle(self, *args, **options):
+        behaviour = StubBehaviour(
+            latency_ms=options['latency_ms'],
+            latency_dist=options['latency_dist'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            seed=options['seed'],
+        )
+        server = make_server(options['host'], options['port'], behaviour)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stub LLM server listening on http://{options['host']}:{options['port']} "
+            f"({options['latency_dist']} latency around {options['latency_ms']}ms, "
+            f"{options['error_rate']:.0%} errors, {options['rate_limit_rate']:.0%} rate limited)"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
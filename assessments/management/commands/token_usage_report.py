@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from assessments.usage import TokenUsageService
+
+
+class Command(BaseCommand):
+    help = 'Reports LLM tokens per exam against its budget, and the questions with the most tokens per scored answer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exam', type=int, help='Only report this exam ID')
+        parser.add_argument('--limit', type=int, default=20, help='Number of questions to list')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        report = TokenUsageService.report(exam_id=options['exam'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        if not report['exams']:
+            self.stdout.write("No LLM token usage recorded.")
+            return
+
+        separator = "=" * 90
+        self.stdout.write(separator)
+        self.stdout.write(f"{'Exam':<40} | {'Used tokens':>14} | {'Budget':>14} | {'On exceeded':<12}")
+        self.stdout.write("-" * 90)
+        for row in report['exams']:
+            budget = f"{row['max_tokens']:>14,}" if row['max_tokens'] else f"{'-':>14}"
+            self.stdout.write(
+                f"{row['exam_title'][:40]:<40} | {row['used_tokens']:>14,} | {budget} | {row['on_exceeded'] or '-':<12}"
+            )
+
+        self.stdout.write(separator)
+        self.stdout.write(f"{'Question':<40} | {'Provider':<10} | {'Answers':>8} | {'Tokens/answer':>14} | {'Cached':>8}")
+        self.stdout.write("-" * 90)
+        for row in report['questions'][:options['limit']]:
+            per_answer = f"{row['tokens_per_answer']:>14.1f}" if row['tokens_per_answer'] is not None else f"{'-':>14}"
+            cached = row['cached_tokens'] / row['prompt_tokens'] if row['prompt_tokens'] else 0.0
+            self.stdout.write(
+                f"{row['question_text'][:40]:<40} | {row['provider']:<10} | {row['answers']:>8} | "
+                f"{per_answer} | {cached:>8.0%}"
+            )
+        self.stdout.write(separator)
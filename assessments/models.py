@@ -6,6 +6,10 @@ from base.models import BaseModel
 
 # Create your models here.
 
+# Condition of the partial indexes on live rows. ActiveObjects always filters on it, so the
+# indexes serve every default-manager query without carrying soft-deleted rows.
+LIVE = models.Q(is_deleted=False)
+
 
 class Exam(BaseModel):
     title = models.CharField(max_length=255)
@@ -15,15 +19,16 @@ class Exam(BaseModel):
     metadata = models.JSONField(default=dict, blank=True)
     grading_prompt = models.TextField(
         null=True, blank=True,
-        default="Grade the student's answer based on the expected answer. \n"
-                "Return ONLY a numeric score between 0.0 and 1.0. \n"
-                "Expected Answer: {expected}\nStudent Answer: {actual}\nScore 0.0-1.0:"
+        default="Grade the student's answer based on the expected answer.\n"
+                "Return ONLY a numeric score between 0.0 and 1.0.",
+        help_text="Rubric sent before the question, expected answer and student answer. "
+                  "Lines holding only {expected} or {actual} are ignored."
     )
 
     class Meta:
         indexes = [
-            models.Index(fields=['course']),
-            models.Index(fields=['title']),
+            models.Index(fields=['course'], condition=LIVE, name='exam_course_live_idx'),
+            models.Index(fields=['title'], condition=LIVE, name='exam_title_live_idx'),
         ]
 
     def __str__(self):
@@ -42,7 +47,7 @@ class Question(BaseModel):
 
     class Meta:
         indexes = [
-            models.Index(fields=['question_type']),
+            models.Index(fields=['question_type'], condition=LIVE, name='question_type_live_idx'),
         ]
 
     def __str__(self):
@@ -56,11 +61,11 @@ class QuestionOption(BaseModel):
 
     class Meta:
         indexes = [
-            models.Index(fields=['is_correct']),
+            models.Index(fields=['is_correct'], condition=LIVE, name='option_is_correct_live_idx'),
         ]
 
     def __str__(self):
-        return f"{self.text} for Question ID {self.question.id}"
+        return f"{self.text} for Question ID {self.question_id}"
 
 
 class Submission(BaseModel):
@@ -80,9 +85,20 @@ class Submission(BaseModel):
     class Meta:
         unique_together = ('student', 'exam')
         indexes = [
-            models.Index(fields=['student', 'is_completed']),
-            models.Index(fields=['exam', 'is_completed']),
-            models.Index(fields=['started_at']),
+            models.Index(fields=['student', 'is_completed'], condition=LIVE, name='submission_student_live_idx'),
+            models.Index(fields=['exam', 'is_completed'], condition=LIVE, name='submission_exam_live_idx'),
+            models.Index(fields=['started_at'], condition=LIVE, name='submission_started_live_idx'),
+            # Only open submissions, so the expiry sweep never reads completed rows
+            models.Index(
+                fields=['started_at'], condition=models.Q(is_completed=False, is_deleted=False),
+                name='submission_open_started_idx'
+            ),
+            # What the archiver reads: completed rows by age and soft-deleted rows
+            models.Index(
+                fields=['completed_at'], condition=models.Q(is_completed=True, is_deleted=False),
+                name='submission_completed_idx'
+            ),
+            models.Index(fields=['deleted_at'], condition=models.Q(is_deleted=True), name='submission_deleted_idx'),
         ]
 
     def __str__(self):
@@ -95,11 +111,101 @@ class StudentAnswer(BaseModel):
     selected_option = models.ForeignKey(QuestionOption, null=True, blank=True, on_delete=models.SET_NULL)
     short_answer_text = models.TextField(blank=True, null=True)
     score = models.FloatField(null=True, validators=[MinValueValidator(0.0)])
+    graded_by = models.CharField(
+        max_length=32, blank=True, default='',
+        help_text="Engine or LLM provider that produced the score of a short answer"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['submission', 'question'], condition=LIVE, name='answer_submission_live_idx'),
+        ]
+
+    def __str__(self):
+        return f"Answer to Question ID {self.question_id} in Submission ID {self.submission_id}"
+
+
+class GradingRun(models.Model):
+    """
+    Append-only timeline of one grade_submission_task attempt.
+    Rows are written once when the attempt finishes and never updated. A submission graded in parts
+    gets one row when its parts are totalled, plus one per failed part attempt. Archiving the
+    submission clears `submission` but keeps the row, so latency history covers archived submissions.
+    """
+    submission = models.ForeignKey(Submission, related_name='grading_runs', null=True, on_delete=models.SET_NULL)
+    exam = models.ForeignKey(Exam, related_name='grading_runs', on_delete=models.CASCADE)
+    task_id = models.CharField(max_length=255, blank=True)
+    attempt = models.PositiveSmallIntegerField(default=0)
+    engine = models.CharField(max_length=32)
+    enqueued_at = models.DateTimeField(null=True)
+    started_at = models.DateTimeField()
+    completed_at = models.DateTimeField()
+    llm_seconds = models.FloatField(default=0.0)
+    succeeded = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['completed_at', 'exam']),
+        ]
+
+    def __str__(self):
+        return f"Grading run {self.attempt} for Submission ID {self.submission_id}"
+
+    @property
+    def latency(self) -> float:
+        """Seconds the student waited, from enqueue (or task start) to completion."""
+        return (self.completed_at - (self.enqueued_at or self.started_at)).total_seconds()
+
+
+class TokenUsage(models.Model):
+    """
+    Running LLM token totals per exam, question and provider, incremented by every grading task.
+    `answers` counts the answers an LLM call scored, `calls` every call including unusable ones.
+    """
+    exam = models.ForeignKey(Exam, related_name='token_usage', on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, related_name='token_usage', on_delete=models.CASCADE)
+    provider = models.CharField(max_length=32)
+    calls = models.PositiveIntegerField(default=0)
+    answers = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.BigIntegerField(default=0)
+    cached_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['exam', 'question', 'provider'], name='token_usage_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} tokens for Question ID {self.question_id}"
+
+
+class ArchivedSubmission(models.Model):
+    """
+    A submission moved out of the live tables by the archiver, under its original id. Answers are
+    packed into one JSON list of {question, selected_option, short_answer_text, score, graded_by,
+    is_deleted}. Rows are written once and never updated.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    student = models.ForeignKey('auth.User', related_name='archived_submissions', on_delete=models.CASCADE)
+    exam = models.ForeignKey(Exam, related_name='archived_submissions', on_delete=models.CASCADE)
+    grade = models.DecimalField(null=True, max_digits=10, decimal_places=2)
+    total_score = models.FloatField(null=True)
+    is_completed = models.BooleanField(default=False)
+    started_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True)
+    submitted_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    is_deleted = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(null=True)
+    answers = models.JSONField(default=list)
+    archived_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         indexes = [
-            models.Index(fields=['submission', 'question']),
+            models.Index(fields=['student', 'exam']),
         ]
 
     def __str__(self):
-        return f"Answer to Question ID {self.question.id} in Submission ID {self.submission.id}"
+        return f"Archived submission {self.id}"
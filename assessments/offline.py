@@ -0,0 +1,110 @@
+"""
+Grade (expected, actual) pairs from a JSONL file without touching the database or Celery.
+
+Each input line is an object with "expected" and "actual", and optionally "id", "question"
+and "template". Each output line carries the input line number, its "id", the "score",
+the engine or provider that produced it and any "error".
+"""
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from assessments.services import get_grader
+
+
+class OfflineGrader:
+    """Grades records concurrently with one grader instance per worker thread."""
+
+    def __init__(self, engine: str = None, workers: int = 8, template: str = None):
+        self.engine = engine
+        self.workers = workers
+        self.template = template
+        self._local = threading.local()
+
+    def grader(self):
+        if not hasattr(self._local, 'grader'):
+            self._local.grader = get_grader(self.engine)
+        return self._local.grader
+
+    def grade_one(self, item) -> dict:
+        line_number, line = item
+        result = {'line': line_number}
+        try:
+            record = json.loads(line)
+            result['id'] = record.get('id')
+            grader = self.grader()
+            result['score'] = grader.grade(
+                record['expected'], record['actual'],
+                template=record.get('template', self.template), question=record.get('question'),
+            )
+            result['graded_by'] = grader.last_provider or grader.engine
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            result['score'] = None
+            result['error'] = f"Invalid record: {e}"
+        except Exception as e:
+            result['score'] = None
+            result['error'] = str(e)
+        return result
+
+    def run(self, input_file, output_file, batch_size: int = 100, offset: int = 0, progress=None) -> dict:
+        """
+        Stream input_file into output_file. Only one batch of lines is held in memory at a time and
+        output is flushed after every batch, so an interrupted run can resume after the last line written.
+        """
+        lines = enumerate(input_file, start=1)
+        lines = itertools.islice(lines, offset, None)
+        stats = {'graded': 0, 'failed': 0, 'offset': offset}
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                chunk = list(itertools.islice(lines, batch_size))
+                if not chunk:
+                    break
+                batch = [(number, line) for number, line in chunk if line.strip()]
+
+                for result in executor.map(self.grade_one, batch):
+                    output_file.write(json.dumps(result) + '\n')
+                    stats['failed' if result['score'] is None else 'graded'] += 1
+                output_file.flush()
+
+                stats['last_line'] = chunk[-1][0]
+                stats['seconds'] = time.perf_counter() - start
+                stats['per_second'] = (stats['graded'] + stats['failed']) / stats['seconds']
+                if progress:
+                    progress(stats)
+
+        stats['seconds'] = time.perf_counter() - start
+        return stats
+
+
+def last_graded_line(path) -> int:
+    """
+    Input line number of the last result in an output file, or 0 if there is none. A partial or
+    unreadable last line, as left by an interrupted run, is cut off so appended results start on a
+    line of their own. Unreadable lines followed by valid ones raise ValueError.
+    """
+    last, offset, broken_at = 0, 0, None
+    try:
+        with open(path, 'rb+') as output:
+            for line in output:
+                start, offset = offset, offset + len(line)
+                if not line.strip():
+                    continue
+                try:
+                    number = json.loads(line)['line'] if line.endswith(b'\n') else None
+                except (ValueError, LookupError, TypeError):
+                    number = None
+                if number is None:
+                    broken_at = start if broken_at is None else broken_at
+                    continue
+                if broken_at is not None:
+                    raise ValueError(f"{path} has an unreadable result before the result of input line {number}.")
+                last = number
+            if broken_at is not None:
+                output.truncate(broken_at)
+    except FileNotFoundError:
+        pass
+    return last
@@ -0,0 +1,62 @@
+"""
+Grading prompts laid out for provider-side prompt caching.
+
+OpenAI and Gemini cache the longest previously seen prompt prefix, so everything that is the
+same for every student answering a question comes first (instructions, exam rubric, question,
+expected answer) and the student's answer comes last.
+"""
+import re
+from typing import NamedTuple
+
+GRADING_INSTRUCTIONS = (
+    "You are an automated grading assistant.\n"
+    "Grade the student's answer based on the expected answer.\n"
+    "Return ONLY a numeric score between 0.0 and 1.0.\n"
+    "0.0 means completely wrong, 1.0 means correct match."
+)
+
+# A line that only labels a placeholder, e.g. "Expected Answer: {expected}"
+_PLACEHOLDER_LINE = re.compile(r"^[^{}\n]*:?\s*\{(expected|actual)\}\s*$")
+_PLACEHOLDER_NAMES = {'{expected}': 'the expected answer', '{actual}': "the student's answer"}
+SCORE_CUE = "Score 0.0-1.0:"
+_INSTRUCTION_LINES = {line.strip() for line in GRADING_INSTRUCTIONS.splitlines()} | {SCORE_CUE}
+
+
+class GradingPrompt(NamedTuple):
+    prefix: str
+    suffix: str
+
+    @property
+    def text(self) -> str:
+        return self.prefix + self.suffix
+
+
+def rubric_from_template(template: str) -> str:
+    """
+    Turn an exam grading_prompt into static rubric text.
+    Lines that only carry {expected}/{actual} are dropped (those values are appended at the end),
+    placeholders used inside a sentence are replaced by a reference to the section, and lines
+    repeating the built-in instructions are skipped.
+    """
+    lines = []
+    for line in template.splitlines():
+        if _PLACEHOLDER_LINE.match(line.strip()) or line.strip() in _INSTRUCTION_LINES:
+            continue
+        for placeholder, name in _PLACEHOLDER_NAMES.items():
+            line = line.replace(placeholder, name)
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def build_prompt(expected: str, actual: str, template: str = None, question: str = None) -> GradingPrompt:
+    sections = [GRADING_INSTRUCTIONS]
+
+    rubric = rubric_from_template(template) if template else ''
+    if rubric:
+        sections.append(f"Rubric:\n{rubric}")
+    if question:
+        sections.append(f"Question: {question}")
+    sections.append(f"Expected Answer: {expected}")
+
+    prefix = "\n\n".join(sections) + "\n\nStudent Answer: "
+    return GradingPrompt(prefix=prefix, suffix=f"{actual}\n{SCORE_CUE}")
@@ -1,10 +1,39 @@
+import time
+
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from assessments.models import QuestionOption, Question, Exam, Submission, StudentAnswer
+from assessments.events import forget_graded
+from assessments.models import ArchivedSubmission, QuestionOption, Question, Exam, Submission, StudentAnswer
 from assessments.tasks import grade_submission_task
 
 
+def _pk_values(values) -> set:
+    pks = set()
+    for value in values:
+        if isinstance(value, int) and not isinstance(value, bool):
+            pks.add(value)
+        elif isinstance(value, str) and value.isdigit():
+            pks.add(int(value))
+    return pks
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Looks the pk up in context['related_cache'][model] before querying, so a parent serializer
+    can load every related row for a list of nested items in one query.
+    """
+
+    def to_internal_value(self, data):
+        cache = self.context.get('related_cache', {}).get(self.get_queryset().model)
+        if cache is not None and self.pk_field is None:
+            instance = cache.get(next(iter(_pk_values([data])), None))
+            if instance is not None:
+                return instance
+        return super().to_internal_value(data)
+
+
 class QuestionOptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = QuestionOption
@@ -42,12 +71,15 @@ class ExamSerializer(serializers.ModelSerializer):
 
 
 class StudentAnswerSerializer(serializers.ModelSerializer):
-    question = serializers.PrimaryKeyRelatedField(
+    question = PrefetchedPrimaryKeyRelatedField(
         queryset=Question.objects.all(),
         error_messages={
             'does_not_exist': 'The specified question does not exist.'
         }
     )
+    selected_option = PrefetchedPrimaryKeyRelatedField(
+        queryset=QuestionOption.objects.all(), required=False, allow_null=True
+    )
     question_text = serializers.ReadOnlyField(source='question.text')
     selected_option_text = serializers.ReadOnlyField(source='selected_option.text')
 
@@ -69,7 +101,7 @@ class StudentAnswerSerializer(serializers.ModelSerializer):
         if question.question_type == 'MCQ':
             if not selected_option:
                 raise ValidationError("MCQ questions require a selected option.")
-            if selected_option.question != question:
+            if selected_option.question_id != question.id:
                 raise ValidationError({
                     "selected_option": "Selected option does not belong to the specified question."
                 })
@@ -85,7 +117,7 @@ class SubmissionSerializer(serializers.ModelSerializer):
     answers = StudentAnswerSerializer(many=True, required=False)
     exam_title = serializers.ReadOnlyField(source='exam.title')
     student = serializers.ReadOnlyField(source='student.username')
-    submitted_at = serializers.ReadOnlyField(source='created_at')
+    submitted_at = serializers.DateTimeField(source='created_at', read_only=True)
 
     class Meta:
         model = Submission
@@ -110,11 +142,30 @@ class SubmissionSerializer(serializers.ModelSerializer):
             'student'
         )
 
+    def to_internal_value(self, data):
+        answers = data.get('answers') if hasattr(data, 'get') else None
+        if isinstance(answers, list):
+            answers = [answer for answer in answers if isinstance(answer, dict)]
+            question_ids = _pk_values(answer.get('question') for answer in answers)
+            option_ids = _pk_values(answer.get('selected_option') for answer in answers)
+            self.context['related_cache'] = {
+                Question: Question.objects.in_bulk(question_ids),
+                QuestionOption: QuestionOption.objects.in_bulk(option_ids),
+            }
+        return super().to_internal_value(data)
+
     def validate(self, attrs):
         user = self.context.get('user')
         exam = attrs.get('exam')
         user_submission = Submission.objects.filter(student=user, exam=exam).first()
 
+        if user_submission is None and ArchivedSubmission.objects.filter(
+            student=user, exam=exam, is_deleted=False
+        ).exists():
+            # Archived submissions were completed
+            raise serializers.ValidationError({
+                "non_field_errors": "You have already completed this exam and cannot submit again."
+            })
 
         if user_submission:
             attrs['started_at'] = user_submission.started_at
@@ -124,7 +175,6 @@ class SubmissionSerializer(serializers.ModelSerializer):
                 })
 
         # Duration Validation
-        from django.utils import timezone
         if attrs['started_at'] + exam.duration < timezone.now():
             raise serializers.ValidationError({
                 "non_field_errors": "The time for this exam has expired."
@@ -147,15 +197,153 @@ class SubmissionSerializer(serializers.ModelSerializer):
         submission, _ = Submission.objects.get_or_create(**validated_data)
 
         if answers_data:
+            # Upsert every answer with one read and at most two bulk writes
+            existing = {
+                answer.question_id: answer
+                for answer in StudentAnswer.objects.filter(submission=submission)
+            }
+            now = timezone.now()
+            to_create, to_update = [], {}
             for answer_data in answers_data:
                 question = answer_data.pop('question', None)
-                StudentAnswer.objects.update_or_create(
-                    submission=submission,
-                    question=question,
-                    defaults=answer_data
-                )
+                answer = existing.get(question.id)
+                if answer is None:
+                    answer = existing[question.id] = StudentAnswer(submission=submission, question=question)
+                    to_create.append(answer)
+                elif answer.pk:
+                    to_update[answer.pk] = answer
+
+                for field, value in answer_data.items():
+                    setattr(answer, field, value)
+                answer.updated_at = now
+
+            StudentAnswer.objects.bulk_create(to_create)
+            StudentAnswer.objects.bulk_update(
+                to_update.values(), ['selected_option', 'short_answer_text', 'updated_at']
+            )
 
             # Trigger grading asynchronously
-            grade_submission_task.delay(submission.id)
+            forget_graded([submission.id])
+            grade_submission_task.delay(submission.id, enqueued_at=time.time())
         
         return submission
+
+
+# Hand-written read serializers for the hot exam and submission shapes. They produce exactly the
+# output of ExamSerializer / SubmissionSerializer from prefetched rows, but skip building a field
+# tree per nested instance; the field objects formatting non-JSON types are created once here.
+_DATETIME = serializers.DateTimeField()
+_DURATION = serializers.DurationField()
+_GRADE = serializers.DecimalField(
+    max_digits=Submission._meta.get_field('grade').max_digits,
+    decimal_places=Submission._meta.get_field('grade').decimal_places,
+)
+
+
+def _datetime(value):
+    return _DATETIME.to_representation(value) if value is not None else None
+
+
+class ExamDetailSerializer(serializers.BaseSerializer):
+    """Read-only ExamSerializer output; expects questions__options to be prefetched."""
+
+    def to_representation(self, exam):
+        return {
+            'id': exam.id,
+            'title': exam.title,
+            'description': exam.description,
+            'duration': _DURATION.to_representation(exam.duration),
+            'course': exam.course,
+            'metadata': exam.metadata,
+            'grading_prompt': exam.grading_prompt,
+            'questions': [
+                {
+                    'id': question.id,
+                    'text': question.text,
+                    'question_type': question.question_type,
+                    'options': [{'id': option.id, 'text': option.text} for option in question.options.all()],
+                }
+                for question in exam.questions.all()
+            ],
+        }
+
+
+class SubmissionDetailSerializer(serializers.BaseSerializer):
+    """Read-only SubmissionSerializer output; expects exam, student and answers with their question and option loaded."""
+
+    def to_representation(self, submission):
+        answers = []
+        for answer in submission.answers.all():
+            data = {
+                'question': answer.question_id,
+                'question_text': answer.question.text,
+                'selected_option': answer.selected_option_id,
+            }
+            if answer.selected_option_id is not None:
+                data['selected_option_text'] = answer.selected_option.text
+            data['short_answer_text'] = answer.short_answer_text
+            answers.append(data)
+
+        return {
+            'id': submission.id,
+            'exam': submission.exam_id,
+            'exam_title': submission.exam.title,
+            'student': submission.student.username,
+            'grade': _GRADE.to_representation(submission.grade) if submission.grade is not None else None,
+            'is_completed': submission.is_completed,
+            'started_at': _datetime(submission.started_at),
+            'submitted_at': _datetime(submission.created_at),
+            'updated_at': _datetime(submission.updated_at),
+            'completed_at': _datetime(submission.completed_at),
+            'answers': answers,
+        }
+
+
+class ArchivedSubmissionSerializer(serializers.BaseSerializer):
+    """
+    SubmissionSerializer output for an ArchivedSubmission, plus archived_at. Expects exam and student
+    loaded and the answer texts from assessments.archive.answer_texts in the context.
+    """
+
+    def to_representation(self, submission):
+        question_texts = self.context.get('question_texts', {})
+        option_texts = self.context.get('option_texts', {})
+        answers = []
+        for answer in submission.answers:
+            if answer['is_deleted']:
+                continue
+            data = {
+                'question': answer['question'],
+                'question_text': question_texts.get(answer['question']),
+                'selected_option': answer['selected_option'],
+            }
+            if answer['selected_option'] is not None:
+                data['selected_option_text'] = option_texts.get(answer['selected_option'])
+            data['short_answer_text'] = answer['short_answer_text']
+            answers.append(data)
+
+        return {
+            'id': submission.id,
+            'exam': submission.exam_id,
+            'exam_title': submission.exam.title,
+            'student': submission.student.username,
+            'grade': _GRADE.to_representation(submission.grade) if submission.grade is not None else None,
+            'is_completed': submission.is_completed,
+            'started_at': _datetime(submission.started_at),
+            'submitted_at': _datetime(submission.submitted_at),
+            'updated_at': _datetime(submission.updated_at),
+            'completed_at': _datetime(submission.completed_at),
+            'answers': answers,
+            'archived_at': _datetime(submission.archived_at),
+        }
+
+
+class GradingLatencyQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    exam = serializers.IntegerField(required=False)
+    engine = serializers.CharField(required=False)
+
+
+class TokenUsageQuerySerializer(serializers.Serializer):
+    exam = serializers.IntegerField(required=False)
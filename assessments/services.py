@@ -1,43 +1,92 @@
+import inspect
 import logging
+import math
+import time
 from abc import ABC, abstractmethod
+from functools import cache
 from typing import Optional
 
 from django.conf import settings
+from django.db.models import Count, Sum
 from django.utils import timezone
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
-from assessments.models import Submission
-from helpers.llm_backends import LLMBackend, OpenAIBackend, GeminiBackend
+from assessments.autoscale import record_llm_calls
+from assessments.models import Exam, GradingRun, StudentAnswer, Submission
+from assessments.prompts import build_prompt
+from assessments.usage import TokenTally, TokenUsageService
+from helpers import metrics
+from helpers.db_router import use_replica
+from helpers.llm_backends import LLMBackend, get_backend
+from helpers.registry import LazyRegistry
 
 logger = logging.getLogger(__name__)
 
 
 class BaseGrader(ABC):
-    def grade(self, expected: str, actual: str, template: str = None) -> float:
+    engine = None
+    llm_seconds = 0.0
+    llm_calls = 0
+    # Provider that produced the last score, when it came from an LLM
+    last_provider = None
+    # Token counts of the LLM call behind the last grade() and the provider that served it, and
+    # (provider, usage) of every call it made, which hedged calls still running add to once the
+    # backend settles
+    last_usage = None
+    last_usage_provider = None
+    last_usages = ()
+
+    def grade(self, expected: str, actual: str, template: str = None, question: str = None) -> float:
         """
         Compare expected answer and actual answer.
         Returns a score between 0.0 and 1.0.
         Commonly handles empty inputs and exact matches to save resources.
         """
+        self.last_provider = None
+        self.last_usage = self.last_usage_provider = None
+        self.last_usages = ()
         if not expected or not actual:
             return 0.0
 
         # Exact match check (case-insensitive and stripped)
         if expected.strip().lower() == actual.strip().lower():
+            metrics.GRADING_EXACT_MATCH_TOTAL.inc()
             return 1.0
 
+        if _accepts_question(type(self).evaluate_result):
+            return self.evaluate_result(expected, actual, template, question=question)
         return self.evaluate_result(expected, actual, template)
 
     @abstractmethod
-    def evaluate_result(self, expected: str, actual: str, template: str = None) -> float:
-        pass
+    def evaluate_result(self, expected: str, actual: str, template: str = None, question: str = None) -> float:
+        """
+        Score an answer that is neither empty nor an exact match. `question` (the question text) is
+        optional: engines whose evaluate_result(expected, actual, template) does not take it are
+        called without it.
+        """
+
+
+@cache
+def _accepts_question(evaluate_result) -> bool:
+    try:
+        parameters = inspect.signature(evaluate_result).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(
+        parameter.name == 'question' or parameter.kind == parameter.VAR_KEYWORD for parameter in parameters
+    )
 
 
 class MockGrader(BaseGrader):
+    engine = 'MOCK'
 
-    def evaluate_result(self, expected: str, actual: str, template: str = None) -> Optional[float]:
+    def evaluate_result(
+        self, expected: str, actual: str, template: str = None, question: str = None
+    ) -> Optional[float]:
         try:
+            # scikit-learn is slow to import, so only load it once an answer needs it
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.metrics.pairwise import cosine_similarity
+
             expected = expected.strip().lower()
             actual = actual.strip().lower()
             vectorizer = TfidfVectorizer()
@@ -54,85 +103,259 @@ class LLMGrader(BaseGrader):
 
     def __init__(self):
         self.backend = self._get_backend()
+        self.engine = f'LLM:{self.backend.provider}'
+        self.llm_seconds = 0.0
+        self.llm_calls = 0
 
     def _get_backend(self) -> LLMBackend:
-        provider = getattr(settings, 'LLM_PROVIDER', '').upper()
-        if provider == 'OPENAI':
-            return OpenAIBackend()
-        else:
-            return GeminiBackend()
-
-    def prepare_prompt(self, expected: str, actual: str, template: str = None) -> str:
-        default_template = (
-            "You are an automated grading assistant.\n"
-            "Expected Answer: {expected}\n"
-            "Student Answer: {actual}\n"
-            "Grade the student's answer based on the expected answer.\n"
-            "Return ONLY a numeric score between 0.0 and 1.0.\n"
-            "0.0 means completely wrong, 1.0 means correct match."
-        )
-        active_template = template or default_template
-        
-        # Ensure placeholders exist in template
-        if "{expected}" not in active_template or "{actual}" not in active_template:
-             active_template += "\n\nContext for grading:\nExpected: {expected}\nStudent Answer: {actual}"
+        return get_backend()
+
+    def prepare_prompt(self, expected: str, actual: str, template: str = None, question: str = None) -> str:
+        return build_prompt(expected, actual, template, question).text
 
-        return active_template.format(expected=expected, actual=actual)
+    def warm_cache(self, expected: str, template: str = None, question: str = None):
+        """
+        Send the static prompt prefix once so later answers to this question hit the provider cache.
+        The call's usage is left in last_usages.
+        """
+        self.backend.last_usage = None
+        self.backend.generate_score(build_prompt(expected, '', template, question).text)
+        self.llm_calls += 1
+        self.last_usages = self.backend.call_usages()
 
-    def evaluate_result(self, expected: str, actual: str, template: str = None) -> float:
-        prompt = self.prepare_prompt(expected, actual, template)
-        score = self.backend.generate_score(prompt)
+    def evaluate_result(self, expected: str, actual: str, template: str = None, question: str = None) -> float:
+        prompt = self.prepare_prompt(expected, actual, template, question)
+        start = time.perf_counter()
+        self.backend.last_usage = None
+        with metrics.GRADING_STAGE_SECONDS.time(stage='llm_call'):
+            score = self.backend.generate_score(prompt)
+        self.llm_seconds += time.perf_counter() - start
+        self.llm_calls += 1
+        self.last_usage = self.backend.last_usage
+        self.last_usages = self.backend.call_usages()
+        self.last_usage_provider = self.backend.last_provider or self.backend.provider
+
+        if score is None:
+            metrics.LLM_NONE_SCORES_TOTAL.inc(provider=self.backend.provider)
+        else:
+            self.last_provider = self.backend.last_provider or self.backend.provider
         return score
 
 
-class GradingFactory:
-    @staticmethod
-    def get_grader() -> BaseGrader:
-        engine = getattr(settings, 'GRADING_ENGINE')
-        if engine == 'LLM':
-            return LLMGrader()
+# Add engines with the GRADING_ENGINES setting or the "assessment_engine.grading_engines" entry point group.
+# An engine subclasses BaseGrader and implements evaluate_result(expected, actual, template=None,
+# question=None) -> score between 0.0 and 1.0, or None to leave the answer ungraded. The `question`
+# keyword is optional: engines written without it are still called, with expected, actual and template.
+grader_registry = LazyRegistry(
+    kind='grading engine',
+    setting='GRADING_ENGINES',
+    entry_point_group='assessment_engine.grading_engines',
+    defaults={
+        'MOCK': 'assessments.services.MockGrader',
+        'LLM': 'assessments.services.LLMGrader',
+    },
+)
 
-        return MockGrader()
+
+def get_grader(engine: str = None) -> BaseGrader:
+    engine = engine or getattr(settings, 'GRADING_ENGINE', '')
+    return grader_registry.get(engine, default='MOCK')()
 
 
 class GradingService:
 
     @staticmethod
-    def grade_submission(submission: Submission):
-        grader = GradingFactory.get_grader()
-        total_score = 0.0
-        
+    def grade_submission(submission: Submission, grader: BaseGrader = None):
+        grader = grader or get_grader()
+
         # Prefetch questions to optimize access if not already done
-        answers = submission.answers.select_related('question', 'selected_option').all()
+        with metrics.GRADING_STAGE_SECONDS.time(stage='db_load'):
+            answers = list(submission.answers.select_related('question', 'selected_option').all())
+            question_count = submission.exam.questions.count()
+
+        graded, tokens = GradingService.score_answers(submission, answers, grader)
+        total_score = sum(answer.score for answer in answers if answer.score is not None)
+        GradingService.apply_totals(submission, total_score, len(answers), question_count)
+
+        with metrics.GRADING_STAGE_SECONDS.time(stage='persistence'):
+            StudentAnswer.objects.bulk_update(graded, ['score', 'graded_by', 'updated_at'])
+            submission.save()
+            TokenUsageService.record(submission.exam_id, tokens)
 
+    @staticmethod
+    def score_answers(submission: Submission, answers: list, grader: BaseGrader) -> tuple:
+        """Score answers in place, returning the answers that got a score and the tally of their LLM tokens."""
+        graded, calls = [], []
+        llm_calls = grader.llm_calls
         for answer in answers:
             question = answer.question
             score = 0.0
 
-            if question.question_type == 'MCQ':
-                if answer.selected_option and (
-                    question.expected_answer == str(answer.id) or # supporting ID match or
-                    answer.selected_option.is_correct
-                ):
-                    score = 1.0
-            elif question.question_type == 'SHORT':
-                # Use exam's prompt template if available
-                template = submission.exam.grading_prompt
-                score = grader.grade(question.expected_answer, answer.short_answer_text or "", template=template)
+            with metrics.GRADING_STAGE_SECONDS.time(stage='grade_answer'):
+                if question.question_type == 'MCQ':
+                    if answer.selected_option and (
+                        question.expected_answer == str(answer.id) or # supporting ID match or
+                        answer.selected_option.is_correct
+                    ):
+                        score = 1.0
+                elif question.question_type == 'SHORT':
+                    # Use exam's prompt template if available
+                    template = submission.exam.grading_prompt
+                    score = grader.grade(
+                        question.expected_answer, answer.short_answer_text or "",
+                        template=template, question=question.text
+                    )
+                    calls.append((question.id, grader.last_usages, score is not None))
 
             if score is not None:
                 answer.score = score
-                answer.save()
+                answer.graded_by = (grader.last_provider or grader.engine) if question.question_type == 'SHORT' else ''
+                answer.updated_at = timezone.now()
+                graded.append(answer)
+        record_llm_calls(grader.llm_calls - llm_calls)
 
-            if answer.score is not None:
-                total_score += answer.score
+        # Hedged calls that lost may still be running; their tokens count too
+        settle_calls(grader)
+        tokens = TokenTally()
+        for question_id, usages, scored in calls:
+            for index, (provider, usage) in enumerate(list(usages)):
+                tokens.add(question_id, provider, usage, scored and index == 0)
+        return graded, tokens
 
-        question_count = submission.exam.questions.count()
+    @staticmethod
+    def apply_totals(submission: Submission, total_score: float, answer_count: int, question_count: int):
         submission.total_score = total_score
         submission.grade = (total_score / question_count) * 100 if question_count > 0 else 0.0
-        
-        if answers.count() == question_count:
+
+        if answer_count == question_count:
             submission.is_completed = True
             submission.completed_at = timezone.now()
 
-        submission.save()
+    @staticmethod
+    def part_ranges(submission: Submission) -> Optional[list]:
+        """
+        [(first question id, last question id)] ranges of GRADING_SPLIT_CHUNK_SIZE answers each, when the
+        submission has at least GRADING_SPLIT_MIN_SHORT_ANSWERS short answers; None to grade it in one task.
+        """
+        threshold = getattr(settings, 'GRADING_SPLIT_MIN_SHORT_ANSWERS', 0)
+        if not threshold:
+            return None
+        questions = list(
+            submission.answers.order_by('question_id').values_list('question_id', 'question__question_type')
+        )
+        if sum(question_type == 'SHORT' for _, question_type in questions) < threshold:
+            return None
+
+        size = getattr(settings, 'GRADING_SPLIT_CHUNK_SIZE', 25)
+        chunks = [questions[start:start + size] for start in range(0, len(questions), size)]
+        return [(chunk[0][0], chunk[-1][0]) for chunk in chunks]
+
+    @staticmethod
+    def grade_part(submission: Submission, first_question_id: int, last_question_id: int, grader: BaseGrader) -> int:
+        """Score and save the answers to one question range, returning how many got a score."""
+        with metrics.GRADING_STAGE_SECONDS.time(stage='db_load'):
+            answers = list(submission.answers.select_related('question', 'selected_option').filter(
+                question_id__gte=first_question_id, question_id__lte=last_question_id
+            ))
+
+        graded, tokens = GradingService.score_answers(submission, answers, grader)
+        with metrics.GRADING_STAGE_SECONDS.time(stage='persistence'):
+            StudentAnswer.objects.bulk_update(graded, ['score', 'graded_by', 'updated_at'])
+            TokenUsageService.record(submission.exam_id, tokens)
+        return len(graded)
+
+    @staticmethod
+    def finalize(submission: Submission):
+        """Total the scores the parts saved, and complete the submission."""
+        with metrics.GRADING_STAGE_SECONDS.time(stage='db_load'):
+            totals = submission.answers.aggregate(total_score=Sum('score'), answers=Count('id'))
+            question_count = submission.exam.questions.count()
+
+        GradingService.apply_totals(submission, totals['total_score'] or 0.0, totals['answers'], question_count)
+        with metrics.GRADING_STAGE_SECONDS.time(stage='persistence'):
+            submission.save()
+
+    @staticmethod
+    def progress(submission: Submission) -> dict:
+        counts = submission.answers.aggregate(answers=Count('id'), graded_answers=Count('score'))
+        return {'id': submission.id, 'is_completed': submission.is_completed, **counts}
+
+
+def settle_calls(grader: BaseGrader):
+    """Wait for the LLM calls of grader still running in the background, so their tokens are counted."""
+    backend = getattr(grader, 'backend', None)
+    if backend is not None:
+        backend.settle()
+
+
+def percentile(ordered: list, fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def warm_prompt_cache(exam: Exam, grader: BaseGrader) -> int:
+    """
+    Prime the provider prompt cache with each short-answer question's static prefix before a
+    bulk grading run. Returns the number of questions warmed (0 for graders without a cache).
+    The warm-up tokens are recorded under each question, as calls that scored no answer.
+    """
+    if not hasattr(grader, 'warm_cache'):
+        return 0
+
+    calls, llm_calls = [], grader.llm_calls
+    for question in exam.questions.filter(question_type='SHORT'):
+        grader.warm_cache(question.expected_answer, template=exam.grading_prompt, question=question.text)
+        calls.append((question.id, grader.last_usages))
+    record_llm_calls(grader.llm_calls - llm_calls)
+
+    settle_calls(grader)
+    tokens = TokenTally()
+    for question_id, usages in calls:
+        for provider, usage in list(usages):
+            tokens.add(question_id, provider, usage, scored=False)
+    TokenUsageService.record(exam.pk, tokens)
+    return len(calls)
+
+
+class GradingLatencyService:
+
+    @staticmethod
+    @use_replica()
+    def report(since, until=None, exam_id: int = None, engine: str = None) -> list:
+        """
+        p50/p95/p99 of enqueue-to-completion latency per exam and engine for successful
+        grading runs completed in [since, until).
+        """
+        runs = GradingRun.objects.filter(completed_at__gte=since, succeeded=True)
+        if until:
+            runs = runs.filter(completed_at__lt=until)
+        if exam_id:
+            runs = runs.filter(exam_id=exam_id)
+        if engine:
+            runs = runs.filter(engine=engine)
+
+        groups = {}
+        rows = runs.values_list(
+            'exam_id', 'exam__title', 'engine', 'enqueued_at', 'started_at', 'completed_at', 'llm_seconds'
+        )
+        for exam_id, title, engine, enqueued_at, started_at, completed_at, llm_seconds in rows.iterator():
+            group = groups.setdefault((exam_id, engine), {'exam_title': title, 'latency': [], 'llm': []})
+            group['latency'].append((completed_at - (enqueued_at or started_at)).total_seconds())
+            group['llm'].append(llm_seconds)
+
+        report = []
+        for (exam_id, engine), group in sorted(groups.items()):
+            latency = sorted(group['latency'])
+            report.append({
+                'exam': exam_id,
+                'exam_title': group['exam_title'],
+                'engine': engine,
+                'runs': len(latency),
+                'p50': percentile(latency, 0.50),
+                'p95': percentile(latency, 0.95),
+                'p99': percentile(latency, 0.99),
+                'mean_llm_seconds': sum(group['llm']) / len(group['llm']),
+            })
+        return report
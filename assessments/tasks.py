@@ -1,21 +1,174 @@
 import logging
-from celery import shared_task
-from assessments.models import Submission
-from assessments.services import GradingService
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from assessments.events import publish_graded
+from assessments.models import GradingRun, Submission
+from assessments.services import GradingService, get_grader
+from assessments.usage import budgeted_grader
+from helpers import metrics
+from helpers.query_budget import query_budget
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def grade_submission_task(submission_id):
+
+def record_grading_run(request, submission, grader, enqueued_at, started_at, succeeded, engine=None, llm_seconds=None):
+    GradingRun.objects.create(
+        submission_id=submission.id,
+        exam_id=submission.exam_id,
+        task_id=request.id or '',
+        attempt=request.retries or 0,
+        engine=engine if engine is not None else grader.engine or '',
+        enqueued_at=datetime.fromtimestamp(enqueued_at, tz=dt_timezone.utc) if enqueued_at else None,
+        started_at=started_at,
+        completed_at=timezone.now(),
+        llm_seconds=llm_seconds if llm_seconds is not None else grader.llm_seconds,
+        succeeded=succeeded,
+    )
+
+
+@shared_task(bind=True)
+@query_budget(max_queries=10, max_duplicates=0)
+def grade_submission_task(self, submission_id, enqueued_at=None):
+    started_at = timezone.now()
+    if enqueued_at is not None:
+        metrics.GRADING_QUEUE_WAIT_SECONDS.observe(max(time.time() - enqueued_at, 0.0))
+
     try:
-        submission = Submission.objects.get(id=submission_id)
-        logger.info(f"Starting grading for submission {submission_id}")
-        GradingService.grade_submission(submission)
-        logger.info(f"Successfully graded submission {submission_id}")
-        return True
+        with metrics.GRADING_STAGE_SECONDS.time(stage='db_load'):
+            submission = Submission.objects.select_related('exam').get(id=submission_id)
     except Submission.DoesNotExist:
         logger.error(f"Submission {submission_id} not found during grading task.")
         return False
+
+    grader = budgeted_grader(submission.exam, get_grader())
+    if grader is None:
+        logger.warning(f"Token budget of exam {submission.exam_id} is spent; submission {submission_id} left ungraded.")
+        publish_graded(submission, paused=True)
+        return False
+
+    ranges = GradingService.part_ranges(submission)
+    if ranges:
+        # The parts look up their own grader, so a budget spent halfway pauses the rest
+        logger.info(f"Grading submission {submission_id} in {len(ranges)} parts")
+        chord(
+            grade_submission_part_task.s(submission_id, first, last) for first, last in ranges
+        )(finalize_submission_grading_task.s(submission_id, enqueued_at, started_at.timestamp()).on_error(
+            fail_submission_grading_task.s(submission_id, enqueued_at, started_at.timestamp())
+        ))
+        return True
+
+    try:
+        logger.info(f"Starting grading for submission {submission_id}")
+        GradingService.grade_submission(submission, grader=grader)
+        logger.info(f"Successfully graded submission {submission_id}")
     except Exception as e:
         logger.error(f"Error grading submission {submission_id}: {e}")
+        record_grading_run(self.request, submission, grader, enqueued_at, started_at, succeeded=False)
         raise e
+
+    record_grading_run(self.request, submission, grader, enqueued_at, started_at, succeeded=True)
+    publish_graded(submission)
+    return True
+
+
+@shared_task(
+    bind=True, autoretry_for=(Exception,), retry_backoff=True,
+    max_retries=getattr(settings, 'GRADING_PART_MAX_RETRIES', 3),
+)
+@query_budget(max_queries=8, max_duplicates=0)
+def grade_submission_part_task(self, submission_id, first_question_id, last_question_id):
+    """
+    Chord part of a split submission: grade the answers to questions first_question_id..last_question_id.
+    A failed part is retried on its own; the answers other parts saved are left as they are.
+    """
+    started_at = timezone.now()
+    submission = Submission.objects.select_related('exam').filter(id=submission_id).first()
+    if submission is None:
+        logger.error(f"Submission {submission_id} not found during grading task.")
+        return {'graded': 0, 'paused': False, 'engine': '', 'llm_seconds': 0.0}
+
+    grader = budgeted_grader(submission.exam, get_grader())
+    if grader is None:
+        return {'graded': 0, 'paused': True, 'engine': '', 'llm_seconds': 0.0}
+
+    try:
+        graded = GradingService.grade_part(submission, first_question_id, last_question_id, grader)
+    except Exception as e:
+        logger.error(f"Error grading questions {first_question_id}-{last_question_id} of submission {submission_id}: {e}")
+        record_grading_run(self.request, submission, grader, None, started_at, succeeded=False)
+        metrics.GRADING_PARTS_TOTAL.inc(outcome='failed')
+        raise e
+
+    metrics.GRADING_PARTS_TOTAL.inc(outcome='graded')
+    return {'graded': graded, 'paused': False, 'engine': grader.engine or '', 'llm_seconds': grader.llm_seconds}
+
+
+@shared_task(bind=True)
+@query_budget(max_queries=8, max_duplicates=0)
+def finalize_submission_grading_task(self, parts, submission_id, enqueued_at=None, started_at=None):
+    """Chord callback of a split submission: total the parts' scores once all of them finished."""
+    try:
+        submission = Submission.objects.select_related('exam').get(id=submission_id)
+    except Submission.DoesNotExist:
+        logger.error(f"Submission {submission_id} not found during grading task.")
+        return False
+
+    if any(part['paused'] for part in parts):
+        logger.warning(f"Token budget of exam {submission.exam_id} is spent; submission {submission_id} left ungraded.")
+        publish_graded(submission, paused=True)
+        return False
+
+    GradingService.finalize(submission)
+    engines = sorted({part['engine'] for part in parts if part['engine']})
+    record_grading_run(
+        self.request, submission, None, enqueued_at,
+        datetime.fromtimestamp(started_at, tz=dt_timezone.utc) if started_at else timezone.now(),
+        succeeded=True, engine=','.join(engines)[:32], llm_seconds=sum(part['llm_seconds'] for part in parts),
+    )
+    logger.info(f"Successfully graded submission {submission_id} in {len(parts)} parts")
+    publish_graded(submission)
+    return True
+
+
+@shared_task
+@query_budget(max_queries=8, max_duplicates=0)
+def fail_submission_grading_task(request, exc, traceback, submission_id, enqueued_at=None, started_at=None):
+    """
+    Errback of a split submission's chord, called when a part failed for good (retries exhausted,
+    worker lost) and the callback will never run. Like a failed unsplit grading, it records a failed
+    run and leaves the submission open, keeping the scores the other parts saved, so `regrade_exam`
+    can grade it again; waiting clients get a failed event instead of a grade.
+    """
+    submission = Submission.objects.select_related('exam').filter(id=submission_id).first()
+    if submission is None:
+        logger.error(f"Submission {submission_id} not found during grading task.")
+        return False
+
+    logger.error(f"Grading submission {submission_id} in parts failed: {exc!r}")
+    record_grading_run(
+        request, submission, None, enqueued_at,
+        datetime.fromtimestamp(started_at, tz=dt_timezone.utc) if started_at else timezone.now(),
+        succeeded=False, engine='', llm_seconds=0.0,
+    )
+    publish_graded(submission, failed=True)
+    return False
+
+
+@shared_task
+def finalize_expired_submissions():
+    """Periodic (CELERY_BEAT_SCHEDULE): close submissions left open past their exam's duration."""
+    # Imported here: assessments.expiry enqueues grade_submission_task from this module
+    from assessments.expiry import ExpiredSubmissionSweeper
+    return ExpiredSubmissionSweeper().sweep()
+
+
+@shared_task
+def archive_submissions():
+    """Periodic (CELERY_BEAT_SCHEDULE): move old completed and soft-deleted submissions to the archive."""
+    from assessments.archive import SubmissionArchiver
+    return SubmissionArchiver().run()
@@ -1,11 +1,65 @@
+import asyncio
+import gzip
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
 from datetime import timedelta
-from django.test import TestCase, override_settings
-from django.contrib.auth.models import User
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import call, patch
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth.models import Group, Permission, User
 from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Exam, Question, QuestionOption, Submission
-from .services import MockGrader
+from rest_framework.authtoken.models import Token
+from helpers import authentication, metrics
+from helpers.admin import EstimatedCountPaginator
+from helpers.db_router import ReplicaRouter
+from helpers.renderers import FastJSONRenderer
+from helpers.streams import InMemoryStream, StreamError
+from helpers.llm_backends import (
+    GeminiBackend, LLMBackend, OpenAIBackend, RoutingBackend, backend_registry, stub_score
+)
+from helpers.llm_stub import StubBehaviour, make_server
+from helpers.query_budget import (
+    QueryBudgetExceeded, QueryBudgetTestMixin, QueryRecorder, check_budget, fingerprint
+)
+from .archive import SubmissionArchiver
+from .autoscale import (
+    GradingAutoscaler, GradingScalingSignal, QueueProbeError, SimulatedQueue, llm_calls_per_minute, recommend_workers,
+    record_llm_calls
+)
+from .buffer import SubmissionBuffer
+from .events import publish_graded
+from .expiry import ExpiredSubmissionSweeper
+from .ingest import AnswerKey
+from .models import (
+    ArchivedSubmission, Exam, GradingRun, Question, QuestionOption, Submission, StudentAnswer, TokenUsage
+)
+from .prompts import GRADING_INSTRUCTIONS, build_prompt, rubric_from_template
+from .serializers import ExamDetailSerializer, ExamSerializer, SubmissionDetailSerializer, SubmissionSerializer
+from .services import BaseGrader, GradingLatencyService, GradingService, MockGrader, get_grader, warm_prompt_cache
+from .tasks import (
+    fail_submission_grading_task, finalize_expired_submissions, finalize_submission_grading_task,
+    grade_submission_part_task, grade_submission_task,
+)
+from .usage import TokenUsageService
+from .views import SubmissionEventsView
 
 
 class AuthTestCase(TestCase):
@@ -91,3 +145,1571 @@ class SubmissionTestCase(TestCase):
         self.assertEqual(submission.grade, 100.0)
         # Check total score
         self.assertEqual(submission.total_score, 2.0)
+
+
+class BenchmarkTestCase(TestCase):
+    def run_benchmarks(self, *args):
+        out = StringIO()
+        call_command('run_benchmarks', *args, '--repeat', '1', stdout=out, stderr=StringIO())
+        return json.loads(out.getvalue())
+
+    def test_grader_suite(self):
+        report = self.run_benchmarks('--suite', 'grader', '--answer-lengths', '5', '--batch-sizes', '1,2')
+        self.assertIn('environment', report)
+        self.assertEqual(len(report['results']['grader']), 2)
+        self.assertEqual(report['results']['grader'][1]['batch_size'], 2)
+
+    def test_pipeline_and_api_suites_roll_back(self):
+        report = self.run_benchmarks('--suite', 'pipeline', '--suite', 'api', '--exam-sizes', '4')
+        self.assertGreater(report['results']['pipeline'][0]['queries'], 0)
+        self.assertIn('median', report['results']['api'][0]['submission_create_seconds'])
+        self.assertFalse(Exam.objects.filter(course="BENCH").exists())
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.client = APIClient()
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_record_nothing(self):
+        MockGrader().grade("same", "same")
+        self.assertIs(metrics.GRADING_STAGE_SECONDS.time(stage='db_load'), metrics.NULL_TIMER)
+        self.assertEqual(metrics.GRADING_EXACT_MATCH_TOTAL.value(), 0)
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(METRICS_ENABLED=True, GRADING_ENGINE='LLM', LLM_PROVIDER='STUB', CELERY_TASK_ALWAYS_EAGER=True)
+    def test_grading_records_stage_timings_and_tokens(self):
+        user = User.objects.create_user(username='student', password='password')
+        exam = Exam.objects.create(title="Metrics Exam", duration=timedelta(hours=1), course="CS101")
+        question = Question.objects.create(exam=exam, text="Define AI.", question_type="SHORT", expected_answer="AI")
+        submission = Submission.objects.create(student=user, exam=exam, started_at=timezone.now())
+        StudentAnswer.objects.create(submission=submission, question=question, short_answer_text="Machines thinking")
+
+        grade_submission_task(submission.id, enqueued_at=time.time())
+
+        for stage in ('db_load', 'grade_answer', 'llm_call', 'persistence'):
+            self.assertGreater(metrics.GRADING_STAGE_SECONDS.count(stage=stage), 0, stage)
+        self.assertEqual(metrics.GRADING_QUEUE_WAIT_SECONDS.count(), 1)
+        self.assertGreater(metrics.LLM_TOKENS_TOTAL.value(provider='STUB', kind='prompt'), 0)
+
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'grading_stage_seconds_bucket{stage="llm_call",le="+Inf"} 1', response.content)
+
+
+@override_settings(GRADING_ENGINE='MOCK', CELERY_TASK_ALWAYS_EAGER=True)
+class GradingLatencyTestCase(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user(username='student', password='password')
+        self.exam = Exam.objects.create(title="Latency Exam", duration=timedelta(hours=1), course="CS101")
+        self.question = Question.objects.create(
+            exam=self.exam, text="Define AI.", question_type="SHORT", expected_answer="AI"
+        )
+
+    def test_task_records_grading_run(self):
+        submission = Submission.objects.create(student=self.student, exam=self.exam, started_at=timezone.now())
+        StudentAnswer.objects.create(submission=submission, question=self.question, short_answer_text="AI")
+
+        grade_submission_task(submission.id, enqueued_at=time.time() - 5)
+
+        run = GradingRun.objects.get(submission=submission)
+        self.assertTrue(run.succeeded)
+        self.assertEqual(run.engine, 'MOCK')
+        self.assertEqual(run.exam, self.exam)
+        self.assertGreaterEqual(run.latency, 5)
+
+    def test_report_endpoint_percentiles(self):
+        now = timezone.now()
+        for index in range(1, 101):
+            student = User.objects.create_user(username=f'student_{index}')
+            submission = Submission.objects.create(student=student, exam=self.exam, started_at=now)
+            GradingRun.objects.create(
+                submission=submission, exam=self.exam, engine='MOCK',
+                enqueued_at=now - timedelta(seconds=index), started_at=now, completed_at=now
+            )
+
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+        self.assertEqual(client.get('/api/reports/grading-latency/').status_code, status.HTTP_403_FORBIDDEN)
+
+        client.force_authenticate(user=User.objects.create_superuser(username='admin', password='password'))
+        response = client.get('/api/reports/grading-latency/', {'exam': self.exam.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        row = response.data[0]
+        self.assertEqual((row['runs'], row['p50'], row['p95'], row['p99']), (100, 50.0, 95.0, 99.0))
+
+
+@override_settings(
+    QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_ENFORCE=True, GRADING_ENGINE='MOCK', CELERY_TASK_ALWAYS_EAGER=True
+)
+class QueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+        self.exam = Exam.objects.create(title="Budget Exam", duration=timedelta(hours=1), course="CS101")
+        self.answers = []
+        for index in range(10):
+            if index % 2:
+                question = Question.objects.create(
+                    exam=self.exam, text=f"Q{index}", question_type="SHORT", expected_answer="An answer"
+                )
+                self.answers.append({"question": question.id, "short_answer_text": f"Answer {index}"})
+            else:
+                question = Question.objects.create(
+                    exam=self.exam, text=f"Q{index}", question_type="MCQ", expected_answer="A"
+                )
+                options = [QuestionOption.objects.create(question=question, text=text) for text in "AB"]
+                self.answers.append({"question": question.id, "selected_option": options[0].id})
+
+    def test_exam_endpoints_within_budget(self):
+        for url in ('/api/exams/', f'/api/exams/{self.exam.id}/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(int(response['X-Query-Count']), 5)
+
+    async def test_queries_are_counted_under_asgi(self):
+        response = await self.async_client.get(
+            f'/api/exams/{self.exam.id}/', headers={'Authorization': self.client._credentials['HTTP_AUTHORIZATION']}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(0 < int(response['X-Query-Count']) <= 5)
+
+    def test_submission_endpoints_do_not_scale_with_answers(self):
+        data = {"exam": self.exam.id, "answers": self.answers, "started_at": timezone.now()}
+        response = self.client.post('/api/submissions/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['answers']), 10)
+
+        for url in ('/api/submissions/', f"/api/submissions/{response.data['id']}/"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(int(response['X-Query-Count']), 6)
+
+    def test_grading_task_query_count_is_constant(self):
+        submission = Submission.objects.create(student=self.user, exam=self.exam, started_at=timezone.now())
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(
+                submission=submission,
+                question_id=answer['question'],
+                selected_option_id=answer.get('selected_option'),
+                short_answer_text=answer.get('short_answer_text'),
+            )
+            for answer in self.answers
+        ])
+        with self.assertQueryBudget(10):
+            grade_submission_task(submission.id)
+
+    def test_repeated_queries_exceed_budget(self):
+        for index in range(3):
+            Submission.objects.create(
+                student=User.objects.create_user(username=f'other_{index}'), exam=self.exam, started_at=timezone.now()
+            )
+        with QueryRecorder() as recorder:
+            [str(submission) for submission in Submission.objects.all()]
+
+        self.assertEqual(len(recorder.duplicates()), 2)
+        with self.assertRaises(QueryBudgetExceeded):
+            check_budget(recorder, 'submission __str__', max_duplicates=0)
+
+    def test_fingerprint_ignores_parameters(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'x'"),
+            fingerprint("SELECT *  FROM t WHERE id = 22 AND name = 'y'"),
+        )
+        self.assertEqual(fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3)"), "SELECT * FROM t WHERE id IN (...)")
+
+
+class FixedGrader(BaseGrader):
+    engine = 'FIXED'
+
+    def evaluate_result(self, expected, actual, template=None, question=None):
+        return 0.25
+
+
+class LegacyGrader(BaseGrader):
+    engine = 'LEGACY'
+
+    def evaluate_result(self, expected, actual, template=None):
+        return 0.75
+
+
+class RegistryTestCase(TestCase):
+    @override_settings(GRADING_ENGINES={'fixed': 'assessments.tests.FixedGrader'}, GRADING_ENGINE='FIXED')
+    def test_engine_registered_through_settings(self):
+        grader = get_grader()
+        self.assertIsInstance(grader, FixedGrader)
+        self.assertEqual(grader.grade("a b", "c d"), 0.25)
+
+    @override_settings(GRADING_ENGINES={'legacy': 'assessments.tests.LegacyGrader'}, GRADING_ENGINE='LEGACY')
+    def test_engine_without_question_parameter_is_still_called(self):
+        self.assertEqual(get_grader().grade("a b", "c d", question="Define AI."), 0.75)
+
+    @override_settings(GRADING_ENGINE='UNKNOWN')
+    def test_unknown_engine_falls_back_to_mock(self):
+        self.assertIsInstance(get_grader(), MockGrader)
+
+    def test_unknown_backend_without_default_is_an_error(self):
+        with self.assertRaises(ImproperlyConfigured):
+            backend_registry.get('UNKNOWN')
+
+    def test_startup_does_not_import_grading_dependencies(self):
+        script = (
+            "import sys, django; django.setup(); "
+            "import assessments.tasks, main.urls; "
+            "print(','.join(m for m in ('sklearn', 'openai', 'google.genai') if m in sys.modules))"
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'main.settings'},
+        )
+        self.assertEqual(output.stdout.strip(), '')
+
+
+class RecordingBackend(LLMBackend):
+    provider = 'RECORDING'
+    prompts = []
+
+    def generate_score(self, prompt):
+        self.prompts.append(prompt)
+        return 0.5
+
+
+class PromptTestCase(TestCase):
+    def test_student_answer_is_the_only_varying_suffix(self):
+        first = build_prompt("Expected text", "First student", template="Be strict.", question="Define AI.")
+        second = build_prompt("Expected text", "Second student", template="Be strict.", question="Define AI.")
+
+        self.assertEqual(first.prefix, second.prefix)
+        self.assertTrue(first.text.startswith(GRADING_INSTRUCTIONS))
+        self.assertLess(first.prefix.index("Be strict."), first.prefix.index("Define AI."))
+        self.assertLess(first.prefix.index("Define AI."), first.prefix.index("Expected text"))
+        self.assertTrue(first.suffix.startswith("First student"))
+
+    def test_legacy_template_placeholders_move_to_the_end(self):
+        template = (
+            "Grade the student's answer based on the expected answer. \n"
+            "Compare {actual} with {expected} for meaning.\n"
+            "Expected Answer: {expected}\nStudent Answer: {actual}\nScore 0.0-1.0:"
+        )
+        self.assertEqual(
+            rubric_from_template(template), "Compare the student's answer with the expected answer for meaning."
+        )
+        self.assertNotIn("{", build_prompt("a", "b", template=template).text)
+
+    def test_openai_cached_tokens_are_recorded(self):
+        usage = SimpleNamespace(
+            prompt_tokens=1200, completion_tokens=3, prompt_tokens_details=SimpleNamespace(cached_tokens=1024)
+        )
+        response = SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=SimpleNamespace(content="0.8"))])
+        backend = OpenAIBackend()
+        backend.client = SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: response))
+        )
+        backend.model_name = 'test-model'
+
+        self.assertEqual(backend.generate_score("prompt"), 0.8)
+        self.assertEqual(backend.last_usage, {'prompt_tokens': 1200, 'cached_tokens': 1024, 'completion_tokens': 3})
+
+    @override_settings(
+        GRADING_ENGINE='LLM', LLM_PROVIDER='RECORDING', CELERY_TASK_ALWAYS_EAGER=True,
+        LLM_BACKENDS={'RECORDING': 'assessments.tests.RecordingBackend'},
+    )
+    def test_regrade_warms_each_question_prefix_first(self):
+        RecordingBackend.prompts = []
+        exam = Exam.objects.create(title="Regrade", duration=timedelta(hours=1), course="CS101")
+        question = Question.objects.create(exam=exam, text="Define AI.", question_type="SHORT", expected_answer="AI")
+        for index in range(2):
+            submission = Submission.objects.create(
+                student=User.objects.create_user(username=f'student_{index}'), exam=exam, started_at=timezone.now()
+            )
+            StudentAnswer.objects.create(submission=submission, question=question, short_answer_text=f"Answer {index}")
+
+        call_command('regrade_exam', exam.id, stdout=StringIO())
+
+        prefix = build_prompt("AI", "", exam.grading_prompt, "Define AI.").prefix
+        self.assertEqual(len(RecordingBackend.prompts), 3)
+        self.assertTrue(all(prompt.startswith(prefix) for prompt in RecordingBackend.prompts))
+        self.assertEqual(Submission.objects.filter(exam=exam, total_score=0.5).count(), 2)
+
+
+class SlowBackend(LLMBackend):
+    provider = 'SLOW'
+
+    def generate_score(self, prompt):
+        time.sleep(0.5)
+        self.record_usage(20, 1)
+        return 0.1
+
+
+class FastBackend(LLMBackend):
+    provider = 'FAST'
+
+    def generate_score(self, prompt):
+        self.record_usage(10, 1)
+        return 0.9
+
+
+class FailingBackend(LLMBackend):
+    provider = 'FAILING'
+
+    def generate_score(self, prompt):
+        return None
+
+
+@override_settings(LLM_BACKENDS={
+    'SLOW': 'assessments.tests.SlowBackend',
+    'FAST': 'assessments.tests.FastBackend',
+    'FAILING': 'assessments.tests.FailingBackend',
+})
+class RoutingBackendTestCase(TestCase):
+    def setUp(self):
+        RoutingBackend.stats = {}
+
+    def test_hedged_request_answers_from_the_faster_provider(self):
+        backend = RoutingBackend(providers=['SLOW', 'FAST'], hedge_delay=0.05)
+        start = time.perf_counter()
+        self.assertEqual(backend.generate_score("prompt"), 0.9)
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(backend.last_provider, 'FAST')
+        self.assertEqual(backend.call_usages(), [('FAST', {'prompt_tokens': 10, 'cached_tokens': 0, 'completion_tokens': 1})])
+
+        # The losing call still spent tokens, and reports them once the backend settles
+        backend.settle()
+        self.assertEqual([provider for provider, _ in backend.call_usages()], ['FAST', 'SLOW'])
+
+    def test_settle_gives_up_on_calls_past_the_timeout(self):
+        backend = RoutingBackend(providers=['SLOW', 'FAST'], hedge_delay=0.05)
+        self.assertEqual(backend.generate_score("prompt"), 0.9)
+        with self.assertLogs('helpers.llm_backends', 'WARNING'):
+            backend.settle(timeout=0.01)
+        self.assertEqual([provider for provider, _ in backend.call_usages()], ['FAST'])
+
+    def test_concurrent_calls_keep_their_own_usage(self):
+        backend = FastBackend()
+        backend.record_usage(10, 1)
+        thread = threading.Thread(target=backend.record_usage, args=(99, 1))
+        thread.start()
+        thread.join()
+        self.assertEqual(backend.last_usage['prompt_tokens'], 10)
+
+    @override_settings(
+        GRADING_ENGINE='LLM', LLM_PROVIDER='ROUTED', LLM_ROUTING_PROVIDERS=['SLOW', 'FAST'], LLM_HEDGE_DELAY=0.05
+    )
+    def test_grading_counts_the_tokens_of_hedged_calls_that_lost(self):
+        user = User.objects.create_user(username='student')
+        exam = Exam.objects.create(title="Routing", duration=timedelta(hours=1), course="CS101")
+        question = Question.objects.create(exam=exam, text="Define AI.", question_type="SHORT", expected_answer="AI")
+        submission = Submission.objects.create(student=user, exam=exam, started_at=timezone.now())
+        StudentAnswer.objects.create(submission=submission, question=question, short_answer_text="Robots")
+
+        GradingService.grade_submission(submission)
+
+        usages = {usage.provider: (usage.calls, usage.answers) for usage in TokenUsage.objects.all()}
+        self.assertEqual(usages, {'FAST': (1, 1), 'SLOW': (1, 0)})
+
+    def test_call_without_usage_reports_no_tokens(self):
+        backend = RoutingBackend(providers=['FAILING'])
+        backend.backends['FAILING'].last_usage = {'prompt_tokens': 5, 'cached_tokens': 0, 'completion_tokens': 1}
+        self.assertIsNone(backend.generate_score("prompt"))
+        self.assertEqual(backend.call_usages(), [])
+
+    def test_routes_to_lowest_latency_and_error_ewma(self):
+        RoutingBackend.stats_for('SLOW').observe(0.5, failed=False)
+        RoutingBackend.stats_for('FAST').observe(0.1, failed=False)
+        self.assertEqual(RoutingBackend(providers=['SLOW', 'FAST']).ranked(), ['FAST', 'SLOW'])
+
+        for _ in range(5):
+            RoutingBackend.stats_for('FAST').observe(0.1, failed=True)
+        self.assertEqual(RoutingBackend(providers=['SLOW', 'FAST']).ranked(), ['SLOW', 'FAST'])
+
+    def test_hedge_delay_uses_recent_p95(self):
+        for index in range(1, 21):
+            RoutingBackend.stats_for('FAST').observe(index / 10, failed=False)
+        self.assertEqual(RoutingBackend(providers=['FAST']).hedge_delay('FAST'), 1.9)
+
+    @override_settings(GRADING_ENGINE='LLM', LLM_PROVIDER='ROUTED', LLM_ROUTING_PROVIDERS=['FAILING', 'FAST'])
+    def test_failed_provider_fails_over_and_score_is_attributed(self):
+        user = User.objects.create_user(username='student')
+        exam = Exam.objects.create(title="Routing", duration=timedelta(hours=1), course="CS101")
+        question = Question.objects.create(exam=exam, text="Define AI.", question_type="SHORT", expected_answer="AI")
+        submission = Submission.objects.create(student=user, exam=exam, started_at=timezone.now())
+        answer = StudentAnswer.objects.create(submission=submission, question=question, short_answer_text="Robots")
+
+        GradingService.grade_submission(submission)
+
+        answer.refresh_from_db()
+        self.assertEqual((answer.score, answer.graded_by), (0.9, 'FAST'))
+
+
+class StubLLMServerTestCase(TestCase):
+    def setUp(self):
+        self.server = make_server(port=0, behaviour=StubBehaviour(latency_ms=5, seed=1))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_openai_backend_against_stub(self):
+        prompt = build_prompt("AI", "Robots", question="Define AI.").text
+        with override_settings(OPENAI_API_KEY='stub', OPENAI_MODEL='stub', OPENAI_BASE_URL=f'{self.base_url}/v1'):
+            backend = OpenAIBackend()
+            self.assertEqual(backend.generate_score(prompt), stub_score(prompt))
+            self.assertEqual(backend.last_usage['cached_tokens'], 0)
+            backend.generate_score(prompt)
+            self.assertGreater(backend.last_usage['cached_tokens'], 0)
+
+    def test_gemini_backend_against_stub(self):
+        with override_settings(GEMINI_API_KEY='stub', GEMINI_MODEL='stub-model', GEMINI_BASE_URL=self.base_url):
+            backend = GeminiBackend()
+            self.assertEqual(backend.generate_score("Grade this"), stub_score("Grade this"))
+            self.assertEqual(backend.last_usage['completion_tokens'], 1)
+
+    def test_rate_limit_injection(self):
+        self.server.RequestHandlerClass.behaviour = StubBehaviour(rate_limit_rate=1.0)
+        request = urllib.request.Request(
+            f'{self.base_url}/v1/chat/completions', data=b'{"messages": []}', method='POST'
+        )
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request)
+        self.assertEqual(error.exception.code, 429)
+
+
+@override_settings(GRADING_ENGINE='MOCK')
+class OfflineGradingTestCase(SimpleTestCase):
+    """SimpleTestCase fails on any database query, so this also checks grading stays offline."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.directory.name, 'answers.jsonl')
+        self.output = os.path.join(self.directory.name, 'scores.jsonl')
+        records = [
+            {"id": "a", "expected": "Python is great", "actual": "Python is great"},
+            {"id": "b", "expected": "Python is great", "actual": "Python is good"},
+            {"id": "c", "expected": "Python is great"},
+            {"id": "d", "expected": "Lists are mutable", "actual": "lists are mutable"},
+        ]
+        with open(self.input, 'w') as input_file:
+            input_file.write('\n'.join(json.dumps(record) for record in records) + '\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_output(self):
+        with open(self.output) as output_file:
+            return [json.loads(line) for line in output_file]
+
+    def test_grades_every_line_in_order(self):
+        call_command('grade_jsonl', self.input, self.output, '--batch-size', '3', '--workers', '2',
+                     stdout=StringIO(), stderr=StringIO())
+
+        results = self.read_output()
+        self.assertEqual([result['line'] for result in results], [1, 2, 3, 4])
+        self.assertEqual(results[0]['score'], 1.0)
+        self.assertTrue(0.0 < results[1]['score'] < 1.0)
+        self.assertIn('Invalid record', results[2]['error'])
+        self.assertEqual(results[3]['graded_by'], 'MOCK')
+
+    def test_resume_continues_after_last_written_line(self):
+        with open(self.output, 'w') as output_file:
+            output_file.write(json.dumps({"line": 2, "id": "b", "score": 0.5}) + '\n')
+
+        call_command('grade_jsonl', self.input, self.output, '--resume', stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual([result['line'] for result in self.read_output()], [2, 3, 4])
+
+    def test_resume_cuts_off_a_partially_written_line(self):
+        with open(self.output, 'w') as output_file:
+            output_file.write(json.dumps({"line": 1, "id": "a", "score": 1.0}) + '\n')
+            output_file.write(json.dumps({"line": 2, "id": "b", "score": 0.5})[:15])
+
+        call_command('grade_jsonl', self.input, self.output, '--resume', stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual([result['line'] for result in self.read_output()], [1, 2, 3, 4])
+
+
+@override_settings(GRADING_ENGINE='MOCK', CELERY_TASK_ALWAYS_EAGER=True)
+class SubmissionIngestTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_user(username='staff', password='pw', is_staff=True))
+        self.students = [User.objects.create_user(username=f'student{i}', password='pw') for i in range(3)]
+
+        self.exam = Exam.objects.create(title="Paper Exam", duration=timedelta(hours=1), course="CS101")
+        self.mcq = Question.objects.create(exam=self.exam, text="2+2?", question_type="MCQ", expected_answer="4")
+        self.correct = QuestionOption.objects.create(question=self.mcq, text="4", is_correct=True)
+        self.short = Question.objects.create(
+            exam=self.exam, text="Define AI.", question_type="SHORT", expected_answer="Artificial Intelligence"
+        )
+        other_exam = Exam.objects.create(title="Other", duration=timedelta(hours=1), course="CS101")
+        self.foreign = Question.objects.create(exam=other_exam, text="?", question_type="SHORT", expected_answer="x")
+
+    def row(self, student, answers=None):
+        return json.dumps({'student': student, 'answers': answers or [
+            {'question': self.mcq.id, 'selected_option': self.correct.id},
+            {'question': self.short.id, 'short_answer_text': 'Artificial Intelligence'},
+        ]})
+
+    def post(self, lines):
+        return self.client.generic(
+            'POST', f'/api/exams/{self.exam.id}/ingest/', '\n'.join(lines) + '\n',
+            content_type='application/x-ndjson'
+        )
+
+    def test_valid_rows_are_saved_and_graded_with_per_line_errors(self):
+        response = self.post([
+            self.row('student0'),
+            'not json',
+            self.row('student1', [{'question': self.foreign.id, 'short_answer_text': 'x'}]),
+            '',
+            self.row('nobody'),
+            self.row('student2'),
+            self.row('student0'),
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['accepted'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']], [2, 3, 5, 7])
+        self.assertIn('does not belong to exam', response.data['errors'][1]['errors'][0])
+        self.assertEqual(response.data['grading_jobs'], 2)
+
+        submissions = Submission.objects.filter(exam=self.exam).order_by('student__username')
+        self.assertEqual([s.student.username for s in submissions], ['student0', 'student2'])
+        self.assertTrue(all(s.is_completed and s.total_score == 2.0 for s in submissions))
+
+    def test_batches_use_a_constant_number_of_queries(self):
+        lines = [self.row(student.username) for student in self.students]
+        # The first post caches the answer key; grading is left out so only the batch is counted
+        with override_settings(CELERY_TASK_ALWAYS_EAGER=False), patch('assessments.ingest.enqueue_grading') as enqueue:
+            enqueue.return_value = 1
+            self.post(lines[:1])
+            Submission.objects.all().delete()
+            with self.assertQueryBudget(8):
+                response = self.post(lines)
+
+        self.assertEqual(response.data['accepted'], 3)
+        self.assertEqual(StudentAnswer.objects.filter(submission__exam=self.exam).count(), 6)
+
+    def test_requires_staff_and_rejects_completed_submissions(self):
+        Submission.objects.create(
+            student=self.students[0], exam=self.exam, started_at=timezone.now(), is_completed=True
+        )
+        response = self.post([self.row('student0')])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('already completed', response.data['errors'][0]['errors'][0])
+
+        self.client.force_authenticate(user=self.students[1])
+        self.assertEqual(self.post([self.row('student1')]).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_answer_key_is_evicted_when_questions_change(self):
+        self.post([self.row('student0')])
+        added = Question.objects.create(exam=self.exam, text="New?", question_type="SHORT", expected_answer="yes")
+
+        response = self.post([self.row('student1', [{'question': added.id, 'short_answer_text': 'yes'}])])
+
+        self.assertEqual(response.data['accepted'], 1)
+
+    def test_boolean_ids_are_rejected(self):
+        response = self.post([self.row('student0', [{'question': True, 'short_answer_text': 'x'}])])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('does not belong to exam', response.data['errors'][0]['errors'][0])
+
+    def test_soft_deleted_submission_is_archived_and_replaced(self):
+        deleted = Submission.objects.create(
+            student=self.students[0], exam=self.exam, started_at=timezone.now(), is_deleted=True, deleted_at=timezone.now()
+        )
+
+        response = self.post([self.row('student0')])
+
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertTrue(ArchivedSubmission.objects.filter(pk=deleted.pk, is_deleted=True).exists())
+        self.assertTrue(Submission.objects.get(student=self.students[0], exam=self.exam).is_completed)
+
+
+@override_settings(EVENT_BUS_BACKEND='memory', GRADING_ENGINE='MOCK', GRADE_EVENTS_TIMEOUT=5.0)
+class GradeEventsTestCase(TestCase):
+    def setUp(self):
+        buses = patch.dict('helpers.events._buses', clear=True)
+        buses.start()
+        self.addCleanup(buses.stop)
+
+        self.user = User.objects.create_user(username='student', password='pw')
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+        exam = Exam.objects.create(title="Exam", duration=timedelta(hours=1), course="CS101")
+        question = Question.objects.create(exam=exam, text="2+2?", question_type="SHORT", expected_answer="4")
+        self.submission = Submission.objects.create(student=self.user, exam=exam, started_at=timezone.now())
+        StudentAnswer.objects.create(submission=self.submission, question=question, short_answer_text="4")
+        self.url = f'/api/submissions/{self.submission.id}/events/'
+
+    async def test_long_poll_returns_when_the_grade_is_published(self):
+        waiter = asyncio.ensure_future(self.async_client.get(self.url, headers=self.headers))
+        await asyncio.sleep(0.1)
+        self.assertFalse(waiter.done())
+
+        await sync_to_async(grade_submission_task)(self.submission.id)
+        response = await asyncio.wait_for(waiter, 2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_score'], 1.0)
+        self.assertTrue(response.json()['is_completed'])
+
+    async def test_event_published_before_subscribing_is_not_missed(self):
+        await sync_to_async(grade_submission_task)(self.submission.id)
+        await Submission.objects.filter(pk=self.submission.id).aupdate(is_completed=False)
+
+        response = await asyncio.wait_for(self.async_client.get(self.url, headers=self.headers), 2)
+        self.assertTrue(response.json()['is_completed'])
+
+    async def test_server_sent_events(self):
+        response = await self.async_client.get(
+            self.url, {'timeout': '0.2'}, headers={**self.headers, 'Accept': 'text/event-stream'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.startswith('event: timeout\ndata: '))
+        self.assertFalse(json.loads(body.split('data: ', 1)[1])['is_completed'])
+
+        await sync_to_async(grade_submission_task)(self.submission.id)
+        response = await self.async_client.get(self.url, headers={**self.headers, 'Accept': 'text/event-stream'})
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.startswith('event: graded\n'))
+
+    async def test_failed_grading_is_streamed_as_failed(self):
+        await sync_to_async(publish_graded)(self.submission, failed=True)
+        response = await self.async_client.get(self.url, headers={**self.headers, 'Accept': 'text/event-stream'})
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.startswith('event: failed\n'))
+        self.assertFalse(json.loads(body.split('data: ', 1)[1])['is_completed'])
+
+    async def test_resubmission_forgets_the_retained_grade(self):
+        question = await Question.objects.acreate(
+            exam_id=self.submission.exam_id, text="3+3?", question_type="SHORT", expected_answer="6"
+        )
+        await sync_to_async(grade_submission_task)(self.submission.id)
+
+        data = {
+            'exam': self.submission.exam_id, 'started_at': timezone.now().isoformat(),
+            'answers': [{'question': question.id, 'short_answer_text': '6'}],
+        }
+        with patch('assessments.serializers.grade_submission_task') as task:
+            response = await self.async_client.post(
+                '/api/submissions/', data, content_type='application/json', headers=self.headers
+            )
+        self.assertEqual(response.status_code, 201)
+        task.delay.assert_called_once()
+
+        response = await self.async_client.get(
+            self.url, {'timeout': '0.2'}, headers={**self.headers, 'Accept': 'text/event-stream'}
+        )
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.startswith('event: timeout\n'))
+
+    def test_timeout_parameter_is_clamped(self):
+        for value, timeout in [('nan', 5.0), ('inf', 5.0), ('-1', 0.0), ('2.5', 2.5), ('soon', 5.0)]:
+            request = SimpleNamespace(GET={'timeout': value})
+            self.assertEqual(SubmissionEventsView.get_timeout(request), timeout)
+
+    async def test_only_the_owner_can_wait(self):
+        other = await sync_to_async(User.objects.create_user)(username='other', password='pw')
+        token = await Token.objects.acreate(user=other)
+
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 401)
+
+
+class ConditionalGetTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.exam = Exam.objects.create(title="Exam", duration=timedelta(hours=1), course="CS101")
+        self.question = Question.objects.create(exam=self.exam, text="2+2?", question_type="MCQ", expected_answer="4")
+        self.options = [QuestionOption.objects.create(question=self.question, text=text) for text in "34"]
+        self.exam_url = f'/api/exams/{self.exam.id}/'
+
+    def test_unchanged_exam_answers_304_with_one_query(self):
+        response = self.client.get(self.exam_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['ETag'].startswith('"'))
+
+        with self.assertQueryBudget(1):
+            cached = self.client.get(self.exam_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(cached.content, b'')
+
+        cached = self.client.get(self.exam_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_child_rows_change_the_exam_etag(self):
+        etags = [self.client.get(self.exam_url)['ETag']]
+
+        self.options[0].text = "5"
+        self.options[0].save()
+        etags.append(self.client.get(self.exam_url)['ETag'])
+
+        self.options[1].delete()
+        etags.append(self.client.get(self.exam_url)['ETag'])
+
+        Question.objects.create(exam=self.exam, text="Why?", question_type="SHORT", expected_answer="Because")
+        response = self.client.get(self.exam_url, HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etags.append(response['ETag'])
+
+        self.assertEqual(len(set(etags)), 4)
+
+    @override_settings(GRADING_ENGINE='MOCK', EVENT_BUS_BACKEND='memory')
+    def test_grading_changes_the_submission_etag(self):
+        submission = Submission.objects.create(student=self.user, exam=self.exam, started_at=timezone.now())
+        StudentAnswer.objects.create(submission=submission, question=self.question, selected_option=self.options[1])
+        url = f'/api/submissions/{submission.id}/'
+
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        grade_submission_task(submission.id)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_completed'])
+
+        other = User.objects.create_user(username='other', password='pw')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica_0'], GRADING_ENGINE='MOCK', CELERY_TASK_ALWAYS_EAGER=True, EVENT_BUS_BACKEND='memory'
+)
+class ReplicaRoutingTestCase(TestCase):
+    """The test database has no replica, so reads are recorded with the alias the router picked and run on default."""
+
+    def setUp(self):
+        cache.clear()
+        self.routed = []
+        route = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            self.routed.append(route(router, model, **hints))
+            return None
+
+        patcher = patch.object(ReplicaRouter, 'db_for_read', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(username='student', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.exam = Exam.objects.create(title="Exam", duration=timedelta(hours=1), course="CS101")
+        self.question = Question.objects.create(exam=self.exam, text="Why?", question_type="SHORT", expected_answer="x")
+        self.routed.clear()
+
+    def test_read_only_actions_use_a_replica(self):
+        self.client.get('/api/exams/')
+        self.client.get(f'/api/exams/{self.exam.id}/')
+        self.assertTrue(self.routed)
+        self.assertEqual(set(self.routed), {'replica_0'})
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        data = {
+            "exam": self.exam.id, "started_at": timezone.now(),
+            "answers": [{"question": self.question.id, "short_answer_text": "x"}],
+        }
+        response = self.client.post('/api/submissions/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(set(self.routed), {None})
+
+        self.routed.clear()
+        self.client.get(f"/api/submissions/{response.data['id']}/")
+        self.assertEqual(set(self.routed), {None})
+
+        cache.clear()
+        self.routed.clear()
+        self.client.get('/api/submissions/')
+        self.assertEqual(set(self.routed), {'replica_0'})
+
+    def test_reports_use_a_replica_and_migrations_skip_it(self):
+        GradingLatencyService.report(since=timezone.now() - timedelta(hours=1))
+        self.assertEqual(set(self.routed), {'replica_0'})
+
+        router = ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica_0', 'assessments'))
+        self.assertIsNone(router.allow_migrate('default', 'assessments'))
+        self.assertEqual(router.db_for_write(Exam), 'default')
+
+
+@override_settings(GRADING_ENGINE='MOCK', COMPRESSION_MIN_SIZE=200)
+class SerializationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.exam = Exam.objects.create(
+            title="Ünïcode \"Exam\"", duration=timedelta(hours=1, minutes=30), course="CS101",
+            metadata={"weights": [1, 2.5], "proctored": None}
+        )
+        submission = Submission.objects.create(student=self.user, exam=self.exam, started_at=timezone.now())
+        for index in range(10):
+            question = Question.objects.create(
+                exam=self.exam, text=f"Question {index}", question_type="MCQ" if index % 2 else "SHORT",
+                expected_answer="A"
+            )
+            options = [QuestionOption.objects.create(question=question, text=text) for text in "AB"] if index % 2 else []
+            StudentAnswer.objects.create(
+                submission=submission, question=question,
+                selected_option=options[0] if options else None, short_answer_text=None if options else "A"
+            )
+        self.submission_id = submission.id
+
+    def load_exam(self):
+        return Exam.objects.prefetch_related('questions__options').get(id=self.exam.id)
+
+    def load_submission(self):
+        return Submission.objects.select_related('exam', 'student').prefetch_related(
+            'answers', 'answers__question', 'answers__selected_option'
+        ).get(id=self.submission_id)
+
+    def test_detail_serializers_match_the_model_serializers(self):
+        self.assertEqual(ExamDetailSerializer(self.load_exam()).data, ExamSerializer(self.load_exam()).data)
+        self.assertEqual(
+            SubmissionDetailSerializer(self.load_submission()).data, SubmissionSerializer(self.load_submission()).data
+        )
+
+        GradingService.grade_submission(self.load_submission())
+        data = SubmissionDetailSerializer(self.load_submission()).data
+        self.assertEqual(data, SubmissionSerializer(self.load_submission()).data)
+        self.assertRegex(data['grade'], r'^\d+\.\d{2}$')
+
+    def test_fast_renderer_matches_the_json_renderer(self):
+        GradingService.grade_submission(self.load_submission())
+        for data in (ExamDetailSerializer(self.load_exam()).data, SubmissionDetailSerializer(self.load_submission()).data):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_large_responses_are_compressed(self):
+        plain = self.client.get(f'/api/exams/{self.exam.id}/')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get(f'/api/exams/{self.exam.id}/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+
+        cached = self.client.get(
+            f'/api/exams/{self.exam.id}/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with override_settings(COMPRESSION_MIN_SIZE=len(plain.content) + 1):
+            response = self.client.get(f'/api/exams/{self.exam.id}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+
+@override_settings(QUERY_BUDGET_ENABLED=True, METRICS_ENABLED=True)
+class CachedTokenAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+        metrics.registry.clear()
+        self.user = User.objects.create_user(username='student', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def query_count(self):
+        response = self.client.get('/api/exams/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return int(response['X-Query-Count'])
+
+    def test_token_lookups_are_cached(self):
+        first = self.query_count()
+        self.assertEqual(self.query_count(), first - 1)
+
+        authentication.local_cache.clear()
+        self.assertEqual(self.query_count(), first - 1)
+
+        lookups = metrics.AUTH_TOKEN_CACHE_TOTAL
+        self.assertEqual(lookups.value(layer='local', result='hit'), 1)
+        self.assertEqual(lookups.value(layer='local', result='miss'), 2)
+        self.assertEqual(lookups.value(layer='shared', result='hit'), 1)
+        self.assertEqual(lookups.value(layer='shared', result='miss'), 1)
+
+    def test_revoked_tokens_and_changed_users_are_evicted(self):
+        self.query_count()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/exams/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = True
+        self.user.save()
+        self.query_count()
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/exams/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logins_do_not_evict(self):
+        self.query_count()
+        self.user.save(update_fields=['last_login'])
+        self.assertIsNotNone(authentication.local_cache.get(self.token.key))
+
+    def test_cached_users_hold_no_password_and_are_not_shared(self):
+        self.query_count()
+        self.assertNotIn(self.user.password.encode(), pickle.dumps(cache.get(authentication._cache_key(self.token.key))))
+
+        auth = authentication.CachedTokenAuthentication()
+        first, token = auth.authenticate_credentials(self.token.key)
+        second, _ = auth.authenticate_credentials(self.token.key)
+        self.assertIsNot(first, second)
+        self.assertEqual((first.pk, token.user_id), (self.user.pk, self.user.pk))
+        self.assertTrue(first.check_password('pw'))
+
+    def test_group_and_permission_changes_evict(self):
+        group = Group.objects.create(name='graders')
+        self.query_count()
+        self.user.groups.add(group)
+        self.assertIsNone(authentication.local_cache.get(self.token.key))
+
+        self.query_count()
+        group.user_set.clear()
+        self.assertIsNone(authentication.local_cache.get(self.token.key))
+
+        self.query_count()
+        self.user.user_permissions.add(Permission.objects.get(codename='view_exam'))
+        self.assertIsNone(authentication.local_cache.get(self.token.key))
+
+
+@override_settings(GRADING_ENGINE='MOCK', CELERY_TASK_ALWAYS_EAGER=True)
+class ExpiredSubmissionTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.exam = Exam.objects.create(title="Timed Exam", duration=timedelta(hours=1), course="CS101")
+        self.mcq = Question.objects.create(exam=self.exam, text="2+2?", question_type="MCQ", expected_answer="4")
+        self.correct = QuestionOption.objects.create(question=self.mcq, text="4", is_correct=True)
+        self.short = Question.objects.create(
+            exam=self.exam, text="Define AI.", question_type="SHORT", expected_answer="Artificial Intelligence"
+        )
+        self.expired_at = timezone.now() - timedelta(hours=2)
+
+    def submission(self, username, started_at, **kwargs):
+        student = User.objects.create_user(username=username, password='pw')
+        return Submission.objects.create(student=student, exam=self.exam, started_at=started_at, **kwargs)
+
+    def test_expired_submissions_are_finalized_in_batches_and_graded(self):
+        partial = self.submission('partial', self.expired_at)
+        StudentAnswer.objects.create(submission=partial, question=self.mcq, selected_option=self.correct, score=1.0)
+        StudentAnswer.objects.create(submission=partial, question=self.short, short_answer_text='Artificial Intelligence')
+        blank = self.submission('blank', self.expired_at)
+        running = self.submission('running', timezone.now())
+        done = self.submission('done', self.expired_at, is_completed=True, grade=80)
+
+        report = ExpiredSubmissionSweeper(batch_size=1).sweep()
+
+        self.assertEqual(report, {'finalized': 2, 'grading_jobs': 1})
+        blank.refresh_from_db()
+        self.assertTrue(blank.is_completed)
+        self.assertEqual(blank.grade, 0)
+        self.assertEqual(blank.completed_at, self.expired_at + self.exam.duration)
+        partial.refresh_from_db()
+        self.assertTrue(partial.is_completed)
+        self.assertEqual(partial.total_score, 2.0)
+        running.refresh_from_db()
+        self.assertFalse(running.is_completed)
+        done.refresh_from_db()
+        self.assertEqual(done.grade, 80)
+
+    def test_stored_scores_grade_the_submission_without_grading_jobs(self):
+        partial = self.submission('partial', self.expired_at)
+        StudentAnswer.objects.create(submission=partial, question=self.mcq, selected_option=self.correct, score=1.0)
+
+        with patch('assessments.expiry.enqueue_grading', return_value=0) as enqueue:
+            finalize_expired_submissions()
+
+        enqueue.assert_called_once_with([], chunk_size=50)
+        partial.refresh_from_db()
+        self.assertEqual(partial.grade, 50)
+        self.assertEqual(partial.total_score, 1.0)
+
+    def test_deadline_uses_each_exam_duration_including_soft_deleted_exams(self):
+        short_exam = Exam.objects.create(title="Quiz", duration=timedelta(minutes=10), course="CS101")
+        quiz = Submission.objects.create(
+            student=User.objects.create_user(username='quiz', password='pw'), exam=short_exam,
+            started_at=timezone.now() - timedelta(minutes=30)
+        )
+        running = self.submission('running', timezone.now() - timedelta(minutes=30))
+        retired = self.submission('retired', self.expired_at)
+        Exam.objects.filter(pk=self.exam.pk).update(is_deleted=True, deleted_at=timezone.now())
+
+        with patch('assessments.expiry.publish_graded') as publish:
+            self.assertEqual(ExpiredSubmissionSweeper().sweep(), {'finalized': 2, 'grading_jobs': 0})
+
+        self.assertEqual({call.args[0].pk for call in publish.call_args_list}, {quiz.pk, retired.pk})
+        quiz.refresh_from_db()
+        self.assertEqual(quiz.completed_at, quiz.started_at + short_exam.duration)
+        running.refresh_from_db()
+        self.assertFalse(running.is_completed)
+
+    def test_ungraded_submissions_are_enqueued_in_chunks(self):
+        submissions = [self.submission(f'student{index}', self.expired_at) for index in range(3)]
+        for submission in submissions:
+            StudentAnswer.objects.create(submission=submission, question=self.short, short_answer_text='Robots')
+
+        report = ExpiredSubmissionSweeper(chunk_size=2).sweep()
+
+        self.assertEqual(report, {'finalized': 3, 'grading_jobs': 2})
+        self.assertFalse(StudentAnswer.objects.filter(submission__in=submissions, score__isnull=True).exists())
+
+    def test_sweep_without_expired_rows_reads_only_the_index(self):
+        self.submission('running', timezone.now())
+        with self.assertQueryBudget(2):
+            self.assertEqual(ExpiredSubmissionSweeper().sweep(), {'finalized': 0, 'grading_jobs': 0})
+
+
+@override_settings(
+    SUBMISSION_BUFFER_ENABLED=True, STREAM_BACKEND='memory', GRADING_ENGINE='MOCK', CELERY_TASK_ALWAYS_EAGER=True
+)
+class SubmissionBufferTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        streams = patch.dict('helpers.streams._streams', clear=True)
+        streams.start()
+        self.addCleanup(streams.stop)
+
+        self.user = User.objects.create_user(username='student', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.exam = Exam.objects.create(title="Final", duration=timedelta(hours=1), course="CS101")
+        self.mcq = Question.objects.create(exam=self.exam, text="2+2?", question_type="MCQ", expected_answer="4")
+        self.correct = QuestionOption.objects.create(question=self.mcq, text="4", is_correct=True)
+        self.short = Question.objects.create(
+            exam=self.exam, text="Define AI.", question_type="SHORT", expected_answer="Artificial Intelligence"
+        )
+
+    def post(self, answers, client=None):
+        data = {'exam': self.exam.id, 'started_at': timezone.now().isoformat(), 'answers': answers}
+        return (client or self.client).post('/api/submissions/', data, format='json')
+
+    def test_submissions_are_queued_then_written_in_a_batch(self):
+        # With the answer key cached, queueing only reads the exam and the student's live or archived submission
+        AnswerKey.for_exam(self.exam)
+        with self.assertQueryBudget(3):
+            response = self.post([{'question': self.mcq.id, 'selected_option': self.correct.id}])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertFalse(Submission.objects.exists())
+
+        # A resubmission in the same batch is merged into the same submission
+        receipt = response.data['receipt']
+        second = self.post([{'question': self.short.id, 'short_answer_text': 'Artificial Intelligence'}])
+        other = User.objects.create_user(username='other', password='pw')
+        other_client = APIClient()
+        other_client.force_authenticate(user=other)
+        self.post([{'question': self.mcq.id, 'selected_option': self.correct.id}], client=other_client)
+
+        report = SubmissionBuffer().flush('test')
+
+        self.assertEqual(report, {'read': 3, 'saved': 3, 'rejected': 0, 'grading_jobs': 2})
+        submission = Submission.objects.get(student=self.user)
+        self.assertTrue(submission.is_completed)
+        self.assertEqual(submission.total_score, 2.0)
+
+        response = self.client.get(second['Location'])
+        self.assertEqual(response.data['status'], 'saved')
+        self.assertEqual(response.data['submission'], submission.id)
+        self.assertEqual(self.client.get(f'/api/submissions/receipts/{receipt}/').data['submission'], submission.id)
+        self.assertEqual(other_client.get(second['Location']).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(SubmissionBuffer().flush('test')['read'], 0)
+
+    def test_invalid_submissions_are_rejected_before_queueing(self):
+        response = self.post([{'question': self.short.id}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('require text', response.data['answers'][0])
+
+        Submission.objects.create(student=self.user, exam=self.exam, started_at=timezone.now(), is_completed=True)
+        response = self.post([{'question': self.mcq.id, 'selected_option': self.correct.id}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(SubmissionBuffer().flush('test')['read'], 0)
+
+    def test_submission_completed_before_the_flush_is_rejected_on_the_receipt(self):
+        response = self.post([{'question': self.mcq.id, 'selected_option': self.correct.id}])
+        Submission.objects.create(student=self.user, exam=self.exam, started_at=timezone.now(), is_completed=True)
+
+        self.assertEqual(SubmissionBuffer().flush('test')['rejected'], 1)
+        receipt = self.client.get(response['Location']).data
+        self.assertEqual(receipt['status'], 'rejected')
+        self.assertIn('already completed', receipt['errors'][0])
+
+    def test_numeric_string_ids_and_empty_answers_match_the_serializer(self):
+        data = {
+            'exam': str(self.exam.id), 'started_at': timezone.now().isoformat(),
+            'answers': [{'question': str(self.mcq.id), 'selected_option': str(self.correct.id)}],
+        }
+        received_at = time.time()
+        self.assertEqual(self.client.post('/api/submissions/', data, format='json').status_code, status.HTTP_202_ACCEPTED)
+        other = User.objects.create_user(username='other', password='pw')
+        other_client = APIClient()
+        other_client.force_authenticate(user=other)
+        self.assertEqual(self.post([], client=other_client).status_code, status.HTTP_202_ACCEPTED)
+
+        # Flushed a minute after the POST
+        clock = SimpleNamespace(time=lambda: received_at + 60)
+        with patch('assessments.ingest.group') as group, patch('assessments.ingest.time', clock):
+            report = SubmissionBuffer().flush('test')
+
+        self.assertEqual(report, {'read': 2, 'saved': 2, 'rejected': 0, 'grading_jobs': 1})
+        self.assertTrue(Submission.objects.filter(student=other).exists())
+        (job,), = group.call_args.args
+        submission_id, enqueued_at = job.args
+        self.assertEqual(submission_id, Submission.objects.get(student=self.user).id)
+        self.assertLess(enqueued_at - received_at, 1.0)
+
+    def test_unavailable_stream_falls_back_to_a_direct_write(self):
+        with patch.object(InMemoryStream, 'append', side_effect=StreamError('down')):
+            response = self.post([{'question': self.mcq.id, 'selected_option': self.correct.id}])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Submission.objects.filter(student=self.user).exists())
+
+    def test_unacknowledged_entries_are_read_again(self):
+        stream = InMemoryStream('test')
+        stream.append({'n': 1})
+        self.assertEqual(len(stream.read('crashed', 10)), 1)
+        self.assertEqual(stream.read('other', 10), [])
+        with override_settings(STREAM_CLAIM_IDLE_SECONDS=0):
+            entries = stream.read('other', 10)
+        self.assertEqual(entries, [('1-0', {'n': 1})])
+        stream.ack(['1-0'])
+        with override_settings(STREAM_CLAIM_IDLE_SECONDS=0):
+            self.assertEqual(stream.read('other', 10), [])
+
+
+@override_settings(GRADING_ENGINE='MOCK', CELERY_TASK_ALWAYS_EAGER=True)
+class SubmissionArchiveTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.exam = Exam.objects.create(title="Old Exam", duration=timedelta(hours=1), course="CS101")
+        self.mcq = Question.objects.create(exam=self.exam, text="2+2?", question_type="MCQ", expected_answer="4")
+        self.correct = QuestionOption.objects.create(question=self.mcq, text="4", is_correct=True)
+        self.short = Question.objects.create(
+            exam=self.exam, text="Define AI.", question_type="SHORT", expected_answer="Artificial Intelligence"
+        )
+
+    def client_for(self, username):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username=username, password='pw'))
+        return client
+
+    def submit(self, client=None):
+        data = {
+            'exam': self.exam.id,
+            'started_at': timezone.now().isoformat(),
+            'answers': [
+                {'question': self.mcq.id, 'selected_option': self.correct.id},
+                {'question': self.short.id, 'short_answer_text': 'Artificial Intelligence'},
+            ],
+        }
+        return Submission.objects.get(pk=(client or self.client).post('/api/submissions/', data, format='json').data['id'])
+
+    def test_old_and_soft_deleted_submissions_move_to_the_archive(self):
+        old = self.submit()
+        Submission.objects.filter(pk=old.pk).update(completed_at=timezone.now() - timedelta(days=400))
+        deleted = self.submit(self.client_for('other'))
+        Submission.objects.filter(pk=deleted.pk).update(is_deleted=True, deleted_at=timezone.now())
+        recent = self.submit(self.client_for('third'))
+
+        report = SubmissionArchiver(retention=timedelta(days=180), batch_size=1).run()
+
+        self.assertEqual(report, {'completed': 1, 'deleted': 1})
+        self.assertEqual(list(Submission.all_objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertFalse(StudentAnswer.all_objects.filter(submission_id__in=[old.pk, deleted.pk]).exists())
+        # Their grading runs stay for the latency report, detached from the archived submissions
+        self.assertEqual(GradingRun.objects.count(), 3)
+        self.assertEqual(GradingRun.objects.filter(submission__isnull=True).count(), 2)
+        archived = ArchivedSubmission.objects.get(pk=old.pk)
+        self.assertEqual(archived.grade, 100)
+        self.assertEqual([answer['question'] for answer in archived.answers], [self.mcq.id, self.short.id])
+        self.assertTrue(ArchivedSubmission.objects.get(pk=deleted.pk).is_deleted)
+
+    def test_archived_submissions_stay_readable(self):
+        submission = self.submit()
+        live = self.client.get(f'/api/submissions/{submission.pk}/').json()
+        SubmissionArchiver().archive([submission.pk])
+
+        response = self.client.get(f'/api/submissions/{submission.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        archived = response.json()
+        self.assertIsNotNone(archived.pop('archived_at'))
+        self.assertEqual(archived, live)
+
+        with self.assertQueryBudget(4):
+            response = self.client.get('/api/archived-submissions/')
+        self.assertEqual([item['id'] for item in response.json()], [submission.pk])
+        self.assertEqual(response.json()[0]['answers'][0]['selected_option_text'], '4')
+
+        other = self.client_for('other')
+        self.assertEqual(other.get(f'/api/submissions/{submission.pk}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(other.get(f'/api/archived-submissions/{submission.pk}/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_archived_exam_cannot_be_submitted_again(self):
+        SubmissionArchiver().archive([self.submit().pk])
+        data = {'exam': self.exam.id, 'started_at': timezone.now().isoformat(), 'answers': []}
+        response = self.client.post('/api/submissions/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('already completed', str(response.data))
+
+
+@override_settings(GRADING_ENGINE='LLM', LLM_PROVIDER='STUB', LLM_STUB_LATENCY=0.0, EVENT_BUS_BACKEND='memory')
+class TokenUsageTestCase(TestCase):
+    def setUp(self):
+        self.exam = Exam.objects.create(title="Essay Exam", duration=timedelta(hours=1), course="CS101")
+        self.short = Question.objects.create(
+            exam=self.exam, text="Define AI.", question_type="SHORT", expected_answer="Artificial Intelligence"
+        )
+        self.other = Question.objects.create(
+            exam=self.exam, text="Define ML.", question_type="SHORT", expected_answer="Machine Learning"
+        )
+
+    def grade(self, username):
+        submission = Submission.objects.create(
+            student=User.objects.create_user(username=username, password='pw'), exam=self.exam, started_at=timezone.now()
+        )
+        StudentAnswer.objects.create(submission=submission, question=self.short, short_answer_text="Thinking machines")
+        StudentAnswer.objects.create(submission=submission, question=self.other, short_answer_text="Machine Learning")
+        grade_submission_task(submission.id)
+        submission.refresh_from_db()
+        return submission
+
+    def test_llm_tokens_are_summed_per_question_and_provider(self):
+        self.grade('first')
+        self.grade('second')
+
+        # The exact-match answer to the other question never reached the LLM
+        usage = TokenUsage.objects.get()
+        self.assertEqual((usage.question_id, usage.provider, usage.calls, usage.answers), (self.short.id, 'STUB', 2, 2))
+        self.assertEqual(usage.completion_tokens, 2)
+        self.assertEqual(TokenUsageService.used_tokens(self.exam.id), usage.prompt_tokens + 2)
+
+        staff = APIClient()
+        staff.force_authenticate(user=User.objects.create_user(username='staff', password='pw', is_staff=True))
+        report = staff.get('/api/reports/token-usage/', {'exam': self.exam.id}).json()
+        self.assertEqual(report['exams'][0]['used_tokens'], TokenUsageService.used_tokens(self.exam.id))
+        self.assertEqual(report['questions'][0]['tokens_per_answer'], (usage.prompt_tokens + 2) / 2)
+
+    def test_spent_budget_falls_back_to_the_cheaper_engine(self):
+        self.grade('first')
+        self.exam.metadata = {'token_budget': 1}
+        self.exam.save()
+
+        submission = self.grade('second')
+
+        self.assertEqual(submission.answers.get(question=self.short).graded_by, 'MOCK')
+        self.assertEqual(TokenUsage.objects.get().calls, 1)
+
+    def test_spent_budget_can_pause_grading(self):
+        self.grade('first')
+        self.exam.metadata = {'token_budget': {'max_tokens': 1, 'on_exceeded': 'pause'}}
+        self.exam.save()
+
+        with patch('assessments.tasks.publish_graded') as publish:
+            submission = self.grade('second')
+
+        self.assertIsNone(submission.grade)
+        self.assertFalse(submission.answers.filter(score__isnull=False).exists())
+        publish.assert_called_once_with(submission, paused=True)
+
+    def test_warm_up_calls_count_towards_the_budget(self):
+        self.assertEqual(warm_prompt_cache(self.exam, get_grader()), 2)
+
+        usages = TokenUsage.objects.order_by('question_id')
+        self.assertEqual([(usage.question_id, usage.calls, usage.answers) for usage in usages], [
+            (self.short.id, 1, 0), (self.other.id, 1, 0),
+        ])
+        self.assertGreater(TokenUsageService.used_tokens(self.exam.id), 0)
+
+    @override_settings(LLM_RATE_LIMIT_RPM=60)
+    def test_llm_calls_are_counted_once_per_task(self):
+        cache.clear()
+        with patch('assessments.services.record_llm_calls', wraps=record_llm_calls) as record:
+            self.grade('first')
+            self.grade('second')
+
+        self.assertEqual(record.call_args_list, [call(1), call(1)])
+        self.assertAlmostEqual(llm_calls_per_minute(time.time()), 2, delta=0.1)
+
+
+class AdminPerformanceTestCase(TestCase):
+    def setUp(self):
+        self.exam = Exam.objects.create(title="Large Exam", duration=timedelta(hours=1), course="CS101")
+        self.questions = [
+            Question.objects.create(exam=self.exam, text=f"Question {i}", question_type="SHORT", expected_answer="yes")
+            for i in range(5)
+        ]
+        self.submissions = []
+        for i in range(12):
+            submission = Submission.objects.create(
+                student=User.objects.create(username=f'student{i}'),
+                exam=self.exam, started_at=timezone.now()
+            )
+            StudentAnswer.objects.bulk_create([
+                StudentAnswer(submission=submission, question=question, short_answer_text="yes")
+                for question in self.questions
+            ])
+            self.submissions.append(submission)
+        self.client.force_login(User.objects.create_superuser(username='admin', password='pw'))
+
+    def changelist_queries(self, url):
+        with QueryRecorder() as recorder:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return recorder.count
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        urls = ('/admin/assessments/submission/', '/admin/assessments/studentanswer/')
+        before = [self.changelist_queries(url) for url in urls]
+
+        other = Exam.objects.create(title="Other Exam", duration=timedelta(hours=1), course="CS102")
+        question = Question.objects.create(exam=other, text="Other", question_type="SHORT", expected_answer="no")
+        for i in range(3):
+            submission = Submission.objects.create(
+                student=User.objects.create(username=f'other{i}'), exam=other, started_at=timezone.now()
+            )
+            StudentAnswer.objects.create(submission=submission, question=question, short_answer_text="no")
+
+        self.assertEqual([self.changelist_queries(url) for url in urls], before)
+
+    def test_change_forms_render_without_select_lists(self):
+        response = self.client.get(f'/admin/assessments/submission/{self.submissions[0].pk}/change/')
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, f'<option value="{self.submissions[1].student_id}"')
+
+        answer = StudentAnswer.objects.filter(submission=self.submissions[0]).first()
+        response = self.client.get(f'/admin/assessments/studentanswer/{answer.pk}/change/')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(ADMIN_PERFORMANCE_MODE=True, ADMIN_EXACT_COUNT_LIMIT=10, ADMIN_INLINE_MAX_ROWS=3)
+    def test_performance_mode_bounds_counts_and_inlines(self):
+        paginator = EstimatedCountPaginator(StudentAnswer.objects.order_by('pk'), 100)
+        # Over the limit on SQLite, where there is no planner estimate
+        self.assertEqual(paginator.count, 11)
+        self.assertEqual(EstimatedCountPaginator(Question.objects.order_by('pk'), 100).count, 5)
+
+        response = self.client.get('/admin/assessments/submission/', {'q': 'student1'})
+        self.assertEqual(response.status_code, 200)
+        # student1, student10 and student11 by prefix, without the unfiltered total
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertFalse(response.context['cl'].show_full_result_count)
+
+        response = self.client.get(f'/admin/assessments/submission/{self.submissions[0].pk}/change/')
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(len(formset.forms), 3)
+
+
+@override_settings(
+    GRADING_ENGINES={'fixed': 'assessments.tests.FixedGrader'}, GRADING_ENGINE='FIXED', CELERY_TASK_ALWAYS_EAGER=True,
+    GRADING_SPLIT_MIN_SHORT_ANSWERS=4, GRADING_SPLIT_CHUNK_SIZE=2, EVENT_BUS_BACKEND='memory'
+)
+class SplitGradingTestCase(TestCase):
+    def setUp(self):
+        self.exam = Exam.objects.create(title="Long Exam", duration=timedelta(hours=1), course="CS101")
+        self.questions = [
+            Question.objects.create(exam=self.exam, text=f"Question {i}", question_type="SHORT", expected_answer="yes")
+            for i in range(5)
+        ]
+        mcq = Question.objects.create(exam=self.exam, text="Pick one", question_type="MCQ")
+        self.correct = QuestionOption.objects.create(question=mcq, text="Right", is_correct=True)
+        self.questions.append(mcq)
+
+    def submission(self, username, short_answers):
+        submission = Submission.objects.create(
+            student=User.objects.create_user(username=username, password='pw'), exam=self.exam, started_at=timezone.now()
+        )
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(submission=submission, question=question, short_answer_text="no")
+            for question in self.questions[:short_answers]
+        ] + [StudentAnswer(submission=submission, question=self.questions[-1], selected_option=self.correct)])
+        return submission
+
+    def test_large_submission_is_graded_in_parts(self):
+        split = self.submission('split', 5)
+        whole = self.submission('whole', 3)
+        self.assertEqual(GradingService.part_ranges(split), [
+            (self.questions[0].id, self.questions[1].id),
+            (self.questions[2].id, self.questions[3].id),
+            (self.questions[4].id, self.questions[5].id),
+        ])
+        self.assertIsNone(GradingService.part_ranges(whole))
+
+        self.assertTrue(grade_submission_task(split.id))
+        split.refresh_from_db()
+        self.assertTrue(split.is_completed)
+        self.assertEqual(split.total_score, 5 * 0.25 + 1)
+        self.assertEqual(float(split.grade), round((5 * 0.25 + 1) / 6 * 100, 2))
+        # One run for the whole submission, with the chord's start and the parts' engine
+        self.assertEqual(list(GradingRun.objects.filter(submission=split).values_list('engine', 'succeeded')), [('FIXED', True)])
+
+        client = APIClient()
+        client.force_authenticate(user=split.student)
+        response = client.get(f'/api/submissions/{split.id}/progress/')
+        self.assertEqual(response.json(), {'id': split.id, 'is_completed': True, 'answers': 6, 'graded_answers': 6})
+
+    def test_failed_part_is_retried_alone(self):
+        submission = self.submission('student', 5)
+        calls = []
+
+        def flaky(grader, expected, actual, template=None, question=None):
+            calls.append(question)
+            if len(calls) == 3:
+                raise RuntimeError("provider hiccup")
+            return 0.5
+
+        with patch.object(FixedGrader, 'evaluate_result', flaky):
+            grade_submission_task(submission.id)
+
+        # Question 2 failed with the second part; only that part ran again
+        self.assertEqual(calls, ['Question 0', 'Question 1', 'Question 2', 'Question 2', 'Question 3', 'Question 4'])
+        submission.refresh_from_db()
+        self.assertEqual(submission.total_score, 5 * 0.5 + 1)
+        self.assertEqual(GradingRun.objects.filter(submission=submission, succeeded=False).count(), 1)
+
+    @override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_ENFORCE=True)
+    def test_progress_counts_scored_answers(self):
+        submission = self.submission('student', 5)
+        part = grade_submission_part_task(submission.id, self.questions[0].id, self.questions[1].id)
+        self.assertEqual(part, {'graded': 2, 'paused': False, 'engine': 'FIXED', 'llm_seconds': 0.0})
+
+        client = APIClient()
+        client.force_authenticate(user=submission.student)
+        response = client.get(f'/api/submissions/{submission.id}/progress/')
+        self.assertEqual(response.json(), {'id': submission.id, 'is_completed': False, 'answers': 6, 'graded_answers': 2})
+
+        other = APIClient()
+        other.force_authenticate(user=User.objects.create_user(username='other', password='pw'))
+        self.assertEqual(other.get(f'/api/submissions/{submission.id}/progress/').status_code, 404)
+
+        self.assertTrue(finalize_submission_grading_task([part], submission.id))
+        submission.refresh_from_db()
+        self.assertEqual((submission.total_score, submission.is_completed), (0.5, True))
+
+    def test_part_failing_for_good_leaves_the_submission_open(self):
+        submission = self.submission('student', 5)
+        with patch('assessments.tasks.chord') as dispatch:
+            grade_submission_task(submission.id)
+        callback = dispatch.return_value.call_args.args[0]
+        self.assertEqual(callback.options['link_error'][0].task, fail_submission_grading_task.name)
+
+        grade_submission_part_task(submission.id, self.questions[0].id, self.questions[1].id)
+        # Celery calls the errback with the failed request, the exception and the traceback
+        request = SimpleNamespace(id='chord-callback', retries=0)
+        with patch('assessments.tasks.publish_graded') as publish:
+            fail_submission_grading_task(request, RuntimeError("provider down"), None, submission.id, None, time.time())
+
+        submission.refresh_from_db()
+        self.assertEqual((submission.is_completed, submission.grade, submission.completed_at), (False, None, None))
+        self.assertEqual(submission.answers.filter(score__isnull=False).count(), 2)
+        publish.assert_called_once_with(submission, failed=True)
+        run = GradingRun.objects.get(submission=submission)
+        self.assertEqual((run.task_id, run.succeeded), ('chord-callback', False))
+
+
+class FakePool:
+    def __init__(self, processes):
+        self.num_processes = processes
+
+    def grow(self, n):
+        self.num_processes += n
+
+    def shrink(self, n):
+        self.num_processes -= n
+
+    def maintain_pool(self):
+        pass
+
+
+class BrokenQueue(SimulatedQueue):
+    def depth(self):
+        raise QueueProbeError("broker down")
+
+
+@override_settings(
+    AUTOSCALE_TARGET_WAIT_SECONDS=30.0, AUTOSCALE_INTERVAL_SECONDS=0, AUTOSCALE_WORKER_NODES=1, LLM_RATE_LIMIT_RPM=0
+)
+class GradingAutoscalerTestCase(TestCase):
+    def setUp(self):
+        self.now = time.time()
+        self.queue = SimulatedQueue()
+        exam = Exam.objects.create(title="Exam", duration=timedelta(hours=1), course="CS101")
+        submission = Submission.objects.create(
+            student=User.objects.create_user(username='student', password='pw'), exam=exam, started_at=timezone.now()
+        )
+        # Grading runs of 4 LLM seconds and 1 other second
+        completed_at = timezone.now()
+        GradingRun.objects.bulk_create([
+            GradingRun(
+                submission=submission, exam=exam, engine='LLM:STUB', started_at=completed_at - timedelta(seconds=i + 5),
+                completed_at=completed_at - timedelta(seconds=i), llm_seconds=4.0
+            )
+            for i in range(3)
+        ])
+        self.signal = GradingScalingSignal(self.queue, clock=lambda: self.now)
+
+    def test_recommendation_drains_the_backlog_within_the_target_wait(self):
+        self.assertEqual(recommend_workers(0, 0.0, 5.0, busy=3), 3)
+        # 60 tasks of 5 seconds in 30 seconds, or in 5 once the oldest has waited the target
+        self.assertEqual(recommend_workers(60, 0.0, 5.0), 10)
+        self.assertEqual(recommend_workers(60, 20.0, 5.0), 30)
+        self.assertEqual(recommend_workers(60, 45.0, 5.0), 60)
+        # 10 processes make 1200 calls a minute against a limit of 600
+        self.assertEqual(recommend_workers(60, 0.0, 5.0, current=10, llm_calls=1200, rate_limit_rpm=600), 5)
+
+    def test_signal_follows_a_simulated_spike(self):
+        self.queue.push(60, at=self.now)
+        signal = self.signal.read()
+        self.assertEqual(signal['llm_latency_ewma_seconds'], 4.0)
+        self.assertEqual(signal['task_seconds'], 5.0)
+        self.assertEqual((signal['queue_depth'], signal['workers']), (60, 10))
+
+        self.now += 20
+        self.assertEqual(self.signal.read()['workers'], 30)
+
+        self.queue.pop(60)
+        signal = self.signal.read(busy=4, current=30)
+        self.assertEqual((signal['queue_depth'], signal['oldest_task_age_seconds'], signal['workers']), (0, 0.0, 4))
+
+    @override_settings(LLM_RATE_LIMIT_RPM=10)
+    def test_rate_limit_headroom_caps_the_recommendation(self):
+        cache.clear()
+        record_llm_calls(5)
+        record_llm_calls(3)
+        self.now = time.time()
+        self.queue.push(60, at=self.now)
+
+        signal = self.signal.read(current=4)
+        self.assertAlmostEqual(signal['rate_limit_headroom'], 0.2, places=2)
+        # 4 processes made 8 calls; 10 a minute allow 5
+        self.assertEqual(signal['workers'], 5)
+
+    def test_autoscaler_sizes_the_pool_from_the_signal(self):
+        pool = FakePool(2)
+        autoscaler = GradingAutoscaler(pool, 20, 2, signal=self.signal, keepalive=30)
+
+        self.queue.push(200, at=self.now)
+        autoscaler.maybe_scale()
+        self.assertEqual(pool.num_processes, 20)
+
+        self.queue.pop(200)
+        autoscaler._last_scale_up -= 60
+        autoscaler.maybe_scale()
+        self.assertEqual(pool.num_processes, 2)
+
+        # An unreadable broker falls back to the reserved tasks
+        autoscaler = GradingAutoscaler(
+            pool, 20, 2, signal=GradingScalingSignal(BrokenQueue(), clock=lambda: self.now), keepalive=30
+        )
+        with patch('assessments.autoscale.close_old_connections') as close:
+            self.assertEqual(autoscaler.qty, 0)
+        self.assertEqual(close.call_count, 2)
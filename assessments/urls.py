@@ -1,12 +1,21 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from assessments.views import ExamViewSet, SubmissionViewSet
+from assessments.views import (
+    ArchivedSubmissionViewSet, ExamViewSet, GradingLatencyReportView, SubmissionEventsView, SubmissionIngestView,
+    SubmissionReceiptView, SubmissionViewSet, TokenUsageReportView
+)
 
 router = DefaultRouter()
 router.register(r'exams', ExamViewSet)
 router.register(r'submissions', SubmissionViewSet, basename='submissions')
+router.register(r'archived-submissions', ArchivedSubmissionViewSet, basename='archived-submissions')
 
 urlpatterns = [
+    path('exams/<int:exam_id>/ingest/', SubmissionIngestView.as_view(), name='submission-ingest'),
+    path('reports/grading-latency/', GradingLatencyReportView.as_view(), name='grading-latency-report'),
+    path('reports/token-usage/', TokenUsageReportView.as_view(), name='token-usage-report'),
+    path('submissions/receipts/<str:receipt>/', SubmissionReceiptView.as_view(), name='submission-receipt'),
+    path('submissions/<int:pk>/events/', SubmissionEventsView.as_view(), name='submission-events'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,154 @@
+"""
+LLM token accounting and per-exam token budgets.
+
+Grading tallies the tokens of every LLM call per question and provider, and each grading task adds
+its tally to the TokenUsage summary rows with one upsert. An exam may cap its total with
+`Exam.metadata['token_budget']`:
+
+    {"token_budget": {"max_tokens": 2000000, "on_exceeded": "fallback", "fallback_engine": "MOCK"}}
+
+or just {"token_budget": 2000000}. Prompt and completion tokens count towards the budget (cached
+tokens are part of the prompt). Once it is spent, submissions are graded by the fallback engine,
+or with "on_exceeded": "pause" left ungraded until the budget is raised and the exam regraded.
+"""
+import logging
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from assessments.models import Exam, TokenUsage
+from helpers import metrics
+from helpers.db_router import use_replica
+
+logger = logging.getLogger(__name__)
+
+FALLBACK, PAUSE = 'fallback', 'pause'
+_COUNTERS = ('calls', 'answers', 'prompt_tokens', 'cached_tokens', 'completion_tokens')
+
+
+class TokenTally(dict):
+    """{(question id, provider): {counter: n}} of one grading task."""
+
+    def add(self, question_id: int, provider: str, usage: dict, scored: bool):
+        counts = self.setdefault((question_id, provider), dict.fromkeys(_COUNTERS, 0))
+        counts['calls'] += 1
+        counts['answers'] += int(scored)
+        for kind in ('prompt_tokens', 'cached_tokens', 'completion_tokens'):
+            counts[kind] += usage.get(kind, 0)
+
+
+class TokenUsageService:
+
+    @staticmethod
+    def record(exam_id: int, tally: TokenTally):
+        """Add a tally to the exam's TokenUsage rows in one statement."""
+        if not tally:
+            return
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            for (question_id, provider), counts in tally.items():
+                row, _ = TokenUsage.objects.get_or_create(exam_id=exam_id, question_id=question_id, provider=provider)
+                TokenUsage.objects.filter(pk=row.pk).update(**{name: F(name) + value for name, value in counts.items()})
+            return
+
+        quote = connection.ops.quote_name
+        table = quote(TokenUsage._meta.db_table)
+        columns = ('exam_id', 'question_id', 'provider', *_COUNTERS, 'updated_at')
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        params = []
+        for (question_id, provider), counts in tally.items():
+            params += [exam_id, question_id, provider, *(counts[name] for name in _COUNTERS), now]
+
+        row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        increments = ', '.join(f'{quote(name)} = {table}.{quote(name)} + EXCLUDED.{quote(name)}' for name in _COUNTERS)
+        sql = (
+            f"INSERT INTO {table} ({', '.join(map(quote, columns))}) VALUES {', '.join([row] * len(tally))} "
+            f"ON CONFLICT ({quote('exam_id')}, {quote('question_id')}, {quote('provider')}) "
+            f"DO UPDATE SET {increments}, {quote('updated_at')} = EXCLUDED.{quote('updated_at')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    @staticmethod
+    def used_tokens(exam_id: int) -> int:
+        totals = TokenUsage.objects.filter(exam_id=exam_id).aggregate(
+            prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens')
+        )
+        return (totals['prompt'] or 0) + (totals['completion'] or 0)
+
+    @staticmethod
+    @use_replica()
+    def report(exam_id: int = None) -> dict:
+        """
+        Token totals per exam with their budgets, and per question and provider with tokens per
+        scored answer, most expensive first.
+        """
+        rows = TokenUsage.objects.all()
+        if exam_id:
+            rows = rows.filter(exam_id=exam_id)
+        rows = rows.values_list(
+            'exam_id', 'question_id', 'question__text', 'provider', *_COUNTERS
+        ).order_by('exam_id', 'question_id', 'provider')
+
+        questions, used = [], {}
+        for exam, question, text, provider, *counts in rows:
+            counts = dict(zip(_COUNTERS, counts))
+            tokens = counts['prompt_tokens'] + counts['completion_tokens']
+            used[exam] = used.get(exam, 0) + tokens
+            questions.append({
+                'exam': exam,
+                'question': question,
+                'question_text': text[:100],
+                'provider': provider,
+                **counts,
+                'tokens_per_answer': tokens / counts['answers'] if counts['answers'] else None,
+            })
+        questions.sort(key=lambda row: row['tokens_per_answer'] or 0, reverse=True)
+
+        exams = []
+        for exam in Exam.objects.filter(pk__in=list(used)).order_by('pk').only('id', 'title', 'metadata'):
+            budget = budget_for(exam)
+            exams.append({
+                'exam': exam.pk,
+                'exam_title': exam.title,
+                'used_tokens': used[exam.pk],
+                'max_tokens': budget['max_tokens'] if budget else None,
+                'on_exceeded': budget['on_exceeded'] if budget else None,
+            })
+        return {'exams': exams, 'questions': questions}
+
+
+def budget_for(exam: Exam) -> Optional[dict]:
+    """The exam's token budget with defaults filled in, or None if it has none."""
+    budget = (exam.metadata or {}).get('token_budget')
+    if isinstance(budget, (int, float)) and not isinstance(budget, bool):
+        budget = {'max_tokens': budget}
+    if not isinstance(budget, dict) or not budget.get('max_tokens'):
+        return None
+    return {
+        'max_tokens': int(budget['max_tokens']),
+        'on_exceeded': budget.get('on_exceeded') or getattr(settings, 'TOKEN_BUDGET_ACTION', FALLBACK),
+        'fallback_engine': budget.get('fallback_engine') or getattr(settings, 'TOKEN_BUDGET_FALLBACK_ENGINE', 'MOCK'),
+    }
+
+
+def budgeted_grader(exam: Exam, grader):
+    """
+    grader while the exam's token budget lasts. Once it is spent, the fallback engine's grader,
+    or None when grading should pause. Graders that call no LLM are returned as they are.
+    """
+    from assessments.services import get_grader
+
+    budget = budget_for(exam)
+    if budget is None or getattr(grader, 'backend', None) is None:
+        return grader
+    if TokenUsageService.used_tokens(exam.pk) < budget['max_tokens']:
+        return grader
+
+    action = PAUSE if budget['on_exceeded'] == PAUSE else FALLBACK
+    metrics.TOKEN_BUDGET_EXCEEDED_TOTAL.inc(action=action)
+    if action == PAUSE:
+        return None
+    return get_grader(budget['fallback_engine'])
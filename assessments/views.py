@@ -1,42 +1,98 @@
+import asyncio
+import json
+import logging
+import math
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.views import View
 from drf_spectacular.utils import OpenApiParameter, extend_schema, extend_schema_view
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet
 
-from assessments.models import Exam, Submission
-from assessments.serializers import ExamSerializer, SubmissionSerializer
+from assessments.archive import answer_texts
+from assessments.buffer import SubmissionBuffer
+from assessments.events import graded_channel, graded_event
+from assessments.ingest import SubmissionIngestService
+from assessments.models import ArchivedSubmission, Exam, Submission
+from assessments.serializers import (
+    ArchivedSubmissionSerializer, ExamDetailSerializer, ExamSerializer, GradingLatencyQuerySerializer,
+    SubmissionDetailSerializer, SubmissionSerializer, TokenUsageQuerySerializer
+)
+from assessments.services import GradingLatencyService, GradingService
+from assessments.usage import TokenUsageService
+from helpers.conditional import ConditionalRetrieveMixin
+from helpers.db_router import ReplicaReadMixin
+from helpers.events import get_event_bus
+from helpers.parsers import NDJSONParser
 from helpers.permissions import IsOwnerOnly
+from helpers.streams import StreamError
+
+logger = logging.getLogger(__name__)
 
 
 # Create your views here.
 
 @extend_schema_view(
-    list=extend_schema(summary="List all available exams"),
-    retrieve=extend_schema(summary="Get details of a specific exam including questions and options")
+    list=extend_schema(summary="List all available exams", responses=ExamSerializer(many=True)),
+    retrieve=extend_schema(
+        summary="Get details of a specific exam including questions and options",
+        description="Supports If-None-Match / If-Modified-Since and answers 304 when the exam is unchanged.",
+        responses=ExamSerializer
+    )
 )
-class ExamViewSet(ReadOnlyModelViewSet):
+class ExamViewSet(ReplicaReadMixin, ConditionalRetrieveMixin, ReadOnlyModelViewSet):
     queryset = Exam.objects.prefetch_related('questions__options').all()
     serializer_class = ExamSerializer
     permission_classes = [IsAuthenticated]
+    version_relations = ('questions', 'questions__options')
+    query_budgets = {'list': 5, 'retrieve': 5}
+    duplicate_query_budgets = {'list': 0, 'retrieve': 0}
+
+    def get_serializer_class(self):
+        # Same output as ExamSerializer, without building nested serializers per question and option
+        return ExamDetailSerializer
 
 
 @extend_schema_view(
-    list=extend_schema(summary="List all submissions for the authenticated student"),
+    list=extend_schema(
+        summary="List all submissions for the authenticated student", responses=SubmissionSerializer(many=True)
+    ),
     retrieve=extend_schema(
         summary="Get details of a specific submission",
-        responses={200: SubmissionSerializer, 403: None, 404: None}
+        description="Supports If-None-Match / If-Modified-Since and answers 304 when the submission is unchanged.",
+        responses={200: SubmissionSerializer, 304: None, 403: None, 404: None}
     ),
     create=extend_schema(
         summary="Submit answers for an exam",
-        description="Creates a new submission or updates an existing one if not already completed.",
-        responses={201: SubmissionSerializer, 400: None, 401: None}
+        description=(
+            "Creates a new submission or updates an existing one if not already completed. With "
+            "SUBMISSION_BUFFER_ENABLED the submission is validated and queued instead, and the response "
+            "is 202 with a receipt to follow at /api/submissions/receipts/<receipt>/."
+        ),
+        responses={201: SubmissionSerializer, 202: None, 400: None, 401: None}
     )
 )
-class SubmissionViewSet(ModelViewSet):
+class SubmissionViewSet(ReplicaReadMixin, ConditionalRetrieveMixin, ModelViewSet):
     serializer_class = SubmissionSerializer
     permission_classes = (IsAuthenticated, IsOwnerOnly)
+    version_relations = ('answers',)
     http_method_names = ('get', 'post', 'head', 'options',)
+    # create includes the grading task's own budget when CELERY_TASK_ALWAYS_EAGER runs it inline
+    query_budgets = {'list': 6, 'retrieve': 6, 'create': 24, 'progress': 4}
+    duplicate_query_budgets = {'list': 0, 'retrieve': 0, 'create': 0, 'progress': 0}
 
     @extend_schema(
         parameters=[
@@ -48,7 +104,20 @@ class SubmissionViewSet(ModelViewSet):
         ]
     )
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # Archived submissions keep their id, so links to them keep working
+            archived = ArchivedSubmissionViewSet.queryset_for(request.user).filter(pk=kwargs['pk']).first()
+            if archived is None:
+                raise
+            return Response(ArchivedSubmissionSerializer(archived, context=answer_texts([archived])).data)
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve'):
+            # Same output as SubmissionSerializer, without building nested serializers per answer
+            return SubmissionDetailSerializer
+        return SubmissionSerializer
 
     def get_queryset(self):
         return Submission.objects.filter(student=self.request.user).select_related(
@@ -60,12 +129,222 @@ class SubmissionViewSet(ModelViewSet):
         )
 
     def create(self, request, *args, **kwargs):
+        if getattr(settings, 'SUBMISSION_BUFFER_ENABLED', False):
+            try:
+                receipt = SubmissionBuffer().submit(request.user, request.data)
+            except StreamError as e:
+                # Losing the buffer must not lose submissions; write them directly instead
+                logger.warning(f"Submission buffer unavailable, writing directly: {e}")
+            else:
+                return Response(receipt, status=status.HTTP_202_ACCEPTED, headers={
+                    'Location': reverse('submission-receipt', args=[receipt['receipt']])
+                })
+
         serializer = self.get_serializer(data=request.data, context={'user': request.user})
         serializer.is_valid(raise_exception=True)
         submission = self.perform_create(serializer)
 
-        headers = self.get_success_headers(serializer.data)
-        return Response(SubmissionSerializer(submission).data, status=status.HTTP_201_CREATED, headers=headers)
+        # Reload with the related rows the response renders, instead of one query per answer
+        data = SubmissionDetailSerializer(self.get_queryset().get(pk=submission.pk)).data
+        headers = self.get_success_headers(data)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
 
     def perform_create(self, serializer):
-        return serializer.save(student=self.request.user)
\ No newline at end of file
+        return serializer.save(student=self.request.user)
+
+    @extend_schema(
+        summary="Grading progress of a submission",
+        description=(
+            "Answers scored so far. Large submissions are graded in parallel parts, and their "
+            "answers are scored part by part before the grade is set."
+        ),
+        responses={200: None, 404: None}
+    )
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        # Read from the primary: the parts write while the student watches
+        submission = get_object_or_404(Submission.objects.filter(student=request.user).only('id', 'is_completed'), pk=pk)
+        return Response(GradingService.progress(submission))
+
+
+@extend_schema_view(
+    list=extend_schema(summary="List the authenticated student's archived submissions"),
+    retrieve=extend_schema(summary="Get an archived submission"),
+)
+class ArchivedSubmissionViewSet(ReadOnlyModelViewSet):
+    """Submissions moved out of the live tables by the archiver, in the submission format plus archived_at."""
+    serializer_class = ArchivedSubmissionSerializer
+    permission_classes = (IsAuthenticated,)
+    query_budgets = {'list': 5, 'retrieve': 5}
+
+    @staticmethod
+    def queryset_for(user):
+        return ArchivedSubmission.objects.filter(student=user, is_deleted=False).select_related('exam', 'student')
+
+    def get_queryset(self):
+        return self.queryset_for(self.request.user).order_by('-completed_at')
+
+    def list(self, request, *args, **kwargs):
+        archived = list(self.get_queryset())
+        return Response(self.get_serializer(archived, many=True, context=answer_texts(archived)).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        archived = self.get_object()
+        return Response(self.get_serializer(archived, context=answer_texts([archived])).data)
+
+
+class GradingLatencyReportView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(
+        summary="Grading latency percentiles per exam and engine",
+        description="p50/p95/p99 seconds from enqueue to completed grading. Defaults to the last 24 hours.",
+        parameters=[GradingLatencyQuerySerializer],
+    )
+    def get(self, request):
+        query = GradingLatencyQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        report = GradingLatencyService.report(
+            since=params.get('since') or timezone.now() - timedelta(hours=24),
+            until=params.get('until'),
+            exam_id=params.get('exam'),
+            engine=params.get('engine'),
+        )
+        return Response(report)
+
+
+class TokenUsageReportView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(
+        summary="LLM token usage per exam, question and provider",
+        description=(
+            "exams: tokens used against each exam's token budget. questions: token totals and tokens "
+            "per scored answer per question and provider, most expensive first."
+        ),
+        parameters=[TokenUsageQuerySerializer],
+    )
+    def get(self, request):
+        query = TokenUsageQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(TokenUsageService.report(exam_id=query.validated_data.get('exam')))
+
+
+class SubmissionIngestView(APIView):
+    permission_classes = (IsAdminUser,)
+    parser_classes = (NDJSONParser,)
+
+    @extend_schema(
+        summary="Bulk upload submissions for an exam",
+        description=(
+            "Accepts an application/x-ndjson body with one submission per line: "
+            '{"student": "<username>", "started_at": "<iso datetime, optional>", "answers": [...]}. '
+            "Valid rows are saved and graded even when other rows fail; failures are listed per line."
+        ),
+        request={'application/x-ndjson': str},
+        responses={201: None, 400: None, 404: None},
+    )
+    def post(self, request, exam_id):
+        exam = get_object_or_404(Exam, pk=exam_id)
+        report = SubmissionIngestService.ingest(exam, request.data)
+        if not report['accepted']:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED)
+
+
+class SubmissionReceiptView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(
+        summary="Status of a buffered submission",
+        description=(
+            "status is 'queued' until the submission is written, then 'saved' with the submission id, "
+            "or 'rejected' with errors. Receipts expire after SUBMISSION_BUFFER_RECEIPT_TTL seconds."
+        ),
+        responses={200: None, 404: None, 503: None},
+    )
+    def get(self, request, receipt):
+        try:
+            value = SubmissionBuffer().receipt(receipt)
+        except StreamError:
+            return Response(
+                {'detail': 'Submission receipts are unavailable.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        if value is None or value['student'] != request.user.pk:
+            raise Http404
+        return Response(value)
+
+
+def authenticate(request):
+    """Run the REST framework authenticators for a plain Django view; None if the request is anonymous."""
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+class SubmissionEventsView(View):
+    """
+    Waits on the event loop until a submission is graded, instead of the client polling retrieve.
+    Streams Server-Sent Events when the client accepts text/event-stream and long-polls otherwise.
+    The submission row is read once; the grade itself comes from the event grade_submission_task publishes.
+    """
+    keepalive_seconds = 15.0
+
+    async def get(self, request, pk):
+        user = await sync_to_async(authenticate)(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        submission = await Submission.objects.filter(pk=pk, student=user).only(
+            'id', 'is_completed', 'grade', 'total_score', 'completed_at'
+        ).afirst()
+        if submission is None:
+            return JsonResponse({'detail': 'No Submission matches the given query.'}, status=404)
+
+        timeout = self.get_timeout(request)
+        if 'text/event-stream' in request.headers.get('Accept', ''):
+            response = StreamingHttpResponse(self.stream(submission, timeout), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        event = graded_event(submission)
+        if not submission.is_completed:
+            async with get_event_bus().subscribe(graded_channel(submission.id)) as subscription:
+                event = await subscription.get(timeout) or event
+        return JsonResponse(event)
+
+    async def stream(self, submission, timeout: float):
+        event = graded_event(submission) if submission.is_completed else None
+        if event is None:
+            async with get_event_bus().subscribe(graded_channel(submission.id)) as subscription:
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + timeout
+                while (remaining := deadline - loop.time()) > 0:
+                    event = await subscription.get(min(self.keepalive_seconds, remaining))
+                    if event is not None:
+                        break
+                    if remaining > self.keepalive_seconds:
+                        yield ': keep-alive\n\n'
+
+        if event is not None:
+            name = 'paused' if event.get('paused') else 'failed' if event.get('failed') else 'graded'
+            yield f'event: {name}\ndata: {json.dumps(event)}\n\n'
+        else:
+            # Tell the client to reconnect; EventSource does so automatically
+            yield f'event: timeout\ndata: {json.dumps(graded_event(submission))}\n\n'
+
+    @staticmethod
+    def get_timeout(request) -> float:
+        limit = settings.GRADE_EVENTS_TIMEOUT
+        try:
+            timeout = float(request.GET.get('timeout', limit))
+        except ValueError:
+            return limit
+        # nan compares false with everything and would slip through min/max
+        return min(max(timeout, 0.0), limit) if math.isfinite(timeout) else limit
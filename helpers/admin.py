@@ -0,0 +1,83 @@
+"""
+Admin building blocks for tables too large to count or list in full (ADMIN_PERFORMANCE_MODE).
+
+In performance mode, changelists count at most ADMIN_EXACT_COUNT_LIMIT rows exactly and show
+the planner's estimate above that (PostgreSQL), skip the second unfiltered COUNT(*), and inlines
+show at most ADMIN_INLINE_MAX_ROWS rows. Outside it, PerformanceModeAdmin behaves like ModelAdmin.
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+
+def performance_mode() -> bool:
+    return getattr(settings, 'ADMIN_PERFORMANCE_MODE', False)
+
+
+def estimated_count(queryset):
+    """The planner's row estimate for queryset on PostgreSQL, None elsewhere or if it cannot be read."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    try:
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    except (DatabaseError, ValueError, LookupError, TypeError) as e:
+        logger.warning(f"Could not estimate the row count of {queryset.model._meta.label}: {e}")
+        return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts with COUNT(*) over a LIMIT subquery, so the cost stops at ADMIN_EXACT_COUNT_LIMIT rows.
+    Larger results report the planner's estimate, or the limit plus one where there is none.
+    """
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+        bounded = self.object_list.order_by()[:limit + 1].count()
+        if bounded <= limit:
+            return bounded
+        return max(estimated_count(self.object_list) or 0, bounded)
+
+
+class BoundedInlineFormSet(BaseInlineFormSet):
+    """Inline formset showing the first ADMIN_INLINE_MAX_ROWS rows in performance mode."""
+
+    def get_queryset(self):
+        # Cached: the formset calls this once per form, and a sliced queryset is not cached by the parent
+        if not hasattr(self, '_bounded_queryset'):
+            queryset = super().get_queryset()
+            if performance_mode():
+                queryset = queryset[:getattr(settings, 'ADMIN_INLINE_MAX_ROWS', 100)]
+            self._bounded_queryset = queryset
+        return self._bounded_queryset
+
+
+class PerformanceModeAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin whose changelist uses EstimatedCountPaginator and no full result count in performance
+    mode, and searches `performance_search_fields` (e.g. prefix-only '^username') instead of search_fields.
+    """
+    performance_search_fields = None
+
+    @property
+    def show_full_result_count(self):
+        return not performance_mode()
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        paginator_class = EstimatedCountPaginator if performance_mode() else self.paginator
+        return paginator_class(queryset, per_page, orphans, allow_empty_first_page)
+
+    def get_search_fields(self, request):
+        if performance_mode() and self.performance_search_fields is not None:
+            return self.performance_search_fields
+        return super().get_search_fields(request)
@@ -0,0 +1,146 @@
+"""
+Token authentication with the token -> user lookup cached in two layers: a per-process dict for
+AUTH_TOKEN_LOCAL_TTL seconds and the shared Django cache for AUTH_TOKEN_CACHE_TTL seconds.
+
+Entries hold the user's field values without the password hash, and every request gets its own
+User built from them, so nothing one request caches on its user (e.g. permissions) leaks into the
+next. The password is a deferred field: reading it queries, and save() leaves it untouched.
+
+Deleting or replacing a token, saving or deleting its user, and changing the user's groups or
+permissions evict the entry from the shared cache and this process's local cache. Other processes
+may keep serving their local copy until it expires, so AUTH_TOKEN_LOCAL_TTL bounds how long a
+revoked token stays usable there.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from helpers import metrics
+
+
+def _cache_key(key: str) -> str:
+    # Raw tokens never become cache keys
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _pack(user, token) -> tuple:
+    """The cache entry for an authenticated token: database alias, user fields without the password, token fields."""
+    fields = {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields if field.attname != 'password'
+    }
+    return user._state.db, fields, (token.key, token.created)
+
+
+def _unpack(entry) -> tuple:
+    """A new (user, token) pair from a cache entry."""
+    db, fields, (key, created) = entry
+    user = get_user_model().from_db(db, list(fields), list(fields.values()))
+    token = Token.from_db(db, ['key', 'user_id', 'created'], [key, user.pk, created])
+    token.user = user
+    return user, token
+
+
+class LocalTokenCache:
+    """Bounded, thread-safe token -> cache entry map with a fixed TTL, oldest entries evicted first."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key: str, value):
+        ttl = getattr(settings, 'AUTH_TOKEN_LOCAL_TTL', 5)
+        max_entries = getattr(settings, 'AUTH_TOKEN_LOCAL_MAX_ENTRIES', 10000)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalTokenCache()
+
+
+def invalidate_token(key: str):
+    local_cache.delete(key)
+    cache.delete(_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cached = local_cache.get(key)
+        metrics.AUTH_TOKEN_CACHE_TOTAL.inc(layer='local', result='hit' if cached else 'miss')
+        if cached:
+            return _unpack(cached)
+
+        cached = cache.get(_cache_key(key))
+        metrics.AUTH_TOKEN_CACHE_TOTAL.inc(layer='shared', result='hit' if cached else 'miss')
+        if cached:
+            local_cache.set(key, cached)
+            return _unpack(cached)
+
+        # Raises AuthenticationFailed for unknown tokens and inactive users, which are never cached
+        user, token = super().authenticate_credentials(key)
+        entry = _pack(user, token)
+        cache.set(_cache_key(key), entry, getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60))
+        local_cache.set(key, entry)
+        return user, token
+
+
+@receiver((post_save, post_delete), sender=Token, dispatch_uid='invalidate_cached_token')
+def _token_changed(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver((post_save, post_delete), sender=get_user_model(), dispatch_uid='invalidate_cached_user_token')
+def _user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which authentication does not depend on
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    _invalidate_users([instance.pk])
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through, dispatch_uid='invalidate_cached_user_groups')
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through, dispatch_uid='invalidate_cached_user_permissions')
+def _user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate_users([instance.pk])
+    elif reverse and action in ('post_add', 'post_remove'):
+        # A group or permission gained or lost the users in pk_set
+        _invalidate_users(pk_set)
+    elif reverse and action == 'pre_clear':
+        # clear() passes no pk_set, so the users are read before they are removed
+        related = {f'{instance._meta.model_name}_id': instance.pk}
+        _invalidate_users(sender.objects.filter(**related).values_list('user_id', flat=True))
+
+
+def _invalidate_users(user_ids):
+    for key in Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True):
+        invalidate_token(key)
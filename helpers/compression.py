@@ -0,0 +1,63 @@
+"""
+Response compression negotiated from Accept-Encoding: brotli when the optional `brotli` package is
+installed and the client accepts it, gzip otherwise. Streaming responses (Server-Sent Events),
+small bodies and responses marked `Cache-Control: no-transform` are sent as they are.
+"""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional speedup
+    brotli = None
+
+_BROTLI = re.compile(r'\bbr\b')
+_GZIP = re.compile(r'\bgzip\b')
+
+
+def accepted_encoding(accept_encoding: str):
+    if brotli is not None and _BROTLI.search(accept_encoding):
+        return 'br'
+    if _GZIP.search(accept_encoding):
+        return 'gzip'
+    return None
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+    return compress_string(content)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or 'no-transform' in response.get('Cache-Control', '')
+            or len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        ):
+            return response
+
+        encoding = accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed body is a different representation; keep ETags weakly comparable
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
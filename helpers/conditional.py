@@ -0,0 +1,63 @@
+"""
+Conditional GET for viewset retrieve: ETag and Last-Modified from one aggregate query over the
+object's and its child rows' updated_at, answered with 304 before anything is serialized.
+
+Child rows count towards the version by their newest updated_at and their number, so edits,
+inserts and deletes of children all change the ETag. Bulk writes must set updated_at themselves
+(auto_now is not applied by bulk_update).
+"""
+import hashlib
+from typing import NamedTuple
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class Version(NamedTuple):
+    etag: str
+    last_modified: float
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        response['Last-Modified'] = http_date(self.last_modified)
+        return response
+
+
+class ConditionalRetrieveMixin:
+    """
+    Set `version_relations` to the child relation paths that are rendered with the object,
+    e.g. ('questions', 'questions__options').
+    """
+    version_relations = ()
+
+    def get_version(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        aggregates = {'updated_at': Max('updated_at')}
+        for relation in self.version_relations:
+            aggregates[f'{relation}__updated_at'] = Max(f'{relation}__updated_at')
+            aggregates[f'{relation}__count'] = Count(relation, distinct=True)
+
+        row = queryset.order_by().aggregate(**aggregates)
+        if row['updated_at'] is None:
+            return None
+
+        last_modified = max(value for key, value in row.items() if key.endswith('updated_at') and value)
+        key = '|'.join(f'{name}={row[name]}' for name in sorted(row))
+        etag = quote_etag(hashlib.md5(f'{queryset.model._meta.label}|{key}'.encode()).hexdigest())
+        return Version(etag, last_modified.timestamp())
+
+    def retrieve(self, request, *args, **kwargs):
+        version = self.get_version()
+        if version is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        not_modified = get_conditional_response(
+            request, etag=version.etag, last_modified=int(version.last_modified)
+        )
+        if not_modified is not None:
+            return version.apply(not_modified)
+        return version.apply(super().retrieve(request, *args, **kwargs))
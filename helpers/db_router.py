@@ -0,0 +1,101 @@
+"""
+Read-replica routing. Writes always go to the primary ('default'); reads go to a replica only
+inside an explicit replica context: read-only viewset actions (ReplicaReadMixin) and analytics
+code wrapped in use_replica(). Everything else, including ORM reads in write paths and tasks,
+stays on the primary.
+
+After a user's successful write, their reads stay on the primary for
+DATABASE_REPLICA_STICKY_SECONDS so they see their own submission despite replication lag. The
+flag lives in the cache, which must be shared between web processes (e.g. Redis) for this to hold.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_aliases() -> list:
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def choose_replica():
+    aliases = replica_aliases()
+    return random.choice(aliases) if aliases else None
+
+
+def current_read_alias():
+    """The alias reads are routed to in this context, or None for the primary."""
+    return _read_alias.get()
+
+
+@contextmanager
+def use_replica(alias: str = None):
+    """Route reads in the block (or decorated function) to a replica, if any are configured."""
+    token = _read_alias.set(alias or choose_replica())
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _sticky_key(user_id) -> str:
+    return f'db-primary-sticky:{user_id}'
+
+
+def stick_to_primary(user_id):
+    cache.set(_sticky_key(user_id), True, getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 10))
+
+
+def is_stuck_to_primary(user_id) -> bool:
+    return cache.get(_sticky_key(user_id)) is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return False if db in replica_aliases() else None
+
+
+class ReplicaReadMixin:
+    """
+    For DRF views: serve `replica_actions` (viewset actions, or lower-case method names on an
+    APIView) from a replica, and pin the user to the primary after any successful write.
+    Authentication runs before the replica is chosen, so it always reads from the primary.
+    """
+    replica_actions = ('list', 'retrieve')
+    _replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        action = getattr(self, 'action', None) or request.method.lower()
+        if request.method not in SAFE_METHODS or action not in self.replica_actions or not replica_aliases():
+            return
+        if request.user.is_authenticated and is_stuck_to_primary(request.user.pk):
+            return
+        self._replica_token = _read_alias.set(choose_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._replica_token is not None:
+            _read_alias.reset(self._replica_token)
+            self._replica_token = None
+
+        user = getattr(request, 'user', None)
+        wrote = request.method not in SAFE_METHODS and response.status_code < 400
+        if wrote and replica_aliases() and user and user.is_authenticated:
+            stick_to_primary(user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,209 @@
+"""
+Publish/subscribe of small JSON events between Celery workers and async web views.
+
+Workers publish with a blocking call; views subscribe from the event loop and wait without
+holding a thread or a database connection. The last event of each channel is retained for
+EVENT_BUS_RETAIN_SECONDS and delivered to later subscribers, so a view that checked state
+before subscribing cannot miss an event published in between. Publishers forget the retained
+event once it is out of date, so it is not replayed to later subscribers.
+
+RedisEventBus uses Redis pub/sub. InMemoryEventBus only reaches subscribers in the same
+process (tests and CELERY_TASK_ALWAYS_EAGER).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+
+def retain_seconds() -> int:
+    return getattr(settings, 'EVENT_BUS_RETAIN_SECONDS', 300)
+
+
+class EventBus(ABC):
+    @abstractmethod
+    def publish(self, channel: str, payload: dict):
+        """Send payload to every subscriber of channel and retain it. Failures are logged, not raised."""
+
+    @abstractmethod
+    def forget(self, channels: list):
+        """Drop the retained events of channels. Failures are logged, not raised."""
+
+    @abstractmethod
+    def subscribe(self, channel: str):
+        """Async context manager yielding a subscription; `await subscription.get(timeout)` returns the next event or None."""
+
+
+class _MemorySubscription:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def put(self, payload: dict):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, payload)
+        except RuntimeError:
+            # The subscriber's event loop has already closed
+            pass
+
+    async def get(self, timeout: float):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except TimeoutError:
+            return None
+
+
+class InMemoryEventBus(EventBus):
+    def __init__(self):
+        self._subscribers = {}
+        self._retained = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, payload: dict):
+        with self._lock:
+            now = time.monotonic()
+            self._retained = {key: value for key, value in self._retained.items() if value[0] > now}
+            self._retained[channel] = (now + retain_seconds(), payload)
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(payload)
+
+    def forget(self, channels: list):
+        with self._lock:
+            for channel in channels:
+                self._retained.pop(channel, None)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        subscription = _MemorySubscription()
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+            expires, payload = self._retained.get(channel, (0, None))
+        if expires > time.monotonic():
+            subscription.queue.put_nowait(payload)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscription)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class _RedisSubscription:
+    def __init__(self, pubsub, retained=None):
+        self.pubsub = pubsub
+        self.pending = retained
+
+    async def get(self, timeout: float):
+        import redis
+
+        if self.pending is not None:
+            payload, self.pending = self.pending, None
+            return json.loads(payload)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while (remaining := deadline - loop.time()) > 0:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+                if message and message['type'] == 'message':
+                    return json.loads(message['data'])
+        except redis.RedisError as e:
+            logger.warning(f"Lost event subscription: {e}")
+        return None
+
+
+class _ClosedSubscription:
+    async def get(self, timeout: float):
+        return None
+
+
+class RedisEventBus(EventBus):
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+
+    @staticmethod
+    def retained_key(channel: str) -> str:
+        return f'{channel}:last'
+
+    def publish(self, channel: str, payload: dict):
+        import redis
+
+        data = json.dumps(payload)
+        try:
+            if self._client is None:
+                self._client = redis.Redis.from_url(self.url, socket_connect_timeout=1)
+            pipeline = self._client.pipeline(transaction=False)
+            pipeline.set(self.retained_key(channel), data, ex=retain_seconds())
+            pipeline.publish(channel, data)
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish event to {channel}: {e}")
+
+    def forget(self, channels: list):
+        import redis
+
+        if not channels:
+            return
+        try:
+            if self._client is None:
+                self._client = redis.Redis.from_url(self.url, socket_connect_timeout=1)
+            self._client.delete(*[self.retained_key(channel) for channel in channels])
+        except redis.RedisError as e:
+            logger.warning(f"Could not forget the retained events of {len(channels)} channels: {e}")
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        import redis
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        try:
+            try:
+                await pubsub.subscribe(channel)
+                subscription = _RedisSubscription(pubsub, await client.get(self.retained_key(channel)))
+            except redis.RedisError as e:
+                # Waiters return the current state at once and clients fall back to polling
+                logger.warning(f"Could not subscribe to {channel}: {e}")
+                subscription = _ClosedSubscription()
+            yield subscription
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_event_bus() -> EventBus:
+    """
+    The bus named by EVENT_BUS_BACKEND ('redis' or 'memory'). Unset, it is 'memory' while Celery
+    runs tasks eagerly in the web process, and Redis at EVENT_BUS_REDIS_URL otherwise.
+    """
+    from celery import current_app
+
+    backend = getattr(settings, 'EVENT_BUS_BACKEND', None)
+    if not backend:
+        backend = 'memory' if current_app.conf.task_always_eager else 'redis'
+
+    with _buses_lock:
+        if backend not in _buses:
+            if backend == 'memory':
+                _buses[backend] = InMemoryEventBus()
+            elif backend == 'redis':
+                _buses[backend] = RedisEventBus(settings.EVENT_BUS_REDIS_URL)
+            else:
+                raise ImproperlyConfigured(f"Unknown EVENT_BUS_BACKEND {backend!r}; use 'redis' or 'memory'.")
+        return _buses[backend]
@@ -1,25 +1,75 @@
+import hashlib
 import logging
+import math
+import threading
+import time
 from abc import abstractmethod, ABC
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Optional
 
-from google import genai
-import openai
 from django.conf import settings
 
+from helpers import metrics
+from helpers.registry import LazyRegistry
+
 logger = logging.getLogger(__name__)
 
 
 class LLMBackend(ABC):
+    provider = None
+    # Provider that produced the last response, when it differs from `provider`
+    last_provider = None
+
     @abstractmethod
     def generate_score(self, prompt: str) -> float:
         pass
 
+    @property
+    def last_usage(self) -> Optional[dict]:
+        """Token counts of the last response on this thread, so concurrent calls to one backend keep their own."""
+        return getattr(self._thread_state(), 'usage', None)
+
+    @last_usage.setter
+    def last_usage(self, usage: Optional[dict]):
+        self._thread_state().usage = usage
+
+    def _thread_state(self) -> threading.local:
+        return self.__dict__.setdefault('_thread_state_', threading.local())
+
+    def call_usages(self) -> list:
+        """(provider, usage) of every call behind the last score, the scoring call's first."""
+        return [(self.last_provider or self.provider, self.last_usage)] if self.last_usage else []
+
+    def settle(self, timeout: float = None):
+        """Wait up to timeout seconds for calls still running in the background to add their usage to call_usages()."""
+
+    def record_usage(
+        self, prompt_tokens: Optional[int], completion_tokens: Optional[int], cached_tokens: Optional[int] = None
+    ):
+        """Keep the token counts of the last response and add them to the provider's token metrics."""
+        self.last_usage = {
+            'prompt_tokens': prompt_tokens or 0,
+            'cached_tokens': cached_tokens or 0,
+            'completion_tokens': completion_tokens or 0,
+        }
+        for kind, count in self.last_usage.items():
+            if count:
+                metrics.LLM_TOKENS_TOTAL.inc(count, provider=self.provider, kind=kind.removesuffix('_tokens'))
+
 
 class GeminiBackend(LLMBackend):
+    provider = 'GEMINI'
+
     def __init__(self):
         self.api_key = getattr(settings, 'GEMINI_API_KEY')
         if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
+            from google import genai
+            from google.genai import types
+
+            base_url = getattr(settings, 'GEMINI_BASE_URL', None)
+            http_options = types.HttpOptions(base_url=base_url) if base_url else None
+            self.client = genai.Client(api_key=self.api_key, http_options=http_options)
             self.model_name = getattr(settings, 'GEMINI_MODEL')
         else:
             self.client = None
@@ -34,18 +84,27 @@ class GeminiBackend(LLMBackend):
                 model=self.model_name,
                 contents=prompt
             )
+            usage = getattr(response, 'usage_metadata', None)
+            if usage:
+                self.record_usage(
+                    usage.prompt_token_count, usage.candidates_token_count, usage.cached_content_token_count
+                )
             return float(response.text.strip())
         except Exception as e:
+            metrics.LLM_ERRORS_TOTAL.inc(provider=self.provider)
             logger.error(f"Gemini Error: {e}")
             return None
 
 
 class OpenAIBackend(LLMBackend):
+    provider = 'OPENAI'
 
     def __init__(self):
         api_key = getattr(settings, 'OPENAI_API_KEY')
         if api_key:
-            self.client = openai.OpenAI(api_key=api_key)
+            import openai
+
+            self.client = openai.OpenAI(api_key=api_key, base_url=getattr(settings, 'OPENAI_BASE_URL', None) or None)
             self.model_name = getattr(settings, 'OPENAI_MODEL')
         else:
             self.client = None
@@ -61,8 +120,229 @@ class OpenAIBackend(LLMBackend):
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.0
             )
+            usage = getattr(response, 'usage', None)
+            if usage:
+                details = getattr(usage, 'prompt_tokens_details', None)
+                self.record_usage(
+                    usage.prompt_tokens, usage.completion_tokens, getattr(details, 'cached_tokens', None)
+                )
             content = response.choices[0].message.content.strip()
             return float(content)
         except Exception as e:
+            metrics.LLM_ERRORS_TOTAL.inc(provider=self.provider)
             logger.error(f"OpenAI Error: {e}")
             return None
+
+
+def stub_score(prompt: str) -> float:
+    """Deterministic pseudo score for a prompt, shared by StubBackend and the stub LLM server."""
+    digest = hashlib.sha256(prompt.encode()).digest()
+    return round(digest[0] / 255, 2)
+
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend for benchmarks and load tests.
+    Sleeps for LLM_STUB_LATENCY seconds and returns a score derived from the prompt,
+    so the same prompt always gets the same score.
+    """
+    provider = 'STUB'
+
+    def __init__(self, latency: float = None):
+        self.latency = getattr(settings, 'LLM_STUB_LATENCY', 0.0) if latency is None else latency
+
+    def generate_score(self, prompt: str) -> Optional[float]:
+        if self.latency:
+            time.sleep(self.latency)
+
+        self.record_usage(len(prompt.split()), 1)
+        return stub_score(prompt)
+
+
+class ProviderStats:
+    """Exponentially weighted latency and error rate of one provider, plus a window of recent latencies."""
+
+    def __init__(self, alpha: float, window: int = 200):
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, failed: bool):
+        with self._lock:
+            self.latency = seconds if self.latency is None else self.alpha * seconds + (1 - self.alpha) * self.latency
+            self.error_rate = self.alpha * float(failed) + (1 - self.alpha) * self.error_rate
+            if not failed:
+                self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+    def cost(self, error_penalty: float) -> float:
+        """Expected latency inflated by the error rate; providers never tried cost 0 so they get explored."""
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + error_penalty * self.error_rate)
+
+
+class RoutingBackend(LLMBackend):
+    """
+    Sends each call to the provider with the best latency/error EWMA. If it has not answered
+    after the hedge delay (the primary's recent p95 latency), a duplicate goes to the next provider
+    and the first usable score wins. A provider returning no score fails over to the next one.
+    last_provider names the provider whose score was returned, and call_usages() lists the tokens of
+    every call, including failed-over calls and hedged calls that lost.
+
+    A losing hedged call is not cancelled: it keeps an executor thread until the provider answers.
+    settle() waits for the losers (LLM_HEDGE_SETTLE_SECONDS at most) and adds their tokens to the
+    call_usages() of the score they lost to. Size LLM_ROUTING_MAX_WORKERS for the concurrent calls
+    of a process plus their hedges.
+    """
+    provider = 'ROUTED'
+
+    # Shared by every RoutingBackend in the process, so routing learns across grading tasks
+    stats = {}
+    _usages = ()
+    _stats_lock = threading.Lock()
+    _executor = None
+
+    def __init__(self, providers: list = None, hedge_delay: float = None):
+        providers = providers or getattr(settings, 'LLM_ROUTING_PROVIDERS', ['OPENAI', 'GEMINI'])
+        self.backends = {name.upper(): backend_registry.get(name)() for name in providers}
+        self.hedge_delay_override = hedge_delay
+        self.alpha = getattr(settings, 'LLM_ROUTING_EWMA_ALPHA', 0.2)
+        self.error_penalty = getattr(settings, 'LLM_ROUTING_ERROR_PENALTY', 10.0)
+        # (call_usages() list, future) of hedged calls still running when a score won
+        self._losers = []
+
+    @classmethod
+    def stats_for(cls, provider: str) -> ProviderStats:
+        with cls._stats_lock:
+            if provider not in cls.stats:
+                cls.stats[provider] = ProviderStats(getattr(settings, 'LLM_ROUTING_EWMA_ALPHA', 0.2))
+            return cls.stats[provider]
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        with cls._stats_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'LLM_ROUTING_MAX_WORKERS', 8), thread_name_prefix='llm-routing'
+                )
+            return cls._executor
+
+    def ranked(self) -> list:
+        return sorted(self.backends, key=lambda name: self.stats_for(name).cost(self.error_penalty))
+
+    def hedge_delay(self, provider: str) -> float:
+        if self.hedge_delay_override is not None:
+            return self.hedge_delay_override
+        stats = self.stats_for(provider)
+        if len(stats.samples) >= getattr(settings, 'LLM_HEDGE_MIN_SAMPLES', 20):
+            return stats.percentile(getattr(settings, 'LLM_HEDGE_PERCENTILE', 0.95))
+        return getattr(settings, 'LLM_HEDGE_DELAY', 5.0)
+
+    def _call(self, provider: str, prompt: str):
+        backend = self.backends[provider]
+        # A response without usage must not report the previous call's tokens. last_usage is per
+        # thread, so a losing call still running on this backend keeps its own.
+        backend.last_usage = None
+        start = time.perf_counter()
+        try:
+            score = backend.generate_score(prompt)
+        except Exception as e:
+            logger.error(f"{provider} Error: {e}")
+            score = None
+
+        seconds = time.perf_counter() - start
+        stats = self.stats_for(provider)
+        stats.observe(seconds, failed=score is None)
+        metrics.LLM_PROVIDER_LATENCY_EWMA_SECONDS.set(stats.latency, provider=provider)
+        return provider, score, backend.last_usage
+
+    def call_usages(self) -> list:
+        return self._usages
+
+    def settle(self, timeout: float = None):
+        losers, self._losers = self._losers, []
+        if not losers:
+            return
+        timeout = getattr(settings, 'LLM_HEDGE_SETTLE_SECONDS', 10.0) if timeout is None else timeout
+        done, not_done = wait([future for _, future in losers], timeout=timeout)
+        for usages, future in losers:
+            if future in done:
+                provider, _, usage = future.result()
+                if usage:
+                    usages.append((provider, usage))
+        if not_done:
+            logger.warning(f"{len(not_done)} hedged LLM calls still running after {timeout}s; their tokens are not counted")
+
+    def generate_score(self, prompt: str) -> Optional[float]:
+        remaining = self.ranked()
+        primary = remaining[0]
+        pending = set()
+        hedged = False
+        # Hedged calls still running when a score wins add their usage in settle()
+        self._usages = usages = []
+        self.last_usage = None
+
+        def launch():
+            pending.add(self.executor().submit(self._call, remaining.pop(0), prompt))
+
+        launch()
+        while pending:
+            timeout = self.hedge_delay(primary) if remaining and not hedged else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                metrics.LLM_HEDGED_REQUESTS_TOTAL.inc(provider=remaining[0])
+                launch()
+                continue
+
+            winner = None
+            for future in done:
+                provider, score, usage = future.result()
+                if score is not None and winner is None:
+                    winner = provider, score, usage
+                elif usage:
+                    usages.append((provider, usage))
+
+            if winner is not None:
+                provider, score, usage = winner
+                if usage:
+                    usages.insert(0, (provider, usage))
+                self._losers.extend((usages, future) for future in pending)
+                self.last_provider = provider
+                self.last_usage = usage
+                return score
+
+            if remaining and not pending:
+                launch()
+
+        self.last_provider = None
+        return None
+
+
+# Provider SDKs are imported inside each backend, so only the configured provider is loaded.
+# Add providers with the LLM_BACKENDS setting or the "assessment_engine.llm_backends" entry point group.
+backend_registry = LazyRegistry(
+    kind='LLM backend',
+    setting='LLM_BACKENDS',
+    entry_point_group='assessment_engine.llm_backends',
+    defaults={
+        'OPENAI': 'helpers.llm_backends.OpenAIBackend',
+        'GEMINI': 'helpers.llm_backends.GeminiBackend',
+        'STUB': 'helpers.llm_backends.StubBackend',
+        'ROUTED': 'helpers.llm_backends.RoutingBackend',
+    },
+)
+
+
+def get_backend(provider: str = None) -> LLMBackend:
+    provider = provider or getattr(settings, 'LLM_PROVIDER', '')
+    return backend_registry.get(provider, default='GEMINI')()
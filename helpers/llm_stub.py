@@ -0,0 +1,193 @@
+"""
+Local stand-in for the OpenAI chat-completions and Gemini generate-content HTTP APIs, for load
+testing the LLM grading path offline. Point OPENAI_BASE_URL / GEMINI_BASE_URL at it.
+
+Scores are derived from the prompt (the same prompt always scores the same), latency follows a
+configurable distribution, and a share of requests can fail with 500 or be rate limited with 429.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from helpers.llm_backends import stub_score
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+_GEMINI_PATH = re.compile(r'/models/(?P<model>[^/:]+):generateContent$')
+_OPENAI_PATHS = ('/v1/chat/completions', '/chat/completions')
+_CACHEABLE_MARKER = 'Student Answer:'
+
+
+class StubBehaviour:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        latency_dist: str = 'fixed',
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: int = None,
+    ):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_dist must be one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._seen_prefixes = set()
+
+    def latency(self) -> float:
+        """Seconds to wait before answering."""
+        with self._lock:
+            if self.latency_dist == 'uniform':
+                millis = self._random.uniform(
+                    max(self.latency_ms - self.jitter_ms, 0), self.latency_ms + self.jitter_ms
+                )
+            elif self.latency_dist == 'lognormal' and self.latency_ms > 0:
+                # latency_ms is the median, jitter_ms / latency_ms the spread of the log
+                sigma = self.jitter_ms / self.latency_ms if self.jitter_ms else 0.5
+                millis = self.latency_ms * self._random.lognormvariate(0, sigma)
+            else:
+                millis = self.latency_ms
+        return millis / 1000
+
+    def failure(self):
+        """HTTP status to fail with, or None to answer normally."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def cached_tokens(self, prompt: str) -> int:
+        """Imitate provider prompt caching: a prefix seen before counts as cached."""
+        prefix, marker, _ = prompt.partition(_CACHEABLE_MARKER)
+        if not marker:
+            return 0
+        with self._lock:
+            seen = prefix in self._seen_prefixes
+            self._seen_prefixes.add(prefix)
+        return len(prefix.split()) if seen else 0
+
+
+def _openai_prompt(body: dict) -> str:
+    content = (body.get('messages') or [{}])[-1].get('content', '')
+    if isinstance(content, list):
+        content = ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return content
+
+
+def _gemini_prompt(body: dict) -> str:
+    contents = body.get('contents') or []
+    if isinstance(contents, str):
+        return contents
+    return ''.join(
+        part.get('text', '')
+        for content in contents for part in content.get('parts', [])
+    )
+
+
+def openai_response(body: dict, prompt: str, cached: int) -> dict:
+    prompt_tokens = len(prompt.split())
+    return {
+        'id': f'chatcmpl-{uuid.uuid4().hex}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'stub'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': str(stub_score(prompt))},
+            'finish_reason': 'stop',
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': 1,
+            'total_tokens': prompt_tokens + 1,
+            'prompt_tokens_details': {'cached_tokens': cached},
+        },
+    }
+
+
+def gemini_response(model: str, prompt: str, cached: int) -> dict:
+    prompt_tokens = len(prompt.split())
+    return {
+        'candidates': [{
+            'content': {'role': 'model', 'parts': [{'text': str(stub_score(prompt))}]},
+            'finishReason': 'STOP',
+            'index': 0,
+        }],
+        'usageMetadata': {
+            'promptTokenCount': prompt_tokens,
+            'candidatesTokenCount': 1,
+            'cachedContentTokenCount': cached,
+            'totalTokenCount': prompt_tokens + 1,
+        },
+        'modelVersion': model,
+    }
+
+
+class StubLLMRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    behaviour = StubBehaviour()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send(400, {'error': {'message': 'Invalid JSON body.'}})
+
+        path = self.path.split('?', 1)[0]
+        gemini = _GEMINI_PATH.search(path)
+        if path not in _OPENAI_PATHS and not gemini:
+            return self._send(404, {'error': {'message': f'Unknown path {path}.'}})
+
+        time.sleep(self.behaviour.latency())
+
+        status = self.behaviour.failure()
+        if status == 429:
+            return self._send(429, {'error': {'message': 'Rate limit reached.', 'code': 429}}, {'Retry-After': '1'})
+        if status:
+            return self._send(status, {'error': {'message': 'Injected server error.', 'code': status}})
+
+        if gemini:
+            prompt = _gemini_prompt(body)
+            payload = gemini_response(gemini.group('model'), prompt, self.behaviour.cached_tokens(prompt))
+        else:
+            prompt = _openai_prompt(body)
+            payload = openai_response(body, prompt, self.behaviour.cached_tokens(prompt))
+        self._send(200, payload)
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def make_server(host: str = '127.0.0.1', port: int = 8090, behaviour: StubBehaviour = None) -> ThreadingHTTPServer:
+    handler = type('ConfiguredStubLLMRequestHandler', (StubLLMRequestHandler,), {
+        'behaviour': behaviour or StubBehaviour(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
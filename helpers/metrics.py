@@ -0,0 +1,286 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Every recording call checks METRICS_ENABLED first and returns immediately when it is off,
+so instrumented hot paths pay for one attribute lookup. Each process (web worker or Celery
+child) keeps its own registry and must be scraped separately.
+"""
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def enabled() -> bool:
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+def _format_labels(labelnames, values, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def expose(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value) -> list:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if not enabled():
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        if not enabled():
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels))
+
+
+class _HistogramValue:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not enabled():
+            return
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = _HistogramValue(len(self.buckets))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry.counts[index] += 1
+            entry.sum += value
+            entry.count += 1
+
+    def time(self, **labels):
+        """Context manager observing the elapsed wall time of its block."""
+        if not enabled():
+            return NULL_TIMER
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry.count if entry else 0
+
+    def _samples(self, key, value) -> list:
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, value.counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+        lines.append(f'{self.name}_bucket{labels} {value.count}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {value.sum}')
+        lines.append(f'{self.name}_count{labels} {value.count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def expose(self) -> str:
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+GRADING_STAGE_SECONDS = registry.histogram(
+    'grading_stage_seconds',
+    'Time spent in each grading stage (db_load, grade_answer, llm_call, persistence).',
+    ('stage',)
+)
+GRADING_QUEUE_WAIT_SECONDS = registry.histogram(
+    'grading_queue_wait_seconds',
+    'Time between enqueuing a grading task and a worker starting it.',
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+)
+GRADING_EXACT_MATCH_TOTAL = registry.counter(
+    'grading_exact_match_total',
+    'Answers scored by the exact-match shortcut without calling a grading engine.'
+)
+LLM_ERRORS_TOTAL = registry.counter(
+    'llm_errors_total', 'LLM calls that raised an error.', ('provider',)
+)
+LLM_NONE_SCORES_TOTAL = registry.counter(
+    'llm_none_scores_total', 'LLM calls that produced no usable score.', ('provider',)
+)
+LLM_HEDGED_REQUESTS_TOTAL = registry.counter(
+    'llm_hedged_requests_total', 'Duplicate LLM calls sent because the first provider was slow.', ('provider',)
+)
+LLM_PROVIDER_LATENCY_EWMA_SECONDS = registry.gauge(
+    'llm_provider_latency_ewma_seconds', 'Exponentially weighted LLM call latency per provider.', ('provider',)
+)
+LLM_TOKENS_TOTAL = registry.counter(
+    'llm_tokens_total', 'Tokens reported by LLM providers.', ('provider', 'kind')
+)
+TOKEN_BUDGET_EXCEEDED_TOTAL = registry.counter(
+    'token_budget_exceeded_total', 'Grading tasks that found their exam token budget spent, by action (fallback, pause).',
+    ('action',)
+)
+SUBMISSIONS_EXPIRED_TOTAL = registry.counter(
+    'submissions_expired_total', 'Open submissions finalized by the expiry sweeper after their time ran out.'
+)
+SUBMISSIONS_ARCHIVED_TOTAL = registry.counter(
+    'submissions_archived_total', 'Submissions moved to the archive table, by reason (completed, deleted).', ('reason',)
+)
+SUBMISSION_BUFFER_ENTRIES_TOTAL = registry.counter(
+    'submission_buffer_entries_total', 'Buffered submissions by outcome (queued, saved, rejected).', ('status',)
+)
+AUTH_TOKEN_CACHE_TOTAL = registry.counter(
+    'auth_token_cache_total', 'API token lookups per cache layer (local, shared) and result (hit, miss).',
+    ('layer', 'result')
+)
+GRADING_PARTS_TOTAL = registry.counter(
+    'grading_parts_total', 'Question-range parts of split submissions by outcome (graded, failed).', ('outcome',)
+)
+GRADING_QUEUE_DEPTH = registry.gauge(
+    'grading_queue_depth', 'Tasks waiting in the broker queue at the last autoscaling signal read.'
+)
+GRADING_QUEUE_OLDEST_AGE_SECONDS = registry.gauge(
+    'grading_queue_oldest_age_seconds', 'Seconds the oldest queued task had waited at the last autoscaling signal read.'
+)
+GRADING_RECOMMENDED_WORKERS = registry.gauge(
+    'grading_recommended_workers', 'Worker processes recommended by the autoscaling signal.'
+)
+
+
+def metrics_view(request):
+    if not enabled():
+        raise Http404
+    return HttpResponse(registry.expose(), content_type=CONTENT_TYPE)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.expose().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, addr: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Serve the registry from a daemon thread, for processes without a Django URLconf (Celery workers)."""
+    server = ThreadingHTTPServer((addr, port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on {addr}:{port}")
+    return server
@@ -0,0 +1,15 @@
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline-delimited JSON. request.data is an iterator of (line number, raw line) read lazily
+    from the request stream, so a large upload is never held in memory at once. Each line is
+    decoded by the view, which can then report errors per line instead of rejecting the body.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        return enumerate(stream, start=1)
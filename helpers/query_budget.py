@@ -0,0 +1,197 @@
+"""
+Query budgets: record the SQL a request or task runs, fingerprint it to find N+1 patterns,
+and complain when a declared budget is exceeded.
+
+Recording only happens when QUERY_BUDGET_ENABLED is on. With QUERY_BUDGET_ENFORCE on, an
+exceeded budget raises QueryBudgetExceeded (use this in tests); otherwise it is logged.
+"""
+import functools
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+_TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql: str) -> str:
+    """Normalise a statement so the same query with different parameters compares equal."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def enabled() -> bool:
+    return getattr(settings, 'QUERY_BUDGET_ENABLED', False)
+
+
+class QueryRecorder:
+    """Records every statement executed on any database connection while active."""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+        return False
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    def duplicates(self) -> dict:
+        """Fingerprints executed more than once, ignoring transaction bookkeeping."""
+        counts = Counter(
+            fingerprint(sql) for sql in self.queries
+            if not sql.lstrip().upper().startswith(_TRANSACTION_STATEMENTS)
+        )
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+
+def check_budget(recorder: QueryRecorder, label: str, max_queries: int = None, max_duplicates: int = None):
+    problems = []
+    if max_queries is not None and recorder.count > max_queries:
+        problems.append(f"{recorder.count} queries (budget {max_queries})")
+
+    duplicates = recorder.duplicates()
+    if max_duplicates is not None and len(duplicates) > max_duplicates:
+        repeated = '; '.join(f"{count}x {sql}" for sql, count in duplicates.items())
+        problems.append(f"{len(duplicates)} repeated queries (budget {max_duplicates}): {repeated}")
+
+    if not problems:
+        return
+
+    message = f"Query budget exceeded for {label}: " + ', '.join(problems)
+    if getattr(settings, 'QUERY_BUDGET_ENFORCE', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def query_budget(max_queries: int = None, max_duplicates: int = None):
+    """Decorator declaring the query budget of a function or Celery task body."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+
+            with QueryRecorder() as recorder:
+                result = func(*args, **kwargs)
+            check_budget(recorder, func.__qualname__, max_queries, max_duplicates)
+            return result
+
+        wrapper.query_budget = (max_queries, max_duplicates)
+        return wrapper
+
+    return decorator
+
+
+def view_budget(view_func, request):
+    """
+    Budget declared on a view class as `query_budgets = {action: max_queries}` and optionally
+    `duplicate_query_budgets = {action: max_duplicates}`. DRF viewsets are keyed by action name.
+    """
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return None, None
+
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method, method)
+
+    max_queries = getattr(view_class, 'query_budgets', {}).get(action)
+    max_duplicates = getattr(view_class, 'duplicate_query_budgets', {}).get(action)
+    return max_queries, max_duplicates
+
+
+class QueryBudgetMiddleware:
+    """Counts queries per request, adds X-Query-Count and checks the view's declared budget."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not enabled():
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not enabled():
+            return await self.get_response(request)
+
+        # Under ASGI the ORM runs in the request's thread-sensitive executor thread, so the
+        # recorder has to wrap that thread's connections rather than the event loop's
+        recorder = QueryRecorder()
+        await sync_to_async(recorder.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recorder.__exit__)(None, None, None)
+        return self.finish(request, response, recorder)
+
+    def finish(self, request, response, recorder):
+        response['X-Query-Count'] = str(recorder.count)
+        budget = getattr(request, '_query_budget', None)
+        if budget:
+            check_budget(recorder, f"{request.method} {request.path}", *budget)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if enabled():
+            request._query_budget = view_budget(view_func, request)
+        return None
+
+
+class QueryBudgetTestMixin:
+    """TestCase helpers mirroring assertNumQueries, but as an upper bound with N+1 detection."""
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries: int, max_duplicates: int = 0):
+        with QueryRecorder() as recorder:
+            yield recorder
+
+        self.assertLessEqual(
+            recorder.count, max_queries,
+            f"{recorder.count} queries executed, budget is {max_queries}:\n" + '\n'.join(recorder.queries)
+        )
+        duplicates = recorder.duplicates()
+        self.assertLessEqual(
+            len(duplicates), max_duplicates,
+            "Repeated queries (possible N+1):\n" + '\n'.join(f"{count}x {sql}" for sql, count in duplicates.items())
+        )
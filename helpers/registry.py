@@ -0,0 +1,62 @@
+import logging
+from importlib.metadata import entry_points
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class LazyRegistry:
+    """
+    Maps upper-case names to classes given as dotted paths, importing each one on first use.
+
+    Lookup order: the `setting` dict in Django settings, classes registered at runtime,
+    the built-in defaults, then the `entry_point_group` entry points of installed packages
+    (only scanned for names not found elsewhere).
+    """
+
+    def __init__(self, kind: str, setting: str, entry_point_group: str, defaults: dict):
+        self.kind = kind
+        self.setting = setting
+        self.entry_point_group = entry_point_group
+        self.defaults = dict(defaults)
+        self._registered = {}
+        self._imported = {}
+
+    def register(self, name: str, target):
+        """Register a class or a dotted path to one."""
+        self._registered[name.upper()] = target
+
+    def targets(self) -> dict:
+        targets = dict(self.defaults)
+        targets.update(self._registered)
+        targets.update({name.upper(): target for name, target in getattr(settings, self.setting, {}).items()})
+        return targets
+
+    def names(self) -> list:
+        names = set(self.targets())
+        names.update(entry_point.name.upper() for entry_point in entry_points(group=self.entry_point_group))
+        return sorted(names)
+
+    def _from_entry_points(self, name: str):
+        for entry_point in entry_points(group=self.entry_point_group):
+            if entry_point.name.upper() == name:
+                return entry_point.load()
+        return None
+
+    def get(self, name: str, default: str = None):
+        key = (name or '').upper()
+        target = self.targets().get(key) or self._from_entry_points(key)
+        if target is None and default:
+            logger.warning(f"Unknown {self.kind} '{name}', falling back to {default}.")
+            return self.get(default)
+        if target is None:
+            raise ImproperlyConfigured(f"Unknown {self.kind} '{name}'. Available: {', '.join(self.names())}")
+
+        if isinstance(target, str):
+            if target not in self._imported:
+                self._imported[target] = import_string(target)
+            target = self._imported[target]
+        return target
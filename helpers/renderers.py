@@ -0,0 +1,26 @@
+"""
+JSON rendering through orjson when it is installed (`pip install assessment-engine[speedups]`).
+
+Output matches rest_framework's JSONRenderer: compact, UTF-8, datetimes in ISO 8601 with 'Z' for
+UTC, and anything orjson cannot encode natively (Decimal, lazy strings, ...) goes through DRF's
+JSONEncoder. Indented output (`Accept: application/json; indent=4`) and missing orjson fall back
+to the stdlib renderer.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=_encoder.default, option=self.options)
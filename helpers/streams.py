@@ -0,0 +1,227 @@
+"""
+Durable append-only work streams with consumer-side acknowledgement, plus short-lived receipts
+that record what became of each entry.
+
+Producers append JSON entries and get an id back at once. Consumers read batches, process them
+and acknowledge them. Entries read but never acknowledged (a consumer crashed) are handed out
+again after STREAM_CLAIM_IDLE_SECONDS, so processing must be idempotent.
+
+RedisStream uses a Redis stream and consumer group. InMemoryStream keeps everything in the
+process (tests and CELERY_TASK_ALWAYS_EAGER) and is not durable.
+"""
+import itertools
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+class StreamError(Exception):
+    """The stream backend could not be reached; nothing was appended or acknowledged."""
+
+
+def claim_idle_seconds() -> float:
+    return getattr(settings, 'STREAM_CLAIM_IDLE_SECONDS', 60)
+
+
+class Stream(ABC):
+    @abstractmethod
+    def append(self, payload: dict) -> str:
+        """Append payload durably and return its entry id."""
+
+    @abstractmethod
+    def read(self, consumer: str, count: int, block: float = 0) -> list:
+        """
+        Up to count (entry id, payload) pairs for consumer: entries abandoned by other consumers
+        first, then new ones, waiting up to block seconds when there are none.
+        """
+
+    @abstractmethod
+    def ack(self, entry_ids: list):
+        """Mark entries as processed so they are never delivered again."""
+
+    @abstractmethod
+    def set_receipts(self, receipts: dict, ttl: int):
+        """Store {receipt: value} for ttl seconds, replacing earlier values."""
+
+    @abstractmethod
+    def get_receipt(self, receipt: str):
+        """The stored value of receipt, or None once it expired."""
+
+
+class InMemoryStream(Stream):
+    def __init__(self, name: str):
+        self.name = name
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._receipts = {}
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+
+    def append(self, payload: dict) -> str:
+        with self._condition:
+            entry_id = f'{next(self._ids)}-0'
+            self._entries[entry_id] = payload
+            self._condition.notify_all()
+        return entry_id
+
+    def read(self, consumer: str, count: int, block: float = 0) -> list:
+        deadline = time.monotonic() + block
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                stale = now - claim_idle_seconds()
+                batch = [
+                    entry_id for entry_id, delivered_at in self._pending.items() if delivered_at <= stale
+                ][:count]
+                batch += [
+                    entry_id for entry_id in self._entries if entry_id not in self._pending
+                ][:count - len(batch)]
+                if batch or now >= deadline:
+                    break
+                self._condition.wait(deadline - now)
+
+            for entry_id in batch:
+                self._pending[entry_id] = now
+            return [(entry_id, self._entries[entry_id]) for entry_id in batch]
+
+    def ack(self, entry_ids: list):
+        with self._condition:
+            for entry_id in entry_ids:
+                self._pending.pop(entry_id, None)
+                self._entries.pop(entry_id, None)
+
+    def set_receipts(self, receipts: dict, ttl: int):
+        with self._condition:
+            now = time.monotonic()
+            self._receipts = {key: item for key, item in self._receipts.items() if item[0] > now}
+            self._receipts.update((receipt, (now + ttl, value)) for receipt, value in receipts.items())
+
+    def get_receipt(self, receipt: str):
+        expires, value = self._receipts.get(receipt, (0, None))
+        return value if expires > time.monotonic() else None
+
+
+class RedisStream(Stream):
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.group = f'{name}:consumers'
+        self.url = url
+        self._client = None
+        self._group_ready = False
+
+    @property
+    def client(self):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url, socket_connect_timeout=1)
+        return self._client
+
+    def receipt_key(self, receipt: str) -> str:
+        return f'{self.name}:receipt:{receipt}'
+
+    def _ensure_group(self):
+        import redis
+
+        if self._group_ready:
+            return
+        try:
+            self.client.xgroup_create(self.name, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def append(self, payload: dict) -> str:
+        import redis
+
+        try:
+            return self.client.xadd(self.name, {'data': json.dumps(payload)}).decode()
+        except redis.RedisError as e:
+            raise StreamError(f"Could not append to {self.name}: {e}") from e
+
+    def read(self, consumer: str, count: int, block: float = 0) -> list:
+        import redis
+
+        try:
+            self._ensure_group()
+            _, messages, *_ = self.client.xautoclaim(
+                self.name, self.group, consumer, int(claim_idle_seconds() * 1000), count=count
+            )
+            if len(messages) < count:
+                for _, new_messages in self.client.xreadgroup(
+                    self.group, consumer, {self.name: '>'}, count=count - len(messages),
+                    block=int(block * 1000) or None
+                ) or ():
+                    messages += new_messages
+        except redis.RedisError as e:
+            raise StreamError(f"Could not read from {self.name}: {e}") from e
+
+        # Entries deleted while pending come back without fields
+        return [(entry_id.decode(), json.loads(fields[b'data'])) for entry_id, fields in messages if fields]
+
+    def ack(self, entry_ids: list):
+        import redis
+
+        if not entry_ids:
+            return
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.xack(self.name, self.group, *entry_ids)
+            pipeline.xdel(self.name, *entry_ids)
+            pipeline.execute()
+        except redis.RedisError as e:
+            raise StreamError(f"Could not acknowledge entries of {self.name}: {e}") from e
+
+    def set_receipts(self, receipts: dict, ttl: int):
+        import redis
+
+        if not receipts:
+            return
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for receipt, value in receipts.items():
+                pipeline.set(self.receipt_key(receipt), json.dumps(value), ex=ttl)
+            pipeline.execute()
+        except redis.RedisError as e:
+            raise StreamError(f"Could not store receipts of {self.name}: {e}") from e
+
+    def get_receipt(self, receipt: str):
+        import redis
+
+        try:
+            value = self.client.get(self.receipt_key(receipt))
+        except redis.RedisError as e:
+            raise StreamError(f"Could not read receipt {receipt}: {e}") from e
+        return json.loads(value) if value is not None else None
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def get_stream(name: str) -> Stream:
+    """
+    The stream called name on STREAM_BACKEND ('redis' or 'memory'). Unset, it is 'memory' while
+    Celery runs tasks eagerly in the web process, and Redis at STREAM_REDIS_URL otherwise.
+    """
+    from celery import current_app
+
+    backend = getattr(settings, 'STREAM_BACKEND', None)
+    if not backend:
+        backend = 'memory' if current_app.conf.task_always_eager else 'redis'
+
+    with _streams_lock:
+        if (backend, name) not in _streams:
+            if backend == 'memory':
+                _streams[backend, name] = InMemoryStream(name)
+            elif backend == 'redis':
+                _streams[backend, name] = RedisStream(name, settings.STREAM_REDIS_URL)
+            else:
+                raise ImproperlyConfigured(f"Unknown STREAM_BACKEND {backend!r}; use 'redis' or 'memory'.")
+        return _streams[backend, name]
@@ -1,5 +1,8 @@
 import os
+import time
+
 from celery import Celery
+from celery.signals import before_task_publish, worker_process_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
@@ -13,6 +16,28 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+
+@worker_process_init.connect
+def start_metrics_server(**kwargs):
+    from django.conf import settings
+    from helpers import metrics
+
+    port = getattr(settings, 'METRICS_WORKER_PORT', None)
+    if not (metrics.enabled() and port):
+        return
+
+    # Each prefork child keeps its own registry, so child N listens on port + N
+    from billiard.process import current_process
+    metrics.start_http_server(port + (getattr(current_process(), 'index', 0) or 0))
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    # Read by the autoscaling signal to age the oldest task waiting in the broker
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
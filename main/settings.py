@@ -58,6 +58,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'helpers.query_budget.QueryBudgetMiddleware',
+    'helpers.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,6 +99,33 @@ DATABASES = {
     )
 }
 
+# Shared cache, e.g. CACHE_URL=redis://localhost:6379/1. The default is per process, which does
+# not share API token lookups, answer keys or read-replica stickiness between web processes.
+# An empty CACHE_URL counts as unset.
+CACHES = {
+    'default': env.cache_url_config(env('CACHE_URL', default='') or 'locmemcache://')
+}
+
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = env('SESSION_ENGINE', default='django.contrib.sessions.backends.cached_db')
+
+# CachedTokenAuthentication keeps token -> user lookups for AUTH_TOKEN_LOCAL_TTL seconds in each
+# process and AUTH_TOKEN_CACHE_TTL seconds in the shared cache. Revoking a token or changing its
+# user clears the shared entry at once; other processes' local copies expire on their own.
+AUTH_TOKEN_LOCAL_TTL = env.float('AUTH_TOKEN_LOCAL_TTL', default=5.0)
+AUTH_TOKEN_LOCAL_MAX_ENTRIES = env.int('AUTH_TOKEN_LOCAL_MAX_ENTRIES', default=10000)
+AUTH_TOKEN_CACHE_TTL = env.int('AUTH_TOKEN_CACHE_TTL', default=60)
+
+# Read replicas, e.g. DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 or a comma separated list of
+# postgres URLs. Read-only API actions and reports read from them (see helpers/db_router.py), and a
+# user's reads stay on the primary for DATABASE_REPLICA_STICKY_SECONDS after they write.
+for index, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    DATABASES[f'replica_{index}'] = {**env.db_url_config(url), 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['helpers.db_router.ReplicaRouter']
+DATABASE_REPLICA_STICKY_SECONDS = env.int('DATABASE_REPLICA_STICKY_SECONDS', default=10)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -138,14 +167,22 @@ STATIC_URL = 'static/'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'helpers.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'helpers.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Responses of at least COMPRESSION_MIN_SIZE bytes are brotli (if installed) or gzip compressed
+COMPRESSION_MIN_SIZE = env.int('COMPRESSION_MIN_SIZE', default=1024)
+COMPRESSION_BROTLI_QUALITY = env.int('COMPRESSION_BROTLI_QUALITY', default=4)
+
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Assessment Engine API',
@@ -156,7 +193,7 @@ SPECTACULAR_SETTINGS = {
 
 # Grading Service Configuration
 GRADING_ENGINE = env('GRADING_ENGINE', default='MOCK')  # Options: 'MOCK', 'LLM'
-LLM_PROVIDER = env('LLM_PROVIDER', default='GEMINI')  # Options: 'GEMINI', 'OPENAI'
+LLM_PROVIDER = env('LLM_PROVIDER', default='GEMINI')  # Options: 'GEMINI', 'OPENAI', 'ROUTED', 'STUB'
 
 GEMINI_API_KEY = env('GEMINI_API_KEY', default='')
 GEMINI_MODEL = env('GEMINI_MODEL', default='gemini-3-flash-preview')
@@ -164,6 +201,77 @@ GEMINI_MODEL = env('GEMINI_MODEL', default='gemini-3-flash-preview')
 OPENAI_API_KEY = env('OPENAI_API_KEY', default='')
 OPENAI_MODEL = env('OPENAI_MODEL', default='gpt-5-mini')
 
+# Override the provider API endpoints, e.g. to point at `manage.py run_llm_stub`
+GEMINI_BASE_URL = env('GEMINI_BASE_URL', default=None)
+OPENAI_BASE_URL = env('OPENAI_BASE_URL', default=None)
+
+# Seconds the offline STUB provider waits before answering
+LLM_STUB_LATENCY = env.float('LLM_STUB_LATENCY', default=0.0)
+
+# LLM_PROVIDER=ROUTED: route each call to the provider with the best latency/error EWMA, and send a
+# hedged duplicate to the next provider once the first has taken longer than its recent p95 latency
+# (LLM_HEDGE_DELAY seconds until LLM_HEDGE_MIN_SAMPLES calls have been observed)
+LLM_ROUTING_PROVIDERS = env.list('LLM_ROUTING_PROVIDERS', default=['OPENAI', 'GEMINI'])
+LLM_ROUTING_EWMA_ALPHA = env.float('LLM_ROUTING_EWMA_ALPHA', default=0.2)
+LLM_ROUTING_ERROR_PENALTY = env.float('LLM_ROUTING_ERROR_PENALTY', default=10.0)
+LLM_ROUTING_MAX_WORKERS = env.int('LLM_ROUTING_MAX_WORKERS', default=8)
+LLM_HEDGE_PERCENTILE = env.float('LLM_HEDGE_PERCENTILE', default=0.95)
+LLM_HEDGE_DELAY = env.float('LLM_HEDGE_DELAY', default=5.0)
+LLM_HEDGE_MIN_SAMPLES = env.int('LLM_HEDGE_MIN_SAMPLES', default=20)
+# Seconds a grading task waits for hedged calls that lost, so their tokens are counted
+LLM_HEDGE_SETTLE_SECONDS = env.float('LLM_HEDGE_SETTLE_SECONDS', default=10.0)
+
+# Prometheus-format metrics, served at /metrics/ and by each Celery worker child on
+# METRICS_WORKER_PORT + child index
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=False)
+METRICS_WORKER_PORT = env.int('METRICS_WORKER_PORT', default=None)
+
+# Per-request and per-task query counting against the budgets declared on views and tasks.
+# QUERY_BUDGET_ENFORCE raises instead of logging when a budget is exceeded.
+QUERY_BUDGET_ENABLED = env.bool('QUERY_BUDGET_ENABLED', default=DEBUG)
+QUERY_BUDGET_ENFORCE = env.bool('QUERY_BUDGET_ENFORCE', default=False)
+
+# Submissions with at least GRADING_SPLIT_MIN_SHORT_ANSWERS short answers (0 disables) are graded as a
+# chord of parts of GRADING_SPLIT_CHUNK_SIZE answers each; a failed part is retried up to GRADING_PART_MAX_RETRIES times
+GRADING_SPLIT_MIN_SHORT_ANSWERS = env.int('GRADING_SPLIT_MIN_SHORT_ANSWERS', default=100)
+GRADING_SPLIT_CHUNK_SIZE = env.int('GRADING_SPLIT_CHUNK_SIZE', default=25)
+GRADING_PART_MAX_RETRIES = env.int('GRADING_PART_MAX_RETRIES', default=3)
+
+# Admin for large tables: changelists count exactly up to ADMIN_EXACT_COUNT_LIMIT rows and estimate
+# beyond it, skip the unfiltered total, search by prefix, and inlines show ADMIN_INLINE_MAX_ROWS rows
+ADMIN_PERFORMANCE_MODE = env.bool('ADMIN_PERFORMANCE_MODE', default=False)
+ADMIN_EXACT_COUNT_LIMIT = env.int('ADMIN_EXACT_COUNT_LIMIT', default=10000)
+ADMIN_INLINE_MAX_ROWS = env.int('ADMIN_INLINE_MAX_ROWS', default=100)
+
+# What grading does once an exam's token budget (Exam.metadata['token_budget']) is spent, unless the
+# budget says otherwise: 'fallback' to TOKEN_BUDGET_FALLBACK_ENGINE, or 'pause'
+TOKEN_BUDGET_ACTION = env('TOKEN_BUDGET_ACTION', default='fallback')
+TOKEN_BUDGET_FALLBACK_ENGINE = env('TOKEN_BUDGET_FALLBACK_ENGINE', default='MOCK')
+
+# Staff bulk ingest (POST /api/exams/<id>/ingest/): rows per transaction and seconds an exam's
+# answer key stays cached
+INGEST_BATCH_SIZE = env.int('INGEST_BATCH_SIZE', default=500)
+INGEST_ANSWER_KEY_TTL = env.int('INGEST_ANSWER_KEY_TTL', default=300)
+
+# Grade-ready events for GET /api/submissions/<id>/events/. The bus is 'redis' or 'memory';
+# unset, it is 'memory' when CELERY_TASK_ALWAYS_EAGER grades inside the web process.
+EVENT_BUS_BACKEND = env('EVENT_BUS_BACKEND', default=None)
+EVENT_BUS_REDIS_URL = env('EVENT_BUS_REDIS_URL', default='') or env('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+EVENT_BUS_RETAIN_SECONDS = env.int('EVENT_BUS_RETAIN_SECONDS', default=300)
+# Longest a client may wait on one request before getting the current state back
+GRADE_EVENTS_TIMEOUT = env.float('GRADE_EVENTS_TIMEOUT', default=30.0)
+
+# Write-behind submissions: POST /api/submissions/ queues to a stream and answers 202 with a receipt,
+# and `manage.py consume_submission_buffer` writes batches. STREAM_BACKEND is 'redis' or 'memory';
+# unset, it is 'memory' when CELERY_TASK_ALWAYS_EAGER. Unacknowledged entries are re-read after
+# STREAM_CLAIM_IDLE_SECONDS.
+SUBMISSION_BUFFER_ENABLED = env.bool('SUBMISSION_BUFFER_ENABLED', default=False)
+SUBMISSION_BUFFER_BATCH_SIZE = env.int('SUBMISSION_BUFFER_BATCH_SIZE', default=500)
+SUBMISSION_BUFFER_RECEIPT_TTL = env.int('SUBMISSION_BUFFER_RECEIPT_TTL', default=86400)
+STREAM_BACKEND = env('STREAM_BACKEND', default=None)
+STREAM_REDIS_URL = env('STREAM_REDIS_URL', default='') or env('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+STREAM_CLAIM_IDLE_SECONDS = env.float('STREAM_CLAIM_IDLE_SECONDS', default=60.0)
+
 
 # Celery Configuration
 CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='redis://localhost:6379/0')
@@ -173,3 +281,38 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Autoscaling: `celery -A main worker --autoscale=<max>,<min>` sizes the pool from the queue depth, the
+# oldest task's age, grading-run EWMAs and LLM_RATE_LIMIT_RPM headroom (0: no limit), aiming to start
+# every queued task within AUTOSCALE_TARGET_WAIT_SECONDS. AUTOSCALE_WORKER_NODES workers share the queue.
+CELERY_WORKER_AUTOSCALER = 'assessments.autoscale:GradingAutoscaler'
+AUTOSCALE_QUEUES = env.list('AUTOSCALE_QUEUES', default=['celery'])
+AUTOSCALE_TARGET_WAIT_SECONDS = env.float('AUTOSCALE_TARGET_WAIT_SECONDS', default=30.0)
+AUTOSCALE_DEFAULT_TASK_SECONDS = env.float('AUTOSCALE_DEFAULT_TASK_SECONDS', default=5.0)
+AUTOSCALE_EWMA_ALPHA = env.float('AUTOSCALE_EWMA_ALPHA', default=0.2)
+AUTOSCALE_INTERVAL_SECONDS = env.float('AUTOSCALE_INTERVAL_SECONDS', default=5.0)
+AUTOSCALE_WORKER_NODES = env.int('AUTOSCALE_WORKER_NODES', default=1)
+LLM_RATE_LIMIT_RPM = env.int('LLM_RATE_LIMIT_RPM', default=0)
+
+# Open submissions past started_at + exam duration + grace are finalized by a periodic sweep
+# (run `celery -A main beat`), in batches of SUBMISSION_EXPIRY_BATCH_SIZE rows
+SUBMISSION_EXPIRY_SWEEP_SECONDS = env.int('SUBMISSION_EXPIRY_SWEEP_SECONDS', default=60)
+SUBMISSION_EXPIRY_GRACE_SECONDS = env.int('SUBMISSION_EXPIRY_GRACE_SECONDS', default=60)
+SUBMISSION_EXPIRY_BATCH_SIZE = env.int('SUBMISSION_EXPIRY_BATCH_SIZE', default=1000)
+# Expired submissions that still need grading are enqueued in Celery chunks of this many
+SUBMISSION_EXPIRY_GRADING_CHUNK_SIZE = env.int('SUBMISSION_EXPIRY_GRADING_CHUNK_SIZE', default=50)
+# Completed submissions older than SUBMISSION_ARCHIVE_AFTER_DAYS and soft-deleted submissions are
+# moved to the archive table every SUBMISSION_ARCHIVE_SWEEP_SECONDS
+SUBMISSION_ARCHIVE_AFTER_DAYS = env.int('SUBMISSION_ARCHIVE_AFTER_DAYS', default=180)
+SUBMISSION_ARCHIVE_BATCH_SIZE = env.int('SUBMISSION_ARCHIVE_BATCH_SIZE', default=500)
+SUBMISSION_ARCHIVE_SWEEP_SECONDS = env.int('SUBMISSION_ARCHIVE_SWEEP_SECONDS', default=24 * 60 * 60)
+CELERY_BEAT_SCHEDULE = {
+    'finalize-expired-submissions': {
+        'task': 'assessments.tasks.finalize_expired_submissions',
+        'schedule': SUBMISSION_EXPIRY_SWEEP_SECONDS,
+    },
+    'archive-submissions': {
+        'task': 'assessments.tasks.archive_submissions',
+        'schedule': SUBMISSION_ARCHIVE_SWEEP_SECONDS,
+    },
+}
+